@@ -1,7 +1,12 @@
 """
 The main script to run an AWT file
 
-usage: awt.py [-h] -b {firefox,chrome,edge} [-e] [-i] [-p] filename
+usage: awt.py [-h] -b {firefox,chrome,edge} [-e] [-i] [-p] [-c] [-d DAEMON] [-o]
+              [--poll-ceiling POLL_CEILING] [--implicit-wait IMPLICIT_WAIT] [-k]
+              [--no-pipeline] [--profile [PROFILE]]
+              [--load-profile LOAD_PROFILE] [--checkpoint [CHECKPOINT]]
+              [--checkpoint-interval CHECKPOINT_INTERVAL] [--resume [RESUME]]
+              filename
 
 Executes a script to test websites
 
@@ -18,18 +23,69 @@ optional arguments:
                         is executed
   -p, --pause-mode      Pauses execution before terminating at both end of the
                         script and an unhandled exception
+  -c, --bytecode-cache  Saves compiled Python language blocks and imported
+                        files to a '__awtcache__' directory next to each
+                        script, so later runs do not need to compile them
+                        again
+  -d DAEMON, --daemon DAEMON
+                        Borrows an already started browser from a warm-
+                        browser daemon (see daemon.py) at the given address
+                        (host:port), instead of starting a new browser
+  -o, --observe         Waits for elements with an in-page MutationObserver,
+                        so lookups return as soon as the element appears
+                        instead of on the next poll
+  --poll-ceiling POLL_CEILING
+                        The longest time (in seconds) to wait between two
+                        attempts to find an element (Default=2)
+  --implicit-wait IMPLICIT_WAIT
+                        The time (in seconds) the web driver itself waits
+                        for elements before giving up. Every lookup which
+                        finds nothing blocks for this long, so the default
+                        is 0 (AWT does its own waiting)
+  -k, --element-cache   Caches found elements, so consecutive commands on the
+                        same selector only look it up once. The cache is
+                        cleared on navigation, clicks, window and iframe
+                        switches, and stale elements
+  --no-pipeline         Executes every command on its own. By default,
+                        consecutive SET, GETATTR, COUNT and TEST commands are
+                        executed in a single round trip to the browser
+  --profile [PROFILE]   Records where the time of the script is spent (per
+                        line, command and block call), and writes a sorted
+                        report to the given file (Default=<script
+                        name>.profile.txt) along with a collapsed stack file
+                        (.folded) for flame graph tools
+  --load-profile LOAD_PROFILE
+                        How pages are loaded: 'full' (Default) waits for
+                        every resource, 'eager' only waits for the DOM, and
+                        'dom-only' also blocks images and fonts. May also be
+                        the path to a JSON profile (see load_profiles.py)
+  --checkpoint [CHECKPOINT]
+                        Periodically saves the state of the script
+                        (variables, block calls, and the page's URL, cookies
+                        and localStorage) to the given file
+                        (Default=<script name>.checkpoint), and once more
+                        when it fails. The file is deleted when the script
+                        succeeds
+  --checkpoint-interval CHECKPOINT_INTERVAL
+                        The shortest time (in seconds) between two
+                        checkpoints (Default=30)
+  --resume [RESUME]     Continues the script from the checkpoint in the given
+                        file (Default=the --checkpoint file) in a new browser.
+                        Without a checkpoint, the script starts from the
+                        beginning. Implies --checkpoint
 """
 import argparse
 import logging
-import os
 import datetime
-
+import os
 import sys
 
 import browser
-import commands
-import globals
-from code_block import CodeBlock
+import checkpoints
+import daemon
+import load_profiles
+import writer
+from context import ExecutionContext
 
 # handle command line argument setup
 parser = argparse.ArgumentParser(description='Executes a script to test websites')
@@ -67,6 +123,89 @@ parser.add_argument(
     help="The name of the log file to output to"
 )
 
+parser.add_argument(
+    "-c", "--bytecode-cache",
+    help="Saves compiled Python language blocks and imported files to a '__awtcache__' directory next to each "
+         "script, so later runs do not need to compile them again",
+    action="store_true"
+)
+
+parser.add_argument(
+    "-d", "--daemon",
+    help="Borrows an already started browser from a warm-browser daemon (see daemon.py) at the given address "
+         "(host:port), instead of starting a new browser"
+)
+
+parser.add_argument(
+    "-o", "--observe",
+    help="Waits for elements with an in-page MutationObserver, "
+         "so lookups return as soon as the element appears instead of on the next poll",
+    action="store_true"
+)
+
+parser.add_argument(
+    "--poll-ceiling",
+    help="The longest time (in seconds) to wait between two attempts to find an element (Default=2)",
+    type=float, default=2
+)
+
+parser.add_argument(
+    "--implicit-wait",
+    help="The time (in seconds) the web driver itself waits for elements before giving up. "
+         "Every lookup which finds nothing blocks for this long, so the default is 0 (AWT does its own waiting)",
+    type=float, default=0
+)
+
+parser.add_argument(
+    "-k", "--element-cache",
+    help="Caches found elements, so consecutive commands on the same selector only look it up once. "
+         "The cache is cleared on navigation, clicks, window and iframe switches, and stale elements",
+    action="store_true"
+)
+
+parser.add_argument(
+    "--no-pipeline",
+    help="Executes every command on its own. By default, consecutive SET, GETATTR, COUNT and TEST commands "
+         "are executed in a single round trip to the browser",
+    action="store_true"
+)
+
+parser.add_argument(
+    "--profile",
+    help="Records where the time of the script is spent (per line, command and block call), and writes a sorted "
+         "report to the given file (Default=<script name>.profile.txt) along with a collapsed stack file "
+         "(.folded) for flame graph tools",
+    nargs="?", const=""
+)
+
+parser.add_argument(
+    "--load-profile",
+    help="How pages are loaded: 'full' (Default) waits for every resource, 'eager' only waits for the DOM, and "
+         "'dom-only' also blocks images and fonts. May also be the path to a JSON profile (see load_profiles.py)",
+    default="full"
+)
+
+parser.add_argument(
+    "--checkpoint",
+    help="Periodically saves the state of the script (variables, block calls, and the page's URL, cookies and "
+         "localStorage) to the given file (Default=<script name>.checkpoint), and once more when it fails. "
+         "The file is deleted when the script succeeds",
+    nargs="?", const=""
+)
+
+parser.add_argument(
+    "--checkpoint-interval",
+    help="The shortest time (in seconds) between two checkpoints (Default=30)",
+    type=float, default=30
+)
+
+parser.add_argument(
+    "--resume",
+    help="Continues the script from the checkpoint in the given file (Default=the --checkpoint file) "
+         "in a new browser. Without a checkpoint, the script starts from the beginning. Implies --checkpoint",
+    nargs="?", const=""
+)
+
 parser.add_argument(
     "-a", "--args",
     help="The command line arguments to pass into the script. "
@@ -76,6 +215,23 @@ parser.add_argument(
 
 args = parser.parse_args()
 
+try:
+    load_profile = load_profiles.get_load_profile(args.load_profile)
+except ValueError as e:
+    parser.error(str(e))
+
+# the profile report is named after the script, unless a name is given
+if args.profile == "":
+    args.profile = os.path.splitext(os.path.basename(args.filename))[0] + ".profile.txt"
+
+# resuming keeps saving checkpoints to the same file (named after the script, unless a name is given)
+if args.checkpoint is None and args.resume is not None:
+    args.checkpoint = args.resume
+if args.checkpoint == "":
+    args.checkpoint = os.path.splitext(os.path.basename(args.filename))[0] + ".checkpoint"
+if args.resume == "":
+    args.resume = args.checkpoint
+
 log_handlers = [logging.StreamHandler()]
 
 if args.log_file is not None:
@@ -92,59 +248,62 @@ if args.log_file is not None:
     log_handlers.append(logging.FileHandler(args.log_file))
 
 # setup logging configurations
+# the records are written on a background thread, so slow disks do not delay the script (see writer.py)
+formatter = logging.Formatter('(%(asctime)s) [%(levelname)-8.8s] %(message)s', '%Y-%m-%d %H:%M:%S')
+for handler in log_handlers:
+    handler.setFormatter(formatter)
+
 logging.basicConfig(
-    format='(%(asctime)s) [%(levelname)-8.8s] %(message)s',
     level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=log_handlers
+    handlers=[writer.start_logging(log_handlers)]
 )
 
 if args.log_file is not None:
     logging.info("Mirroring logging messages to '{}'".format(args.log_file))
 
-if args.screenshot is not None:
-    globals.final_screenshot = args.screenshot
-
 logging.info("--------[ {} : {} ]--------".format(args.filename, args.browser))
 
 logging.info("Initializing AWT Interpreter...")
 
-# set global properties
-globals.filename = args.filename
-globals.highlight_mode = args.highlight
-globals.terminate_pause = args.pause_mode
+resume = None
+if args.resume is not None:
+    resume = checkpoints.load_checkpoint(args.resume)
+    if resume is None:
+        logging.info("No checkpoint found in '{}'. Starting from the beginning".format(args.resume))
 
-# set the filename in the memory heap
-globals.args = args
-
-# read the full file which will be executed
-# it is read all at once at the start, so file changes during execution will be ignored
-with open(globals.filename) as f:
-    steps = f.readlines()
-
-# set the application CWD
-globals.cwd = os.path.dirname(os.path.abspath(globals.filename))
+# create the execution context which holds all of the state of this run
+context = ExecutionContext(
+    args.filename,
+    highlight_mode=args.highlight,
+    terminate_pause=args.pause_mode,
+    final_screenshot=False if args.screenshot is None else args.screenshot,
+    bytecode_cache=args.bytecode_cache,
+    script_args=[] if args.args is None else args.args.split(","),
+    poll_ceiling=args.poll_ceiling,
+    observe_mutations=args.observe,
+    implicit_wait=args.implicit_wait,
+    element_cache=args.element_cache,
+    pipeline=not args.no_pipeline,
+    profile=args.profile,
+    load_profile=load_profile,
+    checkpoint=args.checkpoint,
+    checkpoint_interval=args.checkpoint_interval,
+    resume=resume
+)
 
 logging.info("Initializing Web Browser...")
 
-# initialize the web browser
-browser.initialize_browser(args.browser, args.headless)
-
-block = False
-code = ""
-block_type = None
-
-# import the input file
-commands.import_module(globals.filename, None, literal_path=True)
-
-# create a code block from the starting file as the main/starting code block
-main = CodeBlock(os.path.abspath(globals.filename), "[MAIN]", [], steps, 0)
+# initialize the web browser (or borrow one from the daemon)
+if args.daemon is not None:
+    daemon.borrow_browser(context, args.daemon, args.browser, args.headless)
+else:
+    browser.initialize_browser(context, args.browser, args.headless)
 
 logging.info("Initialization Complete. Executing script Commands...")
 
-# execute the main script
-main.execute()
+# import and execute the main script
+context.execute()
 
 # kill the browser
-browser.kill()
+browser.kill(context)
 sys.exit(0)
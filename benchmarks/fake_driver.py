@@ -0,0 +1,315 @@
+"""
+An in-process fake of a Selenium web driver, which serves a static DOM.
+It answers the calls AWT makes (finding elements, reading attributes, and the scripts in browser.py and pipeline.py)
+without a browser, so the benchmarks measure the interpreter itself rather than WebDriver latency.
+Only simple CSS selectors are supported: compound selectors of a tag, an id and classes (ie. div#main.item),
+separated by whitespace (descendants).
+Windows are tracked (window.open, switching and closing), and navigation and scripts go through 'execute' like in a
+real driver, so wrappers of 'execute' (ie. parallel sections, see parallel.py) see them. Every window serves the same
+DOM, which is loaded as soon as it is navigated to
+"""
+import re
+
+import selenium.common.exceptions as selenium_exceptions
+from selenium.webdriver.remote.command import Command
+
+import browser
+import parallel
+import pipeline
+import waits
+
+# a single compound selector (ie. span.item or #main)
+COMPOUND_SELECTOR_PATTERN = re.compile(r"^([a-zA-Z][\w-]*|\*)?(#[\w-]+)?((?:\.[\w-]+)*)$")
+
+
+class FakeElement:
+    def __init__(self, tag, text="", attributes=None, children=()):
+        """
+        A single element of a static DOM
+        :param tag: the tag name of the element
+        :param text: the text directly inside of the element
+        :param attributes: the bindings between attribute names and values
+        :param children: the list of child FakeElements
+        """
+        self.tag_name = tag
+        self.own_text = text
+        self.attributes = {} if attributes is None else attributes
+        self.children = list(children)
+        self.parent = None
+        for c in self.children:
+            c.parent = self
+
+    @property
+    def text(self):
+        return " ".join(t for t in [self.own_text] + [c.text for c in self.children] if t).strip()
+
+    def iter(self):
+        """
+        Yields every descendant of the element in document order
+        """
+        for c in self.children:
+            yield c
+            yield from c.iter()
+
+    def matches(self, compound):
+        """
+        :param compound: the parsed (tag, id, classes) of a compound selector
+        :return: if the element matches the compound selector
+        """
+        tag, element_id, classes = compound
+        if tag is not None and tag != "*" and tag != self.tag_name:
+            return False
+        if element_id is not None and self.attributes.get("id") != element_id:
+            return False
+        return classes <= set(self.attributes.get("class", "").split())
+
+    def get_attribute(self, name):
+        if name in ["innerText", "textContent"]:
+            return self.text
+        if name == "className":
+            name = "class"
+        return self.attributes.get(name)
+
+    def find_elements_by_css_selector(self, selector):
+        return select(self, selector)
+
+    def click(self):
+        pass
+
+    def clear(self):
+        self.attributes["value"] = ""
+
+    def send_keys(self, *keys):
+        self.attributes["value"] = self.attributes.get("value", "") + "".join(keys)
+
+
+def parse_selector(selector):
+    """
+    Parses a CSS selector into the list of (tag, id, classes) of each of its compound selectors
+    """
+    compounds = []
+    for part in selector.split():
+        match = COMPOUND_SELECTOR_PATTERN.match(part)
+        if match is None:
+            raise selenium_exceptions.InvalidSelectorException("Unsupported selector '{}'".format(selector))
+
+        tag, element_id, classes = match.groups()
+        compounds.append((
+            tag, None if element_id is None else element_id[1:], set(c for c in classes.split(".") if c)
+        ))
+
+    if not compounds:
+        raise selenium_exceptions.InvalidSelectorException("Empty selector")
+    return compounds
+
+
+def select(root, selector):
+    """
+    Returns the descendants of an element which match a CSS selector (in document order)
+    """
+    compounds = parse_selector(selector)
+    matches = []
+
+    for element in root.iter():
+        if not element.matches(compounds[-1]):
+            continue
+
+        # match the rest of the compound selectors against the ancestors (from the closest to the furthest)
+        remaining = len(compounds) - 2
+        ancestor = element.parent
+        while remaining >= 0 and ancestor is not None and ancestor is not root.parent:
+            if ancestor.matches(compounds[remaining]):
+                remaining -= 1
+            ancestor = ancestor.parent
+
+        if remaining < 0:
+            matches.append(element)
+
+    return matches
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.execute(Command.SWITCH_TO_WINDOW, {"name": handle})
+
+    def frame(self, element):
+        pass
+
+    def default_content(self):
+        pass
+
+
+class FakeDriver:
+    # ActionChains only needs to know which protocol the driver speaks
+    w3c = False
+
+    def __init__(self, document):
+        """
+        A web driver which serves a static DOM
+        :param document: the root FakeElement of the page (ie. the html element)
+        """
+        self.document = document
+        self.window_handles = ["fake-window"]
+        self.current_window_handle = "fake-window"
+        self.urls = {"fake-window": "about:blank"}     # the bindings between window handles and their URLs
+        self.opened_windows = 0
+        self.switch_to = FakeSwitchTo(self)
+        self.script_calls = 0
+        self.find_calls = 0
+
+        # the DOM never changes, so each selector is only matched once. Otherwise the fake's own (pure Python)
+        # matching would dominate the numbers
+        self.selections = {}
+        self.text_selections = {}
+
+    def execute(self, command, params=None):
+        if command == Command.SWITCH_TO_WINDOW:
+            handle = params.get("handle", params.get("name"))
+            if handle not in self.window_handles:
+                raise selenium_exceptions.NoSuchWindowException("No window '{}'".format(handle))
+            self.current_window_handle = handle
+
+        elif command == Command.CLOSE:
+            self.window_handles.remove(self.current_window_handle)
+            del self.urls[self.current_window_handle]
+
+        elif command == Command.GET:
+            self.navigate(params["url"])
+
+        elif command == Command.EXECUTE_SCRIPT:
+            return {"value": self.run_script(params["script"], params["args"])}
+
+        return {"value": None}
+
+    def navigate(self, url):
+        """
+        Loads a page in the current window
+        """
+        self.urls[self.current_window_handle] = url
+
+    @property
+    def current_url(self):
+        return self.urls[self.current_window_handle]
+
+    def set_page_load_timeout(self, timeout):
+        pass
+
+    def implicitly_wait(self, timeout):
+        pass
+
+    def get(self, url):
+        self.execute(Command.GET, {"url": url})
+
+    def close(self):
+        self.execute(Command.CLOSE)
+
+    def back(self):
+        pass
+
+    def forward(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def select(self, selector):
+        if selector not in self.selections:
+            self.selections[selector] = select(self.document, selector)
+        return self.selections[selector]
+
+    def find_elements_by_css_selector(self, selector):
+        self.find_calls += 1
+        return list(self.select(selector))
+
+    def execute_script(self, script, *args):
+        return self.execute(Command.EXECUTE_SCRIPT, {"script": script, "args": list(args)})["value"]
+
+    def run_script(self, script, args):
+        """
+        Executes one of the scripts AWT sends (see 'execute_script')
+        :return: the result of the script
+        """
+        self.script_calls += 1
+
+        if script == browser.INNER_TEXT_SEARCH_SCRIPT:
+            selector, text, index = args
+            if (selector, text) not in self.text_selections:
+                self.text_selections[(selector, text)] = [
+                    e for e in self.select(selector) if e.text.replace("\u00a0", " ").strip() == text
+                ]
+            matches = self.text_selections[(selector, text)]
+            if index is None:
+                return matches
+            return matches[index:index + 1]
+
+        if script == pipeline.get_run_script():
+            results = []
+            for kind, selector, index, attribute in args[0]:
+                elements = self.select(selector)
+                if kind == "count":
+                    results.append(len(elements))
+                    continue
+                if index >= len(elements):
+                    break
+                results.append(elements[index].get_attribute(attribute) if kind == "attribute" else None)
+            return results
+
+        if script.startswith("window.open("):
+            self.opened_windows += 1
+            handle = "fake-window-{}".format(self.opened_windows)
+            self.window_handles.append(handle)
+            self.urls[handle] = "about:blank"
+            return None
+
+        # navigation in a parallel branch (see 'TabSession.get_in_tab')
+        if script == parallel.NAVIGATE_SCRIPT:
+            self.navigate(args[0])
+            return True
+        if script == parallel.READY_STATE_SCRIPT:
+            return "complete"
+
+        # every other script (ie. highlighting) has no result
+        return None
+
+    def execute_async_script(self, script, *args):
+        if script == waits.MUTATION_WAIT_SCRIPT:
+            # the page never changes, so the wait always times out
+            return None
+        return self.execute_script(script, *args)
+
+    @property
+    def page_source(self):
+        return "<html></html>"
+
+    def save_screenshot(self, filename):
+        return True
+
+    def get_screenshot_as_png(self):
+        return b""
+
+    def quit(self):
+        pass
+
+
+def build_page(items=1000):
+    """
+    Builds the page the benchmarks run against: a heading, and a list of items with ids, classes and text
+    :param items: the number of items in the list
+    :return: the root FakeElement
+    """
+    return FakeElement("html", children=[
+        FakeElement("body", children=[
+            FakeElement("h1", "Benchmark", {"id": "title"}),
+            FakeElement("div", attributes={"id": "main"}, children=[
+                FakeElement("ul", attributes={"class": "items"}, children=[
+                    FakeElement("li", attributes={"class": "item" + (" odd" if i % 2 else "")}, children=[
+                        FakeElement("span", "Item {}".format(i), {"id": "item{}".format(i), "data-index": str(i)})
+                    ])
+                    for i in range(items)
+                ])
+            ])
+        ])
+    ])
@@ -0,0 +1,59 @@
+"""
+Benchmarks the cost of inputting variables into a line as the memory heap grows
+
+usage: python benchmarks/substitution.py [-n ITERATIONS]
+
+The legacy approach (replacing every key in the memory heap on every line) grows linearly with the heap size.
+Compiled templates only look up the variables a line references, so their cost should stay flat.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instructions import compile_template
+
+LINE = 'LOG "Welcome, ${firstName} ${lastName}"'
+HEAP_SIZES = [50, 500, 5000, 50000]
+
+
+def legacy_substitution(s, variables):
+    """
+    The substitution which was done on each line before templates were compiled
+    """
+    for key, val in variables.items():
+        s = s.replace("${" + str(key) + "}", str(val))
+    return s
+
+
+def build_heap(size):
+    heap = {"var{}".format(i): i for i in range(size)}
+    heap["firstName"] = "Bilbo"
+    heap["lastName"] = "Baggins"
+    return heap
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks variable substitution against the memory heap size')
+    parser.add_argument("-n", "--iterations", help="The number of substitutions per measurement", type=int, default=200)
+    args = parser.parse_args()
+
+    template = compile_template(LINE)
+
+    print("{:>10} {:>16} {:>18}".format("heap size", "legacy (us/line)", "template (us/line)"))
+    for size in HEAP_SIZES:
+        heap = build_heap(size)
+        assert legacy_substitution(LINE, heap) == template.render(heap)
+
+        legacy = timeit.timeit(lambda: legacy_substitution(LINE, heap), number=args.iterations)
+        compiled = timeit.timeit(lambda: template.render(heap), number=args.iterations)
+
+        print("{:>10} {:>16.3f} {:>18.3f}".format(
+            size, legacy / args.iterations * 1e6, compiled / args.iterations * 1e6
+        ))
+
+
+if __name__ == '__main__':
+    main()
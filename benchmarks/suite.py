@@ -0,0 +1,247 @@
+"""
+Benchmarks the interpreter against an in-process fake web driver (see fake_driver.py)
+
+usage: python benchmarks/suite.py [-r REPEAT] [-s SCALE] [-j OUTPUT] [-b BASELINE] [benchmarks ...]
+
+Each benchmark writes a script (and the files it imports) to a temporary directory, and executes it in a new
+ExecutionContext. No browser is involved, so the numbers only measure the interpreter, and are comparable across
+commits: save the results of one commit with -j, and compare another commit against them with -b.
+The fastest of the repeated runs is reported, as it is the least affected by other processes.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import browser
+import modules
+from context import ExecutionContext
+from fake_driver import FakeDriver, build_page
+
+# the number of list items on the benchmark page
+PAGE_ITEMS = 1000
+
+
+def loop_script(n):
+    """
+    A tight POINT/SKIPTO loop
+    """
+    return {"main.awt": [
+        "SETVAR i 0",
+        "POINT Top",
+        "CHANGE i 1",
+        'SWITCH "i < {}" SKIPTO Top'.format(n)
+    ]}, n
+
+
+def substitution_script(n):
+    """
+    Lines which input many variables
+    """
+    return {"main.awt": [
+        "SETVAR i 0",
+        "SETVAR first Bilbo",
+        "SETVAR last Baggins",
+        "SETVAR home Bag-End",
+        "POINT Top",
+        'SETVAR greeting "${first} ${last} of ${home} (${i}), ${first} ${last} of ${home} (${i})"',
+        'SETVAR copy "${greeting} ${greeting}"',
+        "CHANGE i 1",
+        'SWITCH "i < {}" SKIPTO Top'.format(n)
+    ]}, n
+
+
+def block_call_script(n, depth=25):
+    """
+    Calls through a deep chain of code blocks
+    """
+    lines = []
+    for d in range(depth):
+        lines += ["BLOCK Level{} value".format(d)]
+        lines += ["Level{} ${{value}}".format(d + 1) if d + 1 < depth else "SETVAR last ${value}"]
+        lines += ["ENDBLOCK"]
+
+    lines += [
+        "SETVAR i 0",
+        "POINT Top",
+        "Level0 ${i}",
+        "CHANGE i 1",
+        'SWITCH "i < {}" SKIPTO Top'.format(n)
+    ]
+    return {"main.awt": lines}, n * depth
+
+
+def import_script(n, blocks=10):
+    """
+    Imports many helper files
+    """
+    files = {}
+    for m in range(n):
+        files["helper{}.awh".format(m)] = sum([[
+            "BLOCK Helper{}x{} value".format(m, b),
+            'SETVAR result "${value}"',
+            "ENDBLOCK",
+            ""
+        ] for b in range(blocks)], [])
+
+    files["main.awt"] = ["IMPORT helper{0}.awh H{0}".format(m) for m in range(n)] + ["H0.Helper0x0 done"]
+    return files, n
+
+
+def text_search_script(n):
+    """
+    Inner text searches (selector%text) across the whole list
+    """
+    return {"main.awt": [
+        "SETVAR i 0",
+        "POINT Top",
+        'TEST "span%Item {}"'.format(PAGE_ITEMS - 1),
+        "CHANGE i 1",
+        'SWITCH "i < {}" SKIPTO Top'.format(n)
+    ]}, n
+
+
+def read_only_script(n):
+    """
+    Runs of read-only commands (which are pipelined)
+    """
+    return {"main.awt": [
+        "SETVAR i 0",
+        "POINT Top",
+        "SET title h1",
+        "GETATTR #item10 0 data-index",
+        "COUNT li.odd odd",
+        "TEST #main",
+        "SET first span",
+        "CHANGE i 1",
+        'SWITCH "i < {}" SKIPTO Top'.format(n)
+    ]}, n * 5
+
+
+# the bindings between benchmark names and (script builder, size, if the module registry is cleared before each run)
+# each builder returns the files to write, and the number of operations the script executes
+BENCHMARKS = {
+    "loop": (loop_script, 20000, False),
+    "substitution": (substitution_script, 5000, False),
+    "block_calls": (block_call_script, 400, False),
+    "imports_cold": (import_script, 100, True),
+    "imports_warm": (import_script, 100, False),
+    "text_search": (text_search_script, 200, False),
+    "read_only": (read_only_script, 2000, False),
+}
+
+
+def write_files(directory, files):
+    for name, lines in files.items():
+        with open(os.path.join(directory, name), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def run_once(path, page):
+    """
+    Executes a script once
+    :param path: the path to the script
+    :param page: the FakeElement the fake driver serves
+    :return: the time it took (in seconds)
+    """
+    context = ExecutionContext(path)
+    browser.attach_driver(context, FakeDriver(page))
+
+    start = time.perf_counter()
+    context.execute()
+    return time.perf_counter() - start
+
+
+def run_benchmark(name, repeat, scale, page):
+    """
+    Runs a single benchmark
+    :param name: the name of the benchmark (see BENCHMARKS)
+    :param repeat: the number of times to execute the script
+    :param scale: the factor to multiply the size of the benchmark by
+    :param page: the FakeElement the fake driver serves
+    :return: the result of the benchmark (the fastest run, the median run, and the number of operations)
+    """
+    builder, size, cold = BENCHMARKS[name]
+    files, operations = builder(max(int(size * scale), 1))
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_files(directory, files)
+        path = os.path.join(directory, "main.awt")
+
+        times = []
+        for _ in range(repeat):
+            if cold:
+                modules._modules.clear()
+            times.append(run_once(path, page))
+
+    times.sort()
+    return {
+        "best": times[0],
+        "median": times[len(times) // 2],
+        "operations": operations,
+        "us_per_operation": times[0] / operations * 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the interpreter against a fake web driver')
+    parser.add_argument(
+        "benchmarks", nargs="*", help="The benchmarks to run (Default=all). One of: " + ", ".join(BENCHMARKS.keys())
+    )
+    parser.add_argument("-r", "--repeat", help="The number of runs of each benchmark", type=int, default=5)
+    parser.add_argument(
+        "-s", "--scale", help="The factor to multiply the size of each benchmark by (Default=1)", type=float, default=1
+    )
+    parser.add_argument("-j", "--output", help="The name of a JSON file to write the results to")
+    parser.add_argument("-b", "--baseline", help="The name of a JSON file of earlier results to compare against")
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark '{}'".format(name))
+
+    # the scripts do not log anything, but the interpreter's own messages would distort the numbers
+    logging.basicConfig(level=logging.ERROR)
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    page = build_page(PAGE_ITEMS)
+    results = {}
+
+    print("{:<14} {:>10} {:>10} {:>12} {:>10}".format("benchmark", "best (s)", "median (s)", "us/op", "change"))
+    for name in args.benchmarks or BENCHMARKS.keys():
+        result = run_benchmark(name, args.repeat, args.scale, page)
+        results[name] = result
+
+        change = ""
+        if name in baseline:
+            change = "{:+.1f}%".format(
+                (result["us_per_operation"] / baseline[name]["us_per_operation"] - 1) * 100
+            )
+
+        print("{:<14} {:>10.4f} {:>10.4f} {:>12.2f} {:>10}".format(
+            name, result["best"], result["median"], result["us_per_operation"], change
+        ))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "scale": args.scale,
+                "results": results
+            }, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmarks the latency of an inner text search (selector%text) as the number of elements matching the selector grows
+
+usage: python benchmarks/text_search.py -b {firefox,chrome,edge,ie,opera} [-e] [-r REPEAT]
+
+Each measurement runs against a local test page with N spans, where only the last span has the searched text.
+The legacy approach reads the text of every matching element (one WebDriver round trip per element),
+while the in-page search filters the elements inside of the browser with a single script call.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import browser
+from context import ExecutionContext
+
+ELEMENT_COUNTS = [10, 100, 500, 2000]
+TEXT = "Add to Cart"
+
+
+def legacy_search(context, selector, text, index=0):
+    """
+    The inner text search which was done before the filtering was moved into the browser
+    """
+    matches = 0
+    for e in context.driver.find_elements_by_css_selector(selector):
+        if e.text == text:
+            if matches == index:
+                return e
+            matches += 1
+
+
+def in_page_search(context, selector, text, index=0):
+    return browser.locate_element(context, "{}%{}".format(selector, text), index)
+
+
+def write_page(directory, count):
+    """
+    Writes a test page with 'count' spans. Only the last span has the searched text
+    :return: the URL of the page
+    """
+    path = os.path.join(directory, "spans{}.html".format(count))
+    with open(path, "w") as f:
+        f.write("<html><body>")
+        for i in range(count - 1):
+            f.write("<span>Item {}</span>".format(i))
+        f.write("<span>{}</span>".format(TEXT))
+        f.write("</body></html>")
+    return "file:///" + path.replace(os.sep, "/").lstrip("/")
+
+
+def measure(function, context, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        assert function(context, "span", TEXT) is not None
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks inner text searches against the number of elements')
+    parser.add_argument(
+        "-b", "--browser", help="The web browser to benchmark in", choices=browser.BROWSERS.keys(), required=True
+    )
+    parser.add_argument("-e", "--headless", help="Runs the browser in headless mode", action="store_true")
+    parser.add_argument("-r", "--repeat", help="The number of searches per measurement", type=int, default=5)
+    args = parser.parse_args()
+
+    context = ExecutionContext(__file__)
+    browser.initialize_browser(context, args.browser, args.headless)
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            print("{:>10} {:>14} {:>14}".format("elements", "legacy (ms)", "in-page (ms)"))
+            for count in ELEMENT_COUNTS:
+                context.driver.get(write_page(directory, count))
+
+                print("{:>10} {:>14.1f} {:>14.1f}".format(
+                    count, measure(legacy_search, context, args.repeat), measure(in_page_search, context, args.repeat)
+                ))
+    finally:
+        context.driver.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,158 @@
-import globals
 import interpreter
 import os
+import functools
+import hashlib
+import importlib.util
+import logging
+import marshal
+import threading
 
-args = globals.args.args
-if args is None:
-    args = []
-else:
-    args = args.split(",")
-
-# initialize the memory heap with a binding to interpret a function
-# add each command in the interpreter to the heap as well (with lowercase names)
-# these items are added to allow Python blocks to access these functions as if they were built in
-globals.memory_heap = {
-    "interpret": interpreter.interpret_command,
-    **{k.lower(): v for k, v in interpreter.INTERPRETER.items()},
-    "filename": os.path.basename(globals.filename),
-    "scriptName": os.path.basename(globals.filename),
-    "args": args
-}
+
+def create_memory_heap(context):
+    """
+    Creates the initial memory heap of an execution context
+    :param context: the ExecutionContext the heap belongs to
+    :return: the memory heap
+    """
+
+    # initialize the memory heap with a binding to interpret a function
+    # add each command in the interpreter to the heap as well (with lowercase names)
+    # these items are added to allow Python blocks to access these functions as if they were built in
+    # (each function is bound to the context, so Python blocks do not need to pass it in)
+    return {
+        "interpret": functools.partial(interpreter.interpret_command, context),
+        **{k.lower(): functools.partial(v, context) for k, v in interpreter.INTERPRETER.items()},
+        "filename": os.path.basename(context.filename),
+        "scriptName": os.path.basename(context.filename),
+        "args": context.script_args
+    }
+
+
+# the name of the directory (next to each script) which compiled language blocks are saved to
+CACHE_DIRECTORY = "__awtcache__"
+
+# the bindings between (filename, line, source hash) and compiled Python language blocks
+_bytecode_cache = {}
+
+# the files whose saved bytecode cache has already been loaded
+_loaded_cache_files = set()
+
+# the bytecode cache is shared by every execution context in the process
+_cache_lock = threading.Lock()
 
 
-def execute_block(block_type, code):
+def execute_block(context, block_type, code, filename="<LANGBLOCK>", line=1, cache=True):
     """
     Executes a language block -> enclosed in [start (language)] and [end (language)]
+    :param context: the ExecutionContext to execute the block in
     :param block_type: the language to execute the code as
     :param code: the code to execute
+    :param filename: the file the block was read from (used for tracebacks)
+    :param line: the line of the file the code starts on (used for tracebacks)
+    :param cache: if the compiled code may be cached (Default=True)
     """
-    BLOCKS[block_type.lower()](code)
+    # the code may read a file the script has just written (ie. with EXTRACT)
+    context.artifacts.flush()
+    BLOCKS[block_type.lower()](context, code, filename, line, cache)
 
 
-def python_interpreter(code):
+def python_interpreter(context, code, filename="<LANGBLOCK>", line=1, cache=True):
     """
-    Interprets Python code with the global memory heap
+    Interprets Python code with the context's memory heap
+    :param context: the ExecutionContext to execute the code in
     :param code: the code to execute
+    :param filename: the file the code was read from (used for tracebacks)
+    :param line: the line of the file the code starts on (used for tracebacks)
+    :param cache: if the compiled code may be cached (Default=True)
+    """
+    if not cache:
+        exec(compile_python(code, filename, line), context.memory_heap)
+        return
+
+    key = (filename, line, hashlib.sha1(code.encode("utf8")).hexdigest())
+
+    with _cache_lock:
+        if context.bytecode_cache and filename not in _loaded_cache_files:
+            load_bytecode_cache(filename)
+
+        if key not in _bytecode_cache:
+            _bytecode_cache[key] = compile_python(code, filename, line)
+
+            if context.bytecode_cache:
+                save_bytecode_cache(filename)
+
+        compiled = _bytecode_cache[key]
+
+    exec(compiled, context.memory_heap)
+
+
+def compile_python(code, filename, line):
+    """
+    Compiles Python code so tracebacks report the file and line it was read from
+    :param code: the code to compile
+    :param filename: the file the code was read from
+    :param line: the line of the file the code starts on
+    :return: the compiled code object
     """
-    exec(code, globals.memory_heap)
+    # the code is padded (rather than its line numbers moved after parsing), so syntax errors report the right line
+    return compile("\n" * (line - 1) + code, filename, "exec")
+
+
+def get_cache_path(filename):
+    """
+    Returns the path of the saved bytecode cache for a script
+    :param filename: the path to the script
+    """
+    return os.path.join(
+        os.path.dirname(filename), CACHE_DIRECTORY, os.path.basename(filename) + ".langblocks"
+    )
+
+
+def load_bytecode_cache(filename):
+    """
+    Loads the saved bytecode cache of a script into memory (if one exists, and was written by this Python version)
+    :param filename: the path to the script
+    """
+    _loaded_cache_files.add(filename)
+    path = get_cache_path(filename)
+
+    if not os.path.isfile(path):
+        return
+
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(importlib.util.MAGIC_NUMBER)) != importlib.util.MAGIC_NUMBER:
+                return
+            saved = marshal.load(f)
+
+    except (OSError, EOFError, ValueError, TypeError):
+        logging.warning("Ignoring unreadable bytecode cache '{}'".format(path))
+        return
+
+    for (line, digest), code in saved.items():
+        _bytecode_cache.setdefault((filename, line, digest), code)
+
+
+def save_bytecode_cache(filename):
+    """
+    Saves all compiled language blocks of a script to its bytecode cache
+    :param filename: the path to the script
+    """
+    path = get_cache_path(filename)
+    saved = {(line, digest): code for (f, line, digest), code in _bytecode_cache.items() if f == filename}
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first, so a concurrent run never reads a partially written cache
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(importlib.util.MAGIC_NUMBER)
+            marshal.dump(saved, f)
+        os.replace(temp_path, path)
+
+    except OSError:
+        logging.warning("Could not write bytecode cache '{}'".format(path))
 
 
 # the bindings between the language execution function, and the name of the language
@@ -5,13 +5,14 @@ from selenium.webdriver.firefox.options import Options
 from selenium.webdriver import ActionChains
 import os
 
-import globals
 import logging
 import sys
 import commands
 import time
-
-driver = None  # type:webdriver.Firefox
+import urllib.parse
+import load_profiles
+import waits
+import writer
 
 # define the Selenium browser configuration options
 # each browser needs to be instantiated differently, so this dictionary allows this to happen
@@ -36,13 +37,104 @@ BROWSERS = {
 }
 
 
-def initialize_browser(browser: str, headless: bool = False):
+# finds the elements matching a CSS selector (arguments[0]) whose text is arguments[1]
+# if arguments[2] is null, all matches are returned. Otherwise, only the arguments[2]th match is returned (if it exists)
+# the text is normalized the same way Selenium normalizes an element's text (no-break spaces and surrounding whitespace)
+INNER_TEXT_SEARCH_SCRIPT = """
+var elements = document.querySelectorAll(arguments[0]);
+var matches = [];
+for (var i = 0; i < elements.length; i++) {
+    var text = elements[i].innerText;
+    if (text === undefined) {
+        text = elements[i].textContent;
+    }
+    if (text.replace(/\\u00a0/g, " ").trim() === arguments[1]) {
+        if (arguments[2] !== null && matches.length === arguments[2]) {
+            return [elements[i]];
+        }
+        matches.push(elements[i]);
+    }
+}
+return arguments[2] === null ? matches : [];
+"""
+
+
+# sets the border of each element in arguments[0] to arguments[1], saving the original style attribute first
+# if arguments[2] is true, the elements which were highlighted by the previous transient call are restored first
+HIGHLIGHT_SCRIPT = """
+var elements = arguments[0];
+var transient = arguments[2];
+
+function restore(element) {
+    if (!("__awtStyle" in element) || element.__awtPersistent) {
+        return;
+    }
+    if (element.__awtStyle === null) {
+        element.removeAttribute("style");
+    } else {
+        element.setAttribute("style", element.__awtStyle);
+    }
+    delete element.__awtStyle;
+}
+
+if (transient) {
+    (window.__awtHighlighted || []).forEach(restore);
+    window.__awtHighlighted = [];
+}
+
+for (var i = 0; i < elements.length; i++) {
+    if (!("__awtStyle" in elements[i])) {
+        elements[i].__awtStyle = elements[i].getAttribute("style");
+    }
+    elements[i].style.border = arguments[1];
+
+    if (transient) {
+        window.__awtHighlighted.push(elements[i]);
+    } else {
+        elements[i].__awtPersistent = true;
+    }
+}
+"""
+
+
+# returns the HTML of arguments[0] (or of the whole page if arguments[0] is null) without scripts and styles
+# a copy is stripped, so the page itself is not changed
+STRIPPED_HTML_SCRIPT = """
+var root = arguments[0] === null ? document.documentElement : arguments[0];
+var copy = root.cloneNode(true);
+var removed = copy.querySelectorAll("script, style, noscript, template, link[rel=stylesheet]");
+for (var i = 0; i < removed.length; i++) {
+    removed[i].parentNode.removeChild(removed[i]);
+}
+return arguments[0] === null ? copy.outerHTML : copy.innerHTML;
+"""
+
+
+def initialize_browser(context, browser: str, headless: bool = False):
     """
     Initializes the specified web browser with options
+    :param context: the ExecutionContext the browser belongs to
     :param browser: the name of the browser to use (case insensitive) (ie. Firefox, Chrome...)
     :param headless: if the browser should be run in headless mode. WARNING: Experamental
     """
-    global driver
+    # remembered, so sessions for data rows can be started the same way (see rows.py)
+    context.browser_name = browser
+    context.headless = headless
+    attach_driver(context, create_driver(browser, headless, context.load_profile))
+
+
+def create_driver(browser: str, headless: bool = False, load_profile=None):
+    """
+    Starts a new instance of the specified web browser with options
+    :param browser: the name of the browser to use (case insensitive) (ie. Firefox, Chrome...)
+    :param headless: if the browser should be run in headless mode. WARNING: Experamental
+    :param load_profile: the LoadProfile which decides how pages are loaded (see load_profiles.py).
+    Default=None (the 'full' profile)
+    :return: the Selenium web driver
+    """
+    if load_profile is None:
+        load_profile = load_profiles.LOAD_PROFILES["full"]
+
     browser_data = BROWSERS[browser.lower()]
 
     # create the specific browser options (if necessary)
@@ -51,6 +143,9 @@ def initialize_browser(browser: str, headless: bool = False):
         options = browser_data["options"]()
         options.headless = headless
 
+    # the page load strategy and resource preferences can only be set before the browser starts
+    load_profiles.configure_options(browser, options, load_profile)
+
     # access the driver's path if specified
     driver_path = None
     if "driver" in browser_data:
@@ -58,55 +153,144 @@ def initialize_browser(browser: str, headless: bool = False):
         driver_path = os.path.join(os.path.dirname(__file__), driver_path)
 
     # instantiate the browser with necessary configurations
-    os.environ['PATH'] += ";" + os.path.join(os.path.dirname(__file__), "webDrivers")
-    if driver_path is None:
-        driver = browser_data["class"]()
-    elif options is None:
-        driver = browser_data["class"](driver_path)
-    else:
-        driver = browser_data["class"](driver_path, options=options)
+    drivers_dir = os.path.join(os.path.dirname(__file__), "webDrivers")
+    if drivers_dir not in os.environ['PATH']:
+        os.environ['PATH'] += ";" + drivers_dir
 
-    # set the implicit wait time (maximum time to wait before giving up on finding elements)
-    # and create the global action chain
-    driver.set_page_load_timeout(10)
-    driver.implicitly_wait(10)
-    globals.action_chain = ActionChains(driver)
+    # the options (headless mode and the load profile) must reach the driver whether or not a driver path is set
+    arguments = {}
+    if options is not None:
+        arguments["options"] = options
+    if driver_path is not None:
+        arguments["executable_path"] = driver_path
 
-    globals.original_window = driver.window_handles[0]
+    return browser_data["class"](**arguments)
 
 
-def get_element_selector(selector: str, index=0, raise_exception_on_failure=False, get_mode=False):
+def attach_driver(context, driver, lease=None):
+    """
+    Configures a web driver, and makes it the browser of an execution context
+    :param context: the ExecutionContext the browser belongs to
+    :param driver: the Selenium web driver
+    :param lease: the lease the driver was borrowed with (see daemon.py). Leased drivers are returned instead of
+    closed when execution ends
+    """
+
+    # set the implicit wait time (maximum time the driver itself waits before giving up on finding elements)
+    # and create the action chain
+    # by default this is 0, so lookups never block inside the driver, and the caller chooses how long to wait
+    # (see 'get_element_selector')
+    driver.set_page_load_timeout(context.load_profile.timeout)
+    driver.implicitly_wait(context.implicit_wait)
+
+    # block the URLs of the load profile (and of any BLOCKURLS command)
+    # the daemon already blocks the URLs of the load profile of the browsers it lends out
+    blocked_urls = list(context.blocked_urls)
+    if lease is None:
+        blocked_urls = load_profiles.get_blocked_urls(context.browser_name, context.load_profile) + blocked_urls
+    if blocked_urls and not load_profiles.block_urls(driver, blocked_urls):
+        logging.warning("Blocking URLs is not supported by this browser. All URLs will be loaded")
+
+    # time every call to the browser (if the script is being profiled)
+    if context.profiler is not None:
+        context.profiler.instrument(driver)
+
+    context.driver = driver
+    context.driver_lease = lease
+    context.action_chain = ActionChains(driver)
+    context.original_window = driver.window_handles[0]
+    context.current_window = context.original_window
+    context.iframe_path = ()
+    context.element_cache.clear()
+
+
+def get_element_selector(
+        context, selector: str, index=0, raise_exception_on_failure=False, get_mode=False, timeout=None,
+        use_cache=True
+):
     """
     Returns the element described by the parameters with the dynamic timeout
+    :param context: the ExecutionContext to search the browser of
     :param selector: The CSS selector
     (use <selector>%<text> to search all elements that match "selector" with the inner text of "text")
     :param index: if multiple selectors exist, which selector to return (default=0)
     :param raise_exception_on_failure: the Python exception to raise if the element could not be found
     (default=False - raise AWT SelectorNotFoundException)
     :param get_mode: if all matching elements should be returned (ignore index param) (Default=False)
+    :param timeout: the maximum time (in seconds) to wait for the element to appear (Default=context.maximum_delay).
+    Use 0 to check for the element exactly once (ie. when checking that an element is absent)
+    :param use_cache: if a previously resolved element may be returned (see element_cache.py).
+    Commands which only check that an element exists should pass False, as they never touch the element
+    (which is how a stale element is detected). The element they find is still cached (Default=True)
     :return: matching Selenium element(s)
     """
+
+    # only single, positive lookups are cached. Inner text searches depend on the text of the element, and lookups
+    # which expect to fail (ie. ANTITEST) need to check the current page
+    key = None
+    if context.element_cache.enabled and not get_mode and raise_exception_on_failure is False and "%" not in selector:
+        key = (selector, int(index), context.iframe_path, context.current_window)
+
+        if use_cache:
+            element = context.element_cache.get(key)
+            if element is not None:
+                if context.highlight_mode:
+                    highlight_elements(context, [element])
+                return element
+
+    element = wait_for_element(context, selector, index, raise_exception_on_failure, get_mode, timeout)
+
+    if key is not None:
+        context.element_cache.put(key, element)
+
+    return element
+
+
+def wait_for_element(context, selector: str, index=0, raise_exception_on_failure=False, get_mode=False, timeout=None):
+    """
+    Returns the element described by the parameters, waiting for it to appear
+    NOTE: call 'get_element_selector', not this funciton!
+    (see 'get_element_selector' for the parameters)
+    """
+    if timeout is None:
+        timeout = context.maximum_delay
+
+    # each lookup starts with the shortest delay, which doubles after each failed attempt (up to the poll ceiling)
     start = time.time()
-    while True:
-        try:
-            return locate_element(selector, index, RecursionError, get_mode)
-        except RecursionError:
-            if time.time() - start > globals.maximum_delay:
-                if raise_exception_on_failure is False:
-                    raise_error(
-                        "SelectorNotFoundException",
-                        "Could not find {}th occurrence of selector {}".format(index, selector)
-                    )
-                else:
-                    raise raise_exception_on_failure
-            time.sleep(globals.current_delay)
-            globals.current_delay *= 2
-
-
-def locate_element(selector: str, index=0, raise_exception_on_failure=False, get_mode=False):
+    delay = context.poll_interval
+    retries = 0
+    waited = 0
+
+    try:
+        while True:
+            try:
+                return locate_element(context, selector, index, RecursionError, get_mode)
+            except RecursionError:
+                remaining = timeout - (time.time() - start)
+                if remaining <= 0:
+                    if raise_exception_on_failure is False:
+                        raise_error(
+                            context, "SelectorNotFoundException",
+                            "Could not find {}th occurrence of selector {}".format(index, selector)
+                        )
+                    else:
+                        raise raise_exception_on_failure
+
+                wait_start = time.time()
+                waits.wait_for_change(context, selector, min(delay, remaining))
+                waited += time.time() - wait_start
+                retries += 1
+                delay = min(delay * 2, context.poll_ceiling)
+
+    finally:
+        context.wait_metrics.record(context.command_name, retries, waited)
+
+
+def locate_element(context, selector: str, index=0, raise_exception_on_failure=False, get_mode=False):
     """
     Returns the element described by the parameters
     NOTE: call 'get_element_selector', not this funciton!
+    :param context: the ExecutionContext to search the browser of
     :param selector: The CSS selector
     (use <selector>%<text> to search all elements that match "selector" with the inner text of "text")
     :param index: if multiple selectors exist, which selector to return (default=0)
@@ -132,7 +316,7 @@ def locate_element(selector: str, index=0, raise_exception_on_failure=False, get
         # raise an error if no selector has been specified
         if element == "":
             raise_error(
-                "InvalidSelectorException", "A selector must precede the % (Search by tag text) selector ({})".format(
+                context, "InvalidSelectorException", "A selector must precede the % (Search by tag text) selector ({})".format(
                     selector
                 )
             )
@@ -141,40 +325,34 @@ def locate_element(selector: str, index=0, raise_exception_on_failure=False, get
         # if not in text search mode, copy the selector string by value
         element = selector[:]
 
+    # the position of the requested element in the list of elements returned by the browser
+    position = index
+
     try:
-        # get all elements with the specified CSS selector
-        elements = driver.find_elements_by_css_selector(element)
+        if inner_text_search:
+            # if an inner text search is done, the tags which do not match the specified inner text are filtered out
+            # inside of the browser, so only the matching element(s) are sent back in a single round trip
+            elements = context.driver.execute_script(
+                INNER_TEXT_SEARCH_SCRIPT, element, text, None if get_mode else index
+            )
+            position = 0
 
-    except selenium_exceptions.InvalidSelectorException:
+        else:
+            # get all elements with the specified CSS selector
+            elements = context.driver.find_elements_by_css_selector(element)
+
+    except (selenium_exceptions.InvalidSelectorException, selenium_exceptions.JavascriptException):
         # wrapper Invalid Selector exception
         raise_error(
-            "InvalidSelectorException", "The provided selector ({}) is invalid.".format(
+            context, "InvalidSelectorException", "The provided selector ({}) is invalid.".format(
                 selector
             )
         )
 
-    inner_text_index = 0
-    if inner_text_search:
-        # if an inner text search is done, filter out all of the tags which do not match the specified inner text
-        # a second array is used as you can not modify the size of an array as you are iterating through it
-        matches = []
-        for e in elements:
-            if e.text == text:
-                if not get_mode:
-                    if inner_text_index == index:
-                        if globals.highlight_mode:
-                            highlight_element(e)
-                        return e
-                    
-                inner_text_index += 1
-                matches.append(e)
-        elements = matches
-
     if get_mode:
         # if get mode is enabled, highlight all matches (if running in highlight mode)
-        if globals.highlight_mode:
-            for e in elements:
-                highlight_element(e)
+        if context.highlight_mode:
+            highlight_elements(context, elements)
 
         # and return all elements
         return elements
@@ -182,17 +360,18 @@ def locate_element(selector: str, index=0, raise_exception_on_failure=False, get
     else:
         try:
             # if we return a single item (get mode disabled), highlight the match (if running in highlight mode)
-            if globals.highlight_mode:
-                highlight_element(elements[index])
+            if context.highlight_mode:
+                highlight_elements(context, [elements[position]])
 
             # and return the match
-            return elements[index]
+            return elements[position]
 
         except IndexError:
             # if no matches exist, raise the proper error
             if raise_exception_on_failure is False:
                 raise_error(
-                    "SelectorNotFoundException", "Could not find {}th occurrence of selector {}".format(index, selector)
+                    context, "SelectorNotFoundException",
+                    "Could not find {}th occurrence of selector {}".format(index, selector)
                 )
             else:
                 raise raise_exception_on_failure
@@ -203,9 +382,10 @@ SOME of the functions which are bound to commands are below this comment. See co
 """
 
 
-def highlight_element(selector, index=0, color="red", border=2):
+def highlight_element(context, selector, index=0, color="red", border=2):
     """
     Sets the element's border to a 2px solid red border
+    :param context: the ExecutionContext to highlight the element in
     :param selector: the item to highlight (either Selenium element, or string CSS selector)
     :param index: the index of the item to highlight
     :param color: the color of the border (Default=red)
@@ -214,53 +394,107 @@ def highlight_element(selector, index=0, color="red", border=2):
 
     # get the element if the selector is a CSS selector
     if type(selector) is str:
-        selector = get_element_selector(selector, int(index))
+        selector = get_element_selector(context, selector, int(index))
+
+    highlight_elements(context, [selector], color, border, transient=False)
+
 
-    # apply the style to the element
-    driver.execute_script(
-        "arguments[0].setAttribute('style', arguments[1]);",
-        selector,
-        "border: {0}px solid {1};".format(border, color)
+def highlight_elements(context, elements, color="red", border=2, transient=True):
+    """
+    Sets the border of many elements in a single script call. The original style of each element is saved
+    :param context: the ExecutionContext to highlight the elements in
+    :param elements: the list of Selenium elements to highlight
+    :param color: the color of the border (Default=red)
+    :param border: the line thickness of the border in px (Default=2)
+    :param transient: if the highlight should be removed (restoring the original style) the next time transient
+    elements are highlighted. This is used by highlight mode, so only the latest selection stays highlighted
+    (Default=True)
+    """
+    if not elements:
+        return
+
+    context.driver.execute_script(
+        HIGHLIGHT_SCRIPT, elements, "{0}px solid {1}".format(border, color), transient
     )
 
 
-def kill(status=0):
+def kill(context, status=0):
     """
     Kills execution of the script
+    :param context: the ExecutionContext to terminate
+    :param status: the exit code
     """
-    if globals.final_screenshot is not False:
-        commands.screenshot(globals.final_screenshot)
+    status = int(status)
+
+    if context.final_screenshot is not False:
+        commands.screenshot(context, context.final_screenshot)
 
     # if pause mode is enabled, pause execution
-    if globals.terminate_pause:
-        commands.pause()
+    if context.terminate_pause:
+        commands.pause(context)
+
+    context.wait_metrics.report()
+    context.element_cache.report()
+    if context.profiler is not None:
+        context.profiler.save()
+
+    # wait for the screenshots and extracted HTML to be written
+    context.artifacts.flush()
+
+    # save (or, after a success, delete) the checkpoint while the browser is still open
+    if context.checkpoints is not None:
+        context.checkpoints.finish(context, status)
 
-    # close the driver and quit the application
-    driver.quit()
+    # close the driver (or return it to the daemon it was borrowed from) and quit the application
+    close_driver(context)
 
     commands.log(
-        "--------[ Finished in {}s with exit code {} ]--------".format(
-            round(time.time() - globals.start_time, 2), status
+        context, "--------[ Finished in {}s with exit code {} ]--------".format(
+            round(time.time() - context.start_time, 2), status
         ),
         "info" if status == 0 else "error"
     )
+    writer.flush_logging()
 
     sys.exit(status)
 
 
-def raise_error(error_type, message):
+def get_origin(url):
+    """
+    :return: the origin of a URL (ie. 'https://example.com:8080'), or None if the URL has no origin (ie. about:blank)
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ["http", "https"] or not parts.netloc:
+        return None
+    return "{}://{}".format(parts.scheme, parts.netloc)
+
+
+def close_driver(context, healthy=True):
+    """
+    Closes the browser of an execution context, or returns it to the daemon it was borrowed from
+    :param context: the ExecutionContext the browser belongs to
+    :param healthy: if a borrowed browser is still usable
+    """
+    if context.driver_lease is not None:
+        context.driver_lease.release(healthy)
+    else:
+        context.driver.quit()
+
+
+def raise_error(context, error_type, message):
     """
     Raises an error and terminates the application
+    :param context: the ExecutionContext the error occurred in
     :param error_type: the error type. Must end with the text "Exception" (Not enforced, just best practice)
     :param message: the message to attach to the error
     """
 
     # log the error message as fatal (CRITICAL)
     logging.fatal("{} - {} @ File: '{}' - Block: '{}' - Line: {}".format(
-        error_type, message, globals.current_code_block.filename, globals.current_code_block.block_name,
-        globals.current_code_block.current_line
+        error_type, message, context.current_code_block.filename, context.current_code_block.block_name,
+        context.current_line
     ))
 
     # terminate and quit
-    kill(2)
+    kill(context, 2)
     sys.exit(2)
@@ -0,0 +1,255 @@
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import time
+
+import browser
+from instructions import ParallelBlock
+
+"""
+Checkpoints (the --checkpoint and --resume options).
+While a script executes, a checkpoint is saved every few seconds (at an instruction boundary), and once more when the
+script fails (pointing at the failing instruction). A checkpoint holds everything needed to continue the script in a
+new browser: the variables of the memory heap (those which can be pickled), the stack of code block calls with the
+instruction each block continues from, the imported files, and the page (its URL, cookies, localStorage and the
+iframes which were switched into).
+Resuming re-imports the same files, restores the page, and re-enters each block call of the stack without executing
+the lines before it. The files may be edited before resuming (ie. to fix the failing line), as long as the
+instructions of each block before the point it continues from are unchanged. Execution inside FOREACHROW rows,
+parallel branches or language blocks (ie. 'interpret') is never checkpointed, as it can not be re-entered
+"""
+
+# the version of the saved checkpoint format. Increase this whenever the saved state changes
+CHECKPOINT_VERSION = 1
+
+# reads every item of the page's localStorage
+READ_LOCAL_STORAGE_SCRIPT = """
+var items = {};
+for (var i = 0; i < window.localStorage.length; i++) {
+    var key = window.localStorage.key(i);
+    items[key] = window.localStorage.getItem(key);
+}
+return items;
+"""
+
+# writes the items of arguments[0] to the page's localStorage
+WRITE_LOCAL_STORAGE_SCRIPT = """
+for (var key in arguments[0]) {
+    window.localStorage.setItem(key, arguments[0][key]);
+}
+"""
+
+
+def strip_lines(instruction):
+    """
+    :return: the fields of an instruction without its line numbers (including the line numbers of the branches of a
+    parallel section, and of the instructions inside of them)
+    """
+    if type(instruction) is ParallelBlock:
+        return instruction.source, tuple(
+            (b.code, tuple(strip_lines(i) for i in b.instructions), b.points) for b in instruction.branches
+        )
+    return tuple(instruction)[1:]
+
+
+def digest_instructions(block, pointer):
+    """
+    :return: the digest of the instructions of a block before an instruction pointer (ignoring their line numbers,
+    so lines may be added after the point a block is resumed from)
+    """
+    return hashlib.sha1(
+        repr([strip_lines(i) for i in block.instructions[:pointer]]).encode("utf8")
+    ).hexdigest()
+
+
+class Checkpointer:
+    def __init__(self, filename, interval=30):
+        """
+        Saves the checkpoints of a script
+        :param filename: the file to save the checkpoints to (each checkpoint replaces the last)
+        :param interval: the shortest time (in seconds) between two checkpoints
+        """
+        self.filename = filename
+        self.interval = interval
+        self.next_save = time.monotonic() + interval
+
+    def tick(self, context):
+        """
+        Called before each instruction of the innermost block. Saves a checkpoint if the interval has passed
+        :param context: the ExecutionContext being executed
+        """
+        if time.monotonic() < self.next_save:
+            return
+
+        self.next_save = time.monotonic() + self.interval
+        if context.current_frame.resumable:
+            self.save(context)
+
+    def finish(self, context, status):
+        """
+        Called when execution ends (see 'browser.kill'). A successful script deletes its checkpoint, so the next run
+        starts from the beginning. A failed script saves a checkpoint which retries the failing instruction
+        :param context: the ExecutionContext being executed
+        :param status: the exit code
+        """
+        if status == 0:
+            if os.path.isfile(self.filename):
+                os.remove(self.filename)
+            return
+
+        frame = context.current_frame
+        if frame is None or not frame.resumable:
+            return
+
+        # the instruction pointer has already moved past the failing instruction
+        self.save(context, retry=frame.instruction_pointer > 0)
+
+    def save(self, context, retry=False):
+        """
+        Saves a checkpoint
+        :param context: the ExecutionContext being executed
+        :param retry: if the innermost block should continue from the instruction before its instruction pointer
+        (the instruction which is executing), rather than from the instruction pointer
+        """
+        # the (block name, instruction pointer, line, digest of the instructions before the pointer) of each frame
+        frames = []
+        for f in context.frames:
+            pointer = f.instruction_pointer - 1 if retry and f is context.current_frame else f.instruction_pointer
+            frames.append((f.block.block_name, pointer, f.current_line, digest_instructions(f.block, pointer)))
+
+        # the commands bound into the heap (see 'blocks.create_memory_heap') are created again by the new context
+        heap = {}
+        skipped = []
+        for name, value in context.memory_heap.items():
+            if name == "__builtins__" or (type(value) is functools.partial and value.args[:1] == (context,)):
+                continue
+            try:
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                heap[name] = value
+            except Exception:
+                skipped.append(name)
+
+        try:
+            state = {
+                "version": CHECKPOINT_VERSION,
+                "time": time.time(),
+                "imports": list(context.imports),
+                "frames": frames,
+                "heap": heap,
+                "url": context.driver.current_url,
+                "cookies": context.driver.get_cookies(),
+                "local_storage": context.driver.execute_script(READ_LOCAL_STORAGE_SCRIPT),
+                "iframe_path": context.iframe_path
+            }
+        except Exception:
+            logging.warning("Could not read the state of the browser. No checkpoint was saved")
+            return
+
+        try:
+            # write to a temporary file first, so a checkpoint is never partially written
+            temp_path = "{}.{}.tmp".format(self.filename, os.getpid())
+            with open(temp_path, "wb") as f:
+                pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.filename)
+
+        except OSError:
+            logging.warning("Could not write checkpoint '{}'".format(self.filename))
+            return
+
+        logging.info("Checkpoint saved at line {} of '{}'{}".format(
+            frames[-1][2], frames[-1][0], "" if not skipped else " (not saved: {})".format(", ".join(skipped))
+        ))
+
+
+def load_checkpoint(filename):
+    """
+    Reads a saved checkpoint
+    :param filename: the file the checkpoint was saved to
+    :return: the saved state, or None if there is no (readable) checkpoint
+    """
+    if not os.path.isfile(filename):
+        return None
+
+    try:
+        with open(filename, "rb") as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError, TypeError):
+        logging.warning("Ignoring unreadable checkpoint '{}'".format(filename))
+        return None
+
+    if type(state) is not dict or state.get("version") != CHECKPOINT_VERSION:
+        logging.warning("Ignoring checkpoint '{}' from another version of AWT".format(filename))
+        return None
+
+    return state
+
+
+def restore_page(context, state):
+    """
+    Restores the page of a checkpoint in the context's browser
+    :param context: the ExecutionContext to restore the page in
+    :param state: the saved state
+    """
+    driver = context.driver
+    url = state["url"]
+
+    # cookies and localStorage can only be set on a page of their own site
+    driver.get(url)
+    for cookie in state["cookies"]:
+        try:
+            driver.add_cookie(cookie)
+        except Exception:
+            logging.warning("Could not restore cookie '{}'".format(cookie.get("name")))
+
+    try:
+        driver.execute_script(WRITE_LOCAL_STORAGE_SCRIPT, state["local_storage"] or {})
+    except Exception:
+        logging.warning("Could not restore localStorage")
+
+    # load the page again, so it starts with the restored cookies and storage
+    driver.get(url)
+    context.element_cache.clear()
+
+    for selector, index in state["iframe_path"]:
+        try:
+            frame = browser.get_element_selector(context, selector, index, raise_exception_on_failure=IndexError)
+        except IndexError:
+            logging.warning("Could not switch into iframe '{}' ({})".format(selector, index))
+            break
+
+        context.driver.switch_to.frame(frame)
+        context.iframe_path += ((selector, index),)
+
+
+def resume(context, main, state):
+    """
+    Continues executing a script from a checkpoint. The browser must already have been initialized
+    :param context: the ExecutionContext to execute the script in
+    :param main: the Module of the script (which has already been imported)
+    :param state: the saved state (see 'load_checkpoint')
+    """
+    import commands
+
+    for path, alias, digest in state["imports"]:
+        module = commands.import_module(context, path, alias, literal_path=True)
+        if module.digest != digest:
+            logging.warning("'{}' has changed since the checkpoint was saved".format(path))
+
+    # every block must still execute the same instructions before the point it continues from
+    frames = state["frames"]
+    for i, (name, pointer, _, digest) in enumerate(frames):
+        block = main.get_main_block() if i == 0 else context.code_blocks.get(name)
+        if block is None or pointer > len(block.instructions) or digest_instructions(block, pointer) != digest:
+            logging.fatal("Block '{}' has changed before the checkpoint, so it can not be resumed".format(name))
+            browser.kill(context, 2)
+
+    context.memory_heap.update(state["heap"])
+    restore_page(context, state)
+
+    logging.info("Resuming from line {} of '{}' (checkpoint saved {})".format(
+        frames[-1][2], frames[-1][0], time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(state["time"]))
+    ))
+
+    main.get_main_block().execute(context, resume=[(name, pointer) for name, pointer, _, _ in frames])
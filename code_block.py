@@ -1,52 +1,30 @@
-import shlex
-import re
 import browser
 import logging
-import globals
 import sys
 import os
+import time
 from selenium.common.exceptions import NoSuchWindowException, StaleElementReferenceException
 
-# RegEx patterns to indicate the start and end of language blocks.
-# For example, the Python language block looks like this:
-#
-# LANGBLOCK python
-# some python code
-# ENDLANGBLOCK python
+import parallel
+import pipeline
+import profiler
+from context import Frame
+from instructions import Command, LanguageBlock, ParallelBlock, UndefinedVariableError, compile_code
 
-BLOCK_START_PATTERN = re.compile(r"LANGBLOCK .*")
-BLOCK_END_PATTERN = re.compile(r"ENDLANGBLOCK.*")
 
-# RegEx patterns to indicate the start and end of code blocks.
-# For example, a code block to click a button might look like this
-#
-# BLOCK ClickButton
-# CLICK button
-# ENDBLOCK
-
-BLOCK_SECTION_START_PATTERN = re.compile(r"BLOCK .*")
-BLOCK_SECTION_END_PATTERN = re.compile(r"ENDBLOCK.*")
-
-
-def ignore_line(s) -> bool:
+def undefined_variable(context, name):
     """
-    Determines if a line should be ignored by the interpreter
-    :param s: the line to check
-    :return: if the line should be ignored (True) or interpreted (False)
+    Raises the AWT error for a variable which is referenced, but has not been defined
+    :param context: the ExecutionContext the variable was referenced in
+    :param name: the name of the variable
     """
-
-    # ignore the line if it starts with the # character (a comment)
-    if s.startswith("#"):
-        return True
-
-    # also ignore blank lines too
-    if s in ["\n", "", " "]:
-        return True
-    return False
+    browser.raise_error(
+        context, "UndefinedVariableException", "Variable '{}' is referenced, but has not been defined".format(name)
+    )
 
 
 class CodeBlock:
-    def __init__(self, filename, block_name, block_args, code, start_line):
+    def __init__(self, filename, block_name, block_args, code, start_line, compiled=None):
         """
         This class represents and handles a runnable code block
         It has it's own variable scope which is copied from the global variable scope on each execution
@@ -55,15 +33,13 @@ class CodeBlock:
         :param block_args: the argument structure for the block
         :param code: the code which is contained within the block
         :param start_line: The line where this block starts
+        :param compiled: the already compiled (instructions, points) of the code (see modules.py).
+        If None, the code is compiled
         """
         self.filename = filename
         self.block_name = block_name
         self.start_line = start_line
         self.code = code
-        self.points = {}            # the bindings between code points, and their line numbers
-        self.line_number = 0        # current line number relative to the block.
-                                    # Note that changing this during runtime will change the line of code
-                                    # which will execute next
 
         if "." in self.block_name:
             self.alias, self.raw_block_name = self.block_name.split(".")
@@ -86,46 +62,40 @@ class CodeBlock:
                 # if no default value is provided, add the argument name to the list of mandatory block_args
                 self.block_args.append(a)
 
-        # generate the point name to line number bindings
-        self.generate_points()
+        # compile the code once, and generate the point name to instruction index bindings
+        # for use of the SKIPTO command
+        if compiled is None:
+            compiled = compile_code(self.code)
+        self.instructions, self.points = compiled
+
+        # find the runs of read-only commands which can be executed in a single round trip
+        self.runs = pipeline.find_runs(self.instructions)
 
     def __str__(self):
         return "ARGS:\n{}\n\nCODE:\n{}".format(self.block_args, self.code)
 
-    def generate_points(self):
-        """
-        Generates the point name to line number bindings for use of the SKIPTO command
-        """
-        for line, s in enumerate(self.code):
-            # if the line starts with the command "POINT", add the binding to the points dictionary
-            if s.startswith("POINT"):
-                b = shlex.split(s)
-                self.points[b[1].rstrip("\n")] = line + 1
-
-    @property
-    def current_line(self):
-        return self.line_number + self.start_line
-
-    def execute(self, *block_args):
+    def execute(self, context, *block_args, resume=None):
         """
         Executes this block
+        :param context: the ExecutionContext to execute the block in
         :param block_args: the arguments supplied to the block's execution
+        :param resume: the (block name, instruction pointer) of this block and each block call it was executing
+        when a checkpoint was saved (see checkpoints.py), or None to execute the block from the start
         """
 
-        # imported here to avoid a gigantic circular import
-        # very annoying problem to solve, so to prevent you from pulling out your hair
-        # PLEASE just keep these imports here
-        import blocks
-        import interpreter
-
-        # reset local properties
-        self.line_number = 0
-        globals.current_code_block = self
-        variables = globals.memory_heap
+        # each execution gets its own frame, which tracks the line being executed
+        # only blocks called by a command (not by a language block or FOREACHROW) can be resumed
+        frame = Frame(self)
+        caller = context.current_frame
+        frame.resumable = caller is None or (caller.resumable and caller.calling)
+        start_time = time.perf_counter()
+        context.frames.append(frame)
+        variables = context.memory_heap
 
         # get the code block arguments for execution
         # iterate over the list of code block arguments
-        for i, a in enumerate(self.block_args):
+        # (a resumed block's arguments are already in the restored memory heap)
+        for i, a in enumerate(self.block_args if resume is None else []):
             try:
                 # attempt to write the argument name and value binding to the memory heap
                 variables[a] = block_args[i]
@@ -134,110 +104,167 @@ class CodeBlock:
                 # if the argument does not have a value, attempt to use the default value
                 variables[a] = self.block_default_arg_values[a]
 
-        # other variables to initialize
-        block = False
-        block_type = ""
-        code = ""
-        block_section = False
+        try:
+            if resume is not None:
+                frame.instruction_pointer = resume[0][1]
 
-        while self.line_number < len(self.code):
-            # get the current statement and increase the line number
-            s = self.code[self.line_number]  # type: str
-            s.lstrip(" ")
-            s.lstrip("\t")
-            self.line_number += 1
-
-            # if the line should be ignored, skip it
-            if ignore_line(s):
-                continue
+                # re-enter the block call which was executing when the checkpoint was saved,
+                # and continue with the instruction after it
+                if len(resume) > 1:
+                    frame.line_number = self.instructions[frame.instruction_pointer - 1].line
+                    frame.calling = True
+                    try:
+                        context.code_blocks[resume[1][0]].execute(context, resume=resume[1:])
+                    finally:
+                        frame.calling = False
+
+            while frame.instruction_pointer < len(self.instructions):
+                # save a checkpoint (if one is due) at the boundary between two instructions
+                if context.checkpoints is not None:
+                    context.checkpoints.tick(context)
+
+                # ----------{ Pipelined Commands }----------
+
+                # execute as many commands of a run of read-only commands as possible in a single round trip.
+                # the rest of the run (if any) falls through to be executed one command at a time
+                start = frame.instruction_pointer
+                if context.pipeline and start in self.runs:
+                    run = self.instructions[start:self.runs[start]]
+                    try:
+                        if context.profiler is None:
+                            frame.instruction_pointer += pipeline.execute_run(context, frame, run)
+                        else:
+                            frame.line_number = run[0].line
+                            with context.profiler.sample(
+                                    context, "[PIPELINE]", "<up to {} pipelined commands>".format(len(run))
+                            ):
+                                frame.instruction_pointer += pipeline.execute_run(context, frame, run)
+                    except NoSuchWindowException:
+                        logging.fatal("Execution terminated because browser window was externally closed")
+                        sys.exit(2)
+
+                    if frame.instruction_pointer >= len(self.instructions):
+                        break
 
-            # remove all training EOL characters
-            s = s.rstrip("\n")
+                # get the current instruction and move on to the next one
+                instruction = self.instructions[frame.instruction_pointer]
+                frame.instruction_pointer += 1
+                frame.line_number = instruction.line
 
-            # variables are in the format ${varname}
-            # make necessary replacements to input the variable values
-            for key, val in variables.items():
-                s = s.replace("${" + str(key) + "}", str(val))
+                if context.profiler is None:
+                    self.execute_instruction(context, frame, instruction)
+                else:
+                    with context.profiler.sample(context, *profiler.describe(instruction)):
+                        self.execute_instruction(context, frame, instruction)
 
-            # ----------{ Block Sections }----------
+        finally:
+            context.frames.pop()
+            if context.profiler is not None:
+                context.profiler.block_call(self, time.perf_counter() - start_time)
 
-            # ignore all code in a block section
-            if re.match(BLOCK_SECTION_START_PATTERN, s):
-                block_section = True
-                continue
+    def execute_instruction(self, context, frame, instruction):
+        """
+        Executes a single instruction of this block
+        :param context: the ExecutionContext to execute the instruction in
+        :param frame: the Frame of the execution of this block
+        :param instruction: the instruction to execute
+        """
 
-            if re.match(BLOCK_SECTION_END_PATTERN, s):
-                block_section = False
-                continue
+        # imported here to avoid a gigantic circular import
+        # very annoying problem to solve, so to prevent you from pulling out your hair
+        # PLEASE just keep these imports here
+        import blocks
+        import interpreter
 
-            if block_section:
-                continue
+        variables = context.memory_heap
 
-            # ----------{ Language Blocks }----------
+        # ----------{ Language Blocks }----------
 
-            # compile the code in a language block into a single string
-            if re.match(BLOCK_START_PATTERN, s):
-                block_type = s[10:]
-                block = True
-                continue
+        if type(instruction) is LanguageBlock:
+            code = instruction.code
+            if instruction.dynamic:
+                # the code may use the same syntax itself (ie. JavaScript template literals)
+                code = code.render(variables, strict=False)
 
-            # when the end of the block has been reached, execute it amd continue on to the next line
-            if re.match(BLOCK_END_PATTERN, s) and block is True:
-                block = False
-                try:
-                    blocks.execute_block(block_type, code)
-                    globals.current_code_block = self
-                    code = ""
-                except SystemExit:
-                    sys.exit()
-                except:
-                    logging.exception(
-                        "The following error has occurred @ File: '{}' - Line: {}".format(
-                            os.path.abspath(self.filename), self.current_line
-                        )
+            try:
+                blocks.execute_block(
+                    context, instruction.language, code, os.path.abspath(self.filename),
+                    self.start_line + instruction.line + 1, cache=not instruction.dynamic
+                )
+            except SystemExit as e:
+                sys.exit(e.code)
+            except:
+                logging.exception(
+                    "The following error has occurred @ File: '{}' - Line: {}".format(
+                        os.path.abspath(self.filename), frame.current_line
                     )
-                    browser.kill(2)
-                    sys.exit(2)
+                )
+                browser.kill(context, 2)
+                sys.exit(2)
+
+            return
+
+        # ----------{ Command Execution }----------
+
+        # interpret the command and handle all errors which arise
+        try:
+            # ----------{ Parallel Sections }----------
 
-                continue
+            if type(instruction) is ParallelBlock:
+                parallel.execute_parallel(context, self, instruction)
+                return
 
-            if block is True:
-                code += s + "\n"
-                continue
+            if type(instruction) is not Command:
+                browser.raise_error(
+                    context, "SyntaxException",
+                    "Could not parse '{}' ({})".format(instruction.source, instruction.message)
+                )
 
-            # ----------{ Command Execution }----------
+            # variables are in the format ${varname}
+            # make necessary replacements to input the variable values
+            if instruction.dynamic:
+                try:
+                    name, args = instruction.render(variables)
+                except UndefinedVariableError as e:
+                    undefined_variable(context, e.name)
+            else:
+                name = instruction.name
+                args = instruction.args
 
-            # interpret the command and handle all errors which arise
+            retry = 0
+            frame.calling = True
             try:
-                retry = 0
                 while True:
                     try:
-                        interpreter.interpret_command(s)
+                        interpreter.execute_command(context, name, args, instruction.source)
                         break
                     except StaleElementReferenceException as e:
-                        retry += 0
-                        if retry >= globals.stale_element_retries:
-                            logging.fatal("Maximum retries exceeded {}".format(globals.stale_element_retries))
+                        # the element is no longer on the page, so forget every cached element and look it up again
+                        context.element_cache.clear()
+                        retry += 1
+                        if retry >= context.stale_element_retries:
+                            logging.fatal("Maximum retries exceeded {}".format(context.stale_element_retries))
                             raise e
-                globals.current_code_block = self
+            finally:
+                frame.calling = False
 
-            except SystemExit as e:
-                sys.exit(e.code)
-                
-            except NoSuchWindowException:
-                logging.fatal("Execution terminated because browser window was externally closed")
-                sys.exit(2)
+        except SystemExit as e:
+            sys.exit(e.code)
 
-            except KeyboardInterrupt:
-                logging.error("Keyboard interrupt. Terminating execution with status code 3")
-                browser.kill(3)
-                sys.exit(3)
+        except NoSuchWindowException:
+            logging.fatal("Execution terminated because browser window was externally closed")
+            sys.exit(2)
 
-            except:
-                logging.exception(
-                    "The following error has occurred @ File: '{}' - Line: {}".format(
-                        os.path.abspath(self.filename), self.current_line
-                    )
+        except KeyboardInterrupt:
+            logging.error("Keyboard interrupt. Terminating execution with status code 3")
+            browser.kill(context, 3)
+            sys.exit(3)
+
+        except:
+            logging.exception(
+                "The following error has occurred @ File: '{}' - Line: {}".format(
+                    os.path.abspath(self.filename), frame.current_line
                 )
-                browser.kill(2)
-                sys.exit(2)
+            )
+            browser.kill(context, 2)
+            sys.exit(2)
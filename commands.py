@@ -1,79 +1,96 @@
 import logging
 import os
 import time
-import difflib
+import diff
 from colors import Colors
 import colorama
 colorama.init()
 
 import selenium.webdriver
 
-import globals
-from code_block import CodeBlock
-
 import browser as b
+import load_profiles
+import profiler
+import writer
 
 """
 All the functions which are bound to AWT commands 
 """
 
+# the keys which submit a form when they are typed into one of its fields
+SUBMIT_KEYS = ["\n", "\r", selenium.webdriver.common.keys.Keys.ENTER, selenium.webdriver.common.keys.Keys.RETURN]
+
 
-def goto(dst):
-    b.driver.get(dst)
+def goto(context, dst):
+    context.element_cache.clear()
+    context.visited_origins.add(b.get_origin(dst))
+    context.driver.get(dst)
 
 
-def text_input(selector, value, index=0):
+def text_input(context, selector, value, index=0):
     index = int(index)
 
-    elem = b.get_element_selector(selector, index)
+    elem = b.get_element_selector(context, selector, index)
     elem.send_keys(value)
+    clear_cache_after_keys(context, value)
 
 
-def click(selector, index=0):
+def click(context, selector, index=0):
     index = int(index)
-    elem = b.get_element_selector(selector, index)
+    elem = b.get_element_selector(context, selector, index)
     elem.click()
 
+    # the click may have followed a link or submitted a form
+    context.element_cache.clear()
 
-def force_click(selector, index=0):
-    elem = b.get_element_selector(selector, int(index))
-    b.driver.execute_script("arguments[0].click();", elem)
-    wait(1)
 
+def force_click(context, selector, index=0):
+    elem = b.get_element_selector(context, selector, int(index))
+    context.driver.execute_script("arguments[0].click();", elem)
+    context.element_cache.clear()
+    wait(context, 1)
+
+
+def clear_cache_after_keys(context, keys):
+    """
+    Clears the element cache after keys were typed which may have submitted a form (Enter, Return or a new line)
+    :param context: the ExecutionContext the keys were typed in
+    :param keys: the typed keys
+    """
+    if any(k in keys for k in SUBMIT_KEYS):
+        context.element_cache.clear()
 
-def wait_for(selector, timeout=10, check_interval=0.5):
-    timeout = float(timeout)
-    check_interval = float(check_interval)
 
-    start = time.time()
+def wait_for(context, selector, timeout=10, check_interval=0.5):
+    timeout = float(timeout)
 
-    while True:
-        try:
-            b.get_element_selector(selector, raise_exception_on_failure=IndexError)
-            break
-        except IndexError:
-            if time.time() - start >= timeout:
-                b.raise_error(
-                    "TimeoutException", "Maximum allowed time exceeded ({}s) while waiting for selector '{}'".format(
-                        timeout, selector
-                    )
-                )
-            time.sleep(check_interval)
+    # the lookup itself waits (with its own backoff) for up to the timeout.
+    # check_interval is kept for compatibility; the wait engine decides how often to check
+    try:
+        b.get_element_selector(context, selector, raise_exception_on_failure=IndexError, timeout=timeout)
+    except IndexError:
+        b.raise_error(
+            context, "TimeoutException",
+            "Maximum allowed time exceeded ({}s) while waiting for selector '{}'".format(timeout, selector)
+        )
 
 
-def back():
-    b.driver.back()
+def back(context):
+    context.element_cache.clear()
+    context.driver.back()
 
 
-def forward():
-    b.driver.forward()
+def forward(context):
+    context.element_cache.clear()
+    context.driver.forward()
 
 
-def refresh():
-    b.driver.refresh()
+def refresh(context):
+    context.element_cache.clear()
+    context.driver.refresh()
 
 
-def log(text, level="info"):
+def log(context, text, level="info"):
     levels = {
         "debug": logging.debug,
         "info": logging.info,
@@ -83,8 +100,8 @@ def log(text, level="info"):
     }
 
     variables = {
-        "line": globals.line_number,
-        "file": globals.filename
+        "line": context.current_line,
+        "file": context.filename
     }
 
     for key, val in variables.items():
@@ -93,128 +110,137 @@ def log(text, level="info"):
     levels[level.lower()](text)
 
 
-def wait(delay):
-    time.sleep(float(delay))
+def wait(context, delay):
+    with profiler.waiting(context):
+        time.sleep(float(delay))
 
 
-def screenshot(filename: str = "output.png"):
+def screenshot(context, filename: str = "output.png"):
     if not filename.endswith(".png"):
         filename += ".png"
 
-    b.driver.save_screenshot(filename)
+    # only the capture happens here, the file is written in the background (see writer.py)
+    context.artifacts.write(filename, context.driver.get_screenshot_as_png())
 
 
-def pause():
+def pause(context):
     os.system("pause")
 
 
-def set_var(variable, selector, index=0, attribute="innerText"):
-    elem = b.get_element_selector(selector, index)
-    globals.memory_heap[variable] = elem.get_attribute(attribute)
+def set_var(context, variable, selector, index=0, attribute="innerText"):
+    elem = b.get_element_selector(context, selector, index)
+    context.memory_heap[variable] = elem.get_attribute(attribute)
 
 
-def get_attr(selector, index=0, attribute="innerText"):
-    elem = b.get_element_selector(selector, index)
+def get_attr(context, selector, index=0, attribute="innerText"):
+    elem = b.get_element_selector(context, selector, index)
     return elem.get_attribute(attribute)
 
 
-def skip_to(point):
-    globals.current_code_block.line_number = globals.current_code_block.points[point]
+def skip_to(context, point):
+    context.current_frame.instruction_pointer = context.current_code_block.points[point]
 
 
-def set_file(selector, path, index=0):
-    text_input(selector, os.path.abspath(path), index)
+def set_file(context, selector, path, index=0):
+    text_input(context, selector, os.path.abspath(path), index)
 
 
-def set_variable(variable, value):
+def set_variable(context, variable, value):
     if value.isdigit():
         value = int(value)
         
     elif value.replace('.','',1).isdigit():
         value = float(value)
 
-    globals.memory_heap[variable] = value
+    context.memory_heap[variable] = value
 
 
-def count(selector, variable=None):
-    c = b.get_element_selector(selector, 0, get_mode=True)
+def count(context, selector, variable=None):
+    c = b.get_element_selector(context, selector, 0, get_mode=True)
     if variable is not None:
-        globals.memory_heap[variable] = len(c)
+        context.memory_heap[variable] = len(c)
 
     return len(c)
 
 
-def test(selector, index=0):
-    b.get_element_selector(selector, index)
+def test(context, selector, index=0):
+    b.get_element_selector(context, selector, index, use_cache=False)
 
 
-def anti_test(selector, index=0):
+def anti_test(context, selector, index=0, timeout=0):
+    # by default, the selector is checked exactly once (an absent element should not be waited for)
     try:
-        b.get_element_selector(selector, index, raise_exception_on_failure=IndexError)
+        b.get_element_selector(
+            context, selector, index, raise_exception_on_failure=IndexError, timeout=float(timeout)
+        )
         b.raise_error(
-            "SelectorFoundException", "Found {}th occurrence of selector {}. Expected not to!".format(index, selector)
+            context, "SelectorFoundException",
+            "Found {}th occurrence of selector {}. Expected not to!".format(index, selector)
         )
     except IndexError:
         pass
 
 
-def import_module(path, alias, literal_path=False):
-    if alias is None:
-        mod_prefix = ""
-    else:
-        mod_prefix = alias + "."
+def import_module(context, path, alias, literal_path=False):
+    # imported here to avoid a circular import (the interpreter binds the functions in this module)
+    import interpreter
+    import modules
 
     if not literal_path:
-        path = os.path.join(globals.cwd, path)
-
-    with open(path) as f:
-        code = []
-        block_start = -1
-
-        for i, line in enumerate(f.readlines()):
-            if line.startswith("BLOCK"):
-                block_start = i
-                code = []
-            code.append(line.rstrip("\n"))
-            if line.startswith("ENDBLOCK"):
-                args = code[0].split(" ")[1:]
-                args[-1] = args[-1].rstrip("\n")
-                globals.code_blocks[mod_prefix + args[0]] = CodeBlock(
-                    os.path.abspath(path), mod_prefix + args[0], args[1:], code[1:], block_start + 1
-                )
-
-
-def get_raw_elements(selector, index=0):
+        path = os.path.join(context.cwd, path)
+
+    # each file is only read and compiled once per process (see modules.py)
+    module = modules.load_module(path, context.bytecode_cache)
+
+    # only the blocks which were not already registered are added to the dispatch index (importing a file again adds
+    # nothing). A block which replaces another block of the same name is rare, and needs the whole index rebuilt
+    code_blocks = module.get_code_blocks(alias)
+    new_blocks = {name: block for name, block in code_blocks.items() if name not in context.code_blocks}
+    replaced = any(context.code_blocks.get(name, block) is not block for name, block in code_blocks.items())
+    context.code_blocks.update(code_blocks)
+
+    # remembered, so a checkpoint can import the same files again (see checkpoints.py)
+    if (module.path, alias, module.digest) not in context.imports:
+        context.imports.append((module.path, alias, module.digest))
+
+    if replaced:
+        interpreter.rebuild_dispatch_index(context)
+    else:
+        interpreter.index_code_blocks(context, new_blocks)
+    return module
+
+
+def get_raw_elements(context, selector, index=0):
     get_mode = False
 
     if index == "all":
         get_mode = True
 
-    return b.get_element_selector(selector, index, get_mode=get_mode)
+    return b.get_element_selector(context, selector, index, get_mode=get_mode)
 
 
-def get_element_parent(selector, index=0):
-    return b.get_element_selector(selector, index).find_element_by_xpath('..')
+def get_element_parent(context, selector, index=0):
+    return b.get_element_selector(context, selector, index).find_element_by_xpath('..')
 
 
-def alert(action="accept"):
-    a = b.driver.switch_to.alert
+def alert(context, action="accept"):
+    a = context.driver.switch_to.alert
     if action.lower() == "accept":
         a.accept()
     else:
         a.dismiss()
 
 
-def confirm(action="yes"):
-    a = b.driver.switch_to.alert
+def confirm(context, action="yes"):
+    a = context.driver.switch_to.alert
     if action.lower() == "yes":
         a.accept()
     else:
         a.dismiss()
 
 
-def prompt(text, action="yes"):
-    a = b.driver.switch_to.alert
+def prompt(context, text, action="yes"):
+    a = context.driver.switch_to.alert
     a.send_keys(text)
 
     if action:
@@ -223,125 +249,183 @@ def prompt(text, action="yes"):
         a.dismiss()
 
 
-def clear(selector, index=0):
-    b.get_element_selector(selector, index).clear()
+def clear(context, selector, index=0):
+    b.get_element_selector(context, selector, index).clear()
 
 
-def change(variable, delta):
-    globals.memory_heap[variable] += float(delta)
+def change(context, variable, delta):
+    context.memory_heap[variable] += float(delta)
 
 
-def send_keys(selector, keys, index=0):
-    b.get_element_selector(selector, index).send_keys(keys)
+def send_keys(context, selector, keys, index=0):
+    b.get_element_selector(context, selector, index).send_keys(keys)
+    clear_cache_after_keys(context, keys)
 
 
-def date_input(selector, date, index=0):
+def date_input(context, selector, date, index=0):
     remove_chars = [" ", "-", "/", "\\"]
     for c in remove_chars:
         date = date.replace(c, "")
 
-    selenium.webdriver.ActionChains(b.driver)\
-        .move_to_element(b.get_element_selector(selector, index)).click()\
+    selenium.webdriver.ActionChains(context.driver)\
+        .move_to_element(b.get_element_selector(context, selector, index)).click()\
         .send_keys(date).perform()
     
     
-def extract_html(filename, selector=None, index=0, encoding="utf8"):
-    filename = os.path.join(globals.cwd, filename)
+def extract_html(context, filename, selector=None, index=0, encoding="utf8", strip="false"):
+    # the file is compressed if its name ends with .gz or .zst (zstd requires the 'zstandard' package)
+    # use an empty selector to extract the whole page. If strip is true, scripts and styles are removed in the
+    # browser, so they are never sent over the web driver connection
+    filename = os.path.join(context.cwd, filename)
+    compression = writer.get_compression(filename)
+
+    if compression is not None and writer.COMPRESSIONS[compression] is None:
+        b.raise_error(
+            context, "MissingDependencyException",
+            "Cannot write '{}'. Install the 'zstandard' package to write zstd files".format(filename)
+        )
+
+    element = None
+    if selector:
+        element = b.get_element_selector(context, selector, index)
 
-    if selector is None:
-        html = b.driver.page_source
+    if str(strip).lower() in ["true", "yes", "strip"]:
+        html = context.driver.execute_script(b.STRIPPED_HTML_SCRIPT, element)
+    elif element is None:
+        html = context.driver.page_source
     else:
-        html = b.get_element_selector(selector, index).get_attribute("innerHTML")
+        html = element.get_attribute("innerHTML")
+
+    # the HTML is encoded, compressed and written in chunks in the background (see writer.py)
+    context.artifacts.write(filename, html, encoding, compression)
+
+
+def block_urls(context, *patterns):
+    # replaces the URL patterns blocked by earlier BLOCKURLS commands (the patterns of the load profile stay blocked)
+    context.blocked_urls = list(patterns)
+    blocked_urls = load_profiles.get_blocked_urls(context.browser_name, context.load_profile) + context.blocked_urls
 
-    with open(filename, 'wb') as f:
-        f.write(html.encode(encoding))
+    if not load_profiles.block_urls(context.driver, blocked_urls):
+        logging.warning("Blocking URLs is not supported by this browser. All URLs will be loaded")
 
 
-def switch_to_newly_opened_window():
-    b.driver.switch_to.window(b.driver.window_handles[1])
+def switch_to_newly_opened_window(context):
+    context.element_cache.clear()
+    context.current_window = context.driver.window_handles[1]
+    context.iframe_path = ()
+    context.driver.switch_to.window(context.current_window)
 
 
-def switch_to_original_window():
-    b.driver.switch_to.window(globals.original_window)
+def switch_to_original_window(context):
+    context.element_cache.clear()
+    context.current_window = context.original_window
+    context.iframe_path = ()
+    context.driver.switch_to.window(context.original_window)
 
-def switch_to_iframe(selector, index=0):
-    b.driver.switch_to.frame(b.get_element_selector(selector, index))
 
+def switch_to_iframe(context, selector, index=0):
+    frame = b.get_element_selector(context, selector, index)
+    context.element_cache.clear()
+    context.iframe_path += ((selector, int(index)),)
+    context.driver.switch_to.frame(frame)
 
-def switch_from_iframe():
-    b.driver.switch_to.default_content()
 
+def switch_from_iframe(context):
+    context.element_cache.clear()
+    context.iframe_path = ()
+    context.driver.switch_to.default_content()
 
-def read_file(path, variable, encoding="utf8"):
+
+def read_file(context, path, variable, encoding="utf8"):
+    # the file may have just been written by the script (ie. with EXTRACT)
+    context.artifacts.flush()
     with open(path, encoding=encoding) as f:
-        globals.memory_heap[variable] = f.read()
+        context.memory_heap[variable] = f.read()
+
+
+def compare(context, s1, s2, granularity="char", limit=20):
+    # the strings (or the names of the variables holding them) are compared at the granularity of characters,
+    # words or lines. At most 'limit' differences are printed, the match percentage always covers all of them
+    def header(text):
+        print(colorama.Back.WHITE + colorama.Fore.BLACK + text + colorama.Back.RESET + colorama.Fore.RESET)
+
+    def shorten(text, length=200):
+        text = text.replace("\n", "\\n")
+        return text if len(text) <= length else text[:length] + "..."
+
+    if s1 in context.memory_heap:
+        s1 = context.memory_heap[s1]
 
+    if s2 in context.memory_heap:
+        s2 = context.memory_heap[s2]
 
-def compare(s1, s2):
-    def init_msg():
-        print(
-            colorama.Back.WHITE + colorama.Fore.BLACK + "Character Position Difference" + colorama.Back.RESET + colorama.Fore.RESET)
-        print("Action Character Position")
+    s1, s2 = str(s1), str(s2)
+    granularity = granularity.lower()
+    limit = int(limit)
 
-    if s1 in globals.memory_heap:
-        s1 = globals.memory_heap[s1]
+    if granularity not in diff.GRANULARITIES:
+        b.raise_error(
+            context, "InvalidGranularityException", "Cannot compare by '{}'. Use one of: {}".format(
+                granularity, ", ".join(diff.GRANULARITIES.keys())
+            )
+        )
+
+    # identical strings need no diff at all
+    if s1 == s2:
+        log(context, "Detected 100.0% match between both strings", "info")
+        return 100.0
 
-    if s2 in globals.memory_heap:
-        s2 = globals.memory_heap[s2]
+    a, b_tokens, texts1, texts2 = diff.tokenize(s1, s2, granularity)
+    separator = {"char": "", "word": " ", "line": "\n"}[granularity]
 
-    output = ""
+    good = 0
     add = 0
     remove = 0
-    good = 0
+    shown = 0
 
-    initial_message = False
+    for tag, i1, i2, j1, j2 in diff.get_opcodes(a, b_tokens):
+        if tag == "equal":
+            good += i2 - i1
+            continue
 
-    for i, s in enumerate(difflib.ndiff(s1, s2)):
-        color = Colors.RESET
-        char = s[2]
-        if char == " ":
-            char = "·"
-            good += 1
+        remove += i2 - i1
+        add += j2 - j1
 
-        if s[0] == '-':
-            if initial_message is False:
-                init_msg()
-                initial_message = True
-            print("{} {} {}".format(
-                Colors.RED + '-' + Colors.RESET, s[-1], i
-            ))
-            color = Colors.RED
-            add += 1
+        if shown == 0:
+            header("{} Position Difference".format({"char": "Character", "word": "Word", "line": "Line"}[granularity]))
+            print("Action Position Text")
 
-        elif s[0] == '+':
-            if initial_message is False:
-                init_msg()
-                initial_message = True
+        shown += 1
+        if shown > limit:
+            continue
 
+        if i2 > i1:
             print("{} {} {}".format(
-                Colors.GREEN + '+' + Colors.RESET, s[-1], i
+                Colors.RED + "-" + Colors.RESET, i1, shorten(separator.join(texts1[i1:i2]))
+            ))
+        if j2 > j1:
+            print("{} {} {}".format(
+                Colors.GREEN + "+" + Colors.RESET, j1, shorten(separator.join(texts2[j1:j2]))
             ))
-            color = Colors.GREEN
-            remove += 1
 
-        output += color + char
+    if shown > limit:
+        print("... {} more differences".format(shown - limit))
 
     bads = add + remove
     total = bads + good
+    matched = good / total * 100 if total > 0 else 100.0
 
+    # a single added or removed token is still reported as a match (as it always has been)
     level = "info"
-    if add + remove > 1:
+    if bads > 1:
         print()
-        print(colorama.Back.WHITE + colorama.Fore.BLACK + "Text Position Difference" + colorama.Back.RESET + colorama.Fore.RESET)
-        print(output + "\n")
-
-        print(colorama.Back.WHITE + colorama.Fore.BLACK + "Final Report" + colorama.Back.RESET + colorama.Fore.RESET)
+        header("Final Report")
 
         print(Colors.GREEN             + "Additions   : {} ({}%)".format(add, round(add / total * 100, 2)))
         print(Colors.RED               + "Removals    : {} ({}%)".format(remove, round(remove / total * 100, 2)))
         print(colorama.Fore.MAGENTA    + "Total Issues: {} ({}%)".format(bads, round(bads / total * 100, 2)))
-        print(Colors.BOLD + colorama.Fore.RESET + "% Matched   : {}%".format(round(good / total * 100, 2)))
+        print(Colors.BOLD + colorama.Fore.RESET + "% Matched   : {}%".format(round(matched, 2)))
         level = "error"
 
-    log("Detected {}% match between both strings".format(round(good / total * 100, 2)), level)
-    return good / total * 100
+    log(context, "Detected {}% match between both strings".format(round(matched, 2)), level)
+    return matched
@@ -0,0 +1,246 @@
+import os
+import time
+import logging
+import threading
+
+import load_profiles
+import waits
+from checkpoints import Checkpointer
+from element_cache import ElementCache
+from profiler import Profiler
+from writer import ArtifactWriter
+
+"""
+The state of a single execution of an AWT script.
+Every subsystem (code blocks, the interpreter, commands and the browser) receives the context it is running in,
+so several scripts can be executed at the same time (ie. on different threads) in a single process
+"""
+
+
+class Frame:
+    def __init__(self, block):
+        """
+        The execution state of a single call to a code block
+        :param block: the CodeBlock being executed
+        """
+        self.block = block
+        self.line_number = 0            # current line number relative to the block
+        self.instruction_pointer = 0    # index of the next instruction to execute.
+                                        # Note that changing this during runtime will change the instruction
+                                        # which will execute next
+        self.calling = False            # if a command of this block is executing (block calls made by it can be
+                                        # resumed from a checkpoint, see checkpoints.py)
+        self.resumable = True           # if the block (and every block which called it) can be resumed
+
+    @property
+    def current_line(self):
+        return self.line_number + self.block.start_line
+
+
+class ExecutionContext:
+    def __init__(
+            self, filename, highlight_mode=False, terminate_pause=False, final_screenshot=False,
+            bytecode_cache=False, script_args=None, poll_ceiling=2, observe_mutations=False, implicit_wait=0,
+            element_cache=False, pipeline=True, profile=None, load_profile=None, checkpoint=None,
+            checkpoint_interval=30, resume=None
+    ):
+        """
+        This class owns everything which belongs to the execution of a single script:
+        the web driver, memory heap, registered code blocks, dispatch index, delays and the code block call stack
+        :param filename: the script to execute
+        :param highlight_mode: if each element which is selected should be highlighted
+        :param terminate_pause: if execution should pause before terminating
+        :param final_screenshot: the name of the screenshot to take on termination (False for no screenshot)
+        :param bytecode_cache: if compiled Python language blocks and imported files should be saved next to each script
+        :param script_args: the list of arguments to pass into the script (accessible as 'args' in the memory heap)
+        :param poll_ceiling: the longest time (in seconds) to wait between two attempts of an element lookup
+        :param observe_mutations: if element lookups should wait on an in-page MutationObserver between attempts
+        :param implicit_wait: the time (in seconds) the driver itself waits for elements before giving up.
+        0 (the default) leaves all waiting to the element lookups, which choose their own timeout
+        :param element_cache: if resolved elements should be cached until the page, window or iframe changes
+        :param pipeline: if runs of read-only commands should be executed in a single round trip (see pipeline.py).
+        Highlight mode always disables pipelining, so each command highlights its own element
+        :param profile: the name of the profile report to write (see profiler.py), or None to not profile the script
+        :param load_profile: the LoadProfile which decides how pages are loaded (see load_profiles.py).
+        Default=None (the 'full' profile, which loads every resource of each page)
+        :param checkpoint: the file to save checkpoints to (see checkpoints.py), or None to not save checkpoints
+        :param checkpoint_interval: the shortest time (in seconds) between two checkpoints
+        :param resume: the saved state of a checkpoint to continue the script from (see 'checkpoints.load_checkpoint'),
+        or None to execute the script from the beginning
+        """
+
+        # imported here to avoid a circular import (these modules receive the context as input)
+        import blocks
+        import interpreter
+
+        self.filename = filename
+        self.cwd = os.path.dirname(os.path.abspath(filename))
+        self.start_time = time.time()
+
+        self.highlight_mode = highlight_mode
+        self.terminate_pause = terminate_pause
+        self.final_screenshot = final_screenshot
+        self.bytecode_cache = bytecode_cache
+        self.script_args = [] if script_args is None else script_args
+
+        # browser state
+        self.driver = None
+        self.driver_lease = None
+        self.browser_name = None        # how the browser was started (see 'browser.initialize_browser')
+        self.headless = False
+        self.daemon_address = None      # the address of the daemon the browser was borrowed from (if any)
+        self.visited_origins = set()    # the origins GOTO navigated to (cleared by the daemon, see daemon.py)
+        self.load_profile = load_profiles.LOAD_PROFILES["full"] if load_profile is None else load_profile
+        self.blocked_urls = []          # the URL patterns blocked by the script itself (see 'commands.block_urls')
+        self.action_chain = None
+        self.original_window = None
+        self.current_window = None      # tracked here, so element cache keys do not need a round trip
+        self.iframe_path = ()           # the (selector, index) of each iframe switched into
+        self.element_cache = ElementCache(element_cache)
+        self.pipeline = pipeline and not highlight_mode
+
+        # element lookup delays (see 'browser.get_element_selector')
+        self.poll_interval = 0.125
+        self.poll_ceiling = poll_ceiling
+        self.maximum_delay = 10
+        self.observe_mutations = observe_mutations
+        self.implicit_wait = implicit_wait
+        self.stale_element_retries = 3
+        self.wait_metrics = waits.WaitMetrics()
+        self.artifacts = ArtifactWriter()
+        self.profiler = None if profile is None else Profiler(profile)
+        self.checkpoints = None if checkpoint is None else Checkpointer(checkpoint, checkpoint_interval)
+        self.resume_state = resume
+
+        # the command currently being executed
+        self.full_command = None
+        self.command_name = None
+        self.command_args = []
+
+        # the stack of code block calls. The last frame is the one currently executing
+        self.frames = []
+
+        self.code_blocks = {}
+        self.imports = []               # the (path, alias, digest) of each imported file, in order
+        self.dispatch = dict(interpreter.INTERPRETER)
+        self.dispatch_owners = dict(interpreter.INTERNAL_OWNERS)   # the (priority, description) of each bound name
+        self.reported_collisions = set()
+        self.memory_heap = blocks.create_memory_heap(self)
+
+        # the thread this context is executing on (see 'start')
+        self.thread = None
+        self.exit_code = None
+
+    @property
+    def current_frame(self) -> Frame:
+        if not self.frames:
+            return None
+        return self.frames[-1]
+
+    @property
+    def current_code_block(self):
+        if not self.frames:
+            return None
+        return self.frames[-1].block
+
+    @property
+    def current_line(self):
+        if not self.frames:
+            return 0
+        return self.frames[-1].current_line
+
+    def create_child(self):
+        """
+        Creates a context with the same settings, code blocks and variables as this one, which executes in a browser
+        of its own (ie. to execute data rows in parallel, see rows.py). The browser is not started
+        :return: the new ExecutionContext
+        """
+        child = ExecutionContext(
+            self.filename, highlight_mode=self.highlight_mode, bytecode_cache=self.bytecode_cache,
+            script_args=self.script_args, poll_ceiling=self.poll_ceiling, observe_mutations=self.observe_mutations,
+            implicit_wait=self.implicit_wait, element_cache=self.element_cache.enabled, pipeline=self.pipeline,
+            load_profile=self.load_profile
+        )
+        child.blocked_urls = list(self.blocked_urls)
+
+        # the code blocks are shared (their execution state is kept in each context's frames),
+        # the dispatch index is copied, as it is updated in place when a block is imported
+        child.code_blocks = dict(self.code_blocks)
+        child.imports = list(self.imports)
+        child.dispatch = dict(self.dispatch)
+        child.dispatch_owners = dict(self.dispatch_owners)
+        child.reported_collisions = set(self.reported_collisions)
+
+        # copy the variables of the script, but keep the child's own bound commands
+        for name, value in self.memory_heap.items():
+            if name not in child.memory_heap and name != "__builtins__":
+                child.memory_heap[name] = value
+
+        return child
+
+    def execute(self):
+        """
+        Imports the script and executes it as the main code block.
+        The browser must already have been initialized (see 'browser.initialize_browser')
+        """
+        import checkpoints
+        import commands
+
+        # import the input file
+        # it is read and compiled all at once at the start, so file changes during execution will be ignored
+        module = commands.import_module(self, self.filename, None, literal_path=True)
+
+        # continue from a checkpoint instead of the first line
+        if self.resume_state is not None:
+            checkpoints.resume(self, module, self.resume_state)
+            return
+
+        # execute the whole file as the main/starting code block
+        module.get_main_block().execute(self)
+
+    def run(self, browser_name, headless=False):
+        """
+        Initializes a browser, executes the script, and closes the browser.
+        Termination (ie. 'browser.kill') is recorded in 'exit_code' rather than ending the process
+        :param browser_name: the name of the browser to use
+        :param headless: if the browser should be run in headless mode
+        :return: the exit code of the script
+        """
+        import browser
+
+        try:
+            browser.initialize_browser(self, browser_name, headless)
+            self.execute()
+            browser.kill(self)
+        except SystemExit as e:
+            self.exit_code = e.code
+        except Exception:
+            logging.exception("Unhandled exception while executing '{}'".format(self.filename))
+            self.exit_code = 1
+            if self.driver_lease is not None:
+                self.driver_lease.release(healthy=False)
+            elif self.driver is not None:
+                self.driver.quit()
+        finally:
+            self.artifacts.flush()
+
+        return self.exit_code
+
+    def start(self, browser_name, headless=False):
+        """
+        Runs the script on a new thread (see 'run'). Use 'join' to wait for it to finish
+        :param browser_name: the name of the browser to use
+        :param headless: if the browser should be run in headless mode
+        """
+        self.thread = threading.Thread(
+            target=self.run, args=(browser_name, headless), name="AWT-{}".format(os.path.basename(self.filename))
+        )
+        self.thread.start()
+
+    def join(self):
+        """
+        Waits for a script started with 'start' to finish
+        :return: the exit code of the script
+        """
+        self.thread.join()
+        return self.exit_code
@@ -0,0 +1,528 @@
+"""
+Keeps a pool of already started browser sessions, which AWT scripts can borrow instead of starting a new browser
+
+usage: daemon.py [-h] -b {firefox,chrome,edge,ie,opera} [{firefox,chrome,edge,ie,opera} ...] [-e] [-n SESSIONS]
+                 [-u MAX_USES] [-t LEASE_TIMEOUT] [--host HOST] [-p PORT] [--load-profile LOAD_PROFILE]
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -b, --browser         The web browsers to keep sessions of
+  -e, --headless        Starts the sessions in headless mode
+  -n, --sessions        The number of sessions to keep per browser (Default=2)
+  -u, --max-uses        The number of scripts a session executes before it is replaced with a new one (Default=50)
+  -t, --lease-timeout   The time (in seconds) after which a borrowed session which was never returned is closed
+                        (Default=900)
+  --host                The address to listen on (Default=127.0.0.1)
+  -p, --port            The port to listen on (Default=4455)
+  --load-profile        The load profile of the sessions which are started ahead of time (Default=full). Scripts
+                        with another load profile (see awt.py) borrow sessions which are started with their profile
+
+Scripts borrow a session with the -d (--daemon) flag of awt.py (ie. awt.py script.awt -b firefox -d 127.0.0.1:4455).
+Only sessions of the same headless mode are borrowed. runner.py executes every script in headless mode, so a daemon
+for the runner should be started with -e.
+Between scripts, each session is reset: extra windows are closed, and cookies and storage are cleared.
+Chromium based browsers clear the storage of every origin the script visited. Other browsers can only clear the
+cookies and storage of the page which is loaded, so their session is replaced if the script visited more than one
+origin
+"""
+import argparse
+import json
+import logging
+import socketserver
+import threading
+import time
+import uuid
+import xmlrpc.client
+from xmlrpc.server import SimpleXMLRPCServer
+
+from selenium import webdriver
+import selenium.common.exceptions as selenium_exceptions
+
+import browser as b
+import load_profiles
+
+DEFAULT_PORT = 4455
+
+
+class Session:
+    def __init__(self, browser, headless, load_profile, driver):
+        """
+        A browser session which is owned by the daemon
+        :param browser: the name of the browser
+        :param headless: if the browser is running in headless mode
+        :param load_profile: the LoadProfile the browser was started with (see load_profiles.py)
+        :param driver: the Selenium web driver
+        """
+        self.browser = browser
+        self.headless = headless
+        self.load_profile = load_profile
+        self.driver = driver
+        self.uses = 0
+        self.lease_id = None
+        self.leased_at = None
+
+    @property
+    def key(self):
+        return self.browser, self.headless, self.load_profile
+
+    def is_healthy(self):
+        """
+        Checks if the browser is still responding
+        """
+        try:
+            self.driver.current_window_handle
+            return True
+        except selenium_exceptions.WebDriverException:
+            return False
+
+    def get_window_origins(self):
+        """
+        Finds the origins the current window has visited. Chromium based browsers list every page in the window's
+        history (and the iframes of the current page), other browsers only the current page
+        :return: the set of origins
+        """
+        driver = self.driver
+        if not hasattr(driver, "execute_cdp_cmd"):
+            return {b.get_origin(driver.current_url)}
+
+        urls = [e["url"] for e in driver.execute_cdp_cmd("Page.getNavigationHistory", {})["entries"]]
+        frames = [driver.execute_cdp_cmd("Page.getFrameTree", {})["frameTree"]]
+        while frames:
+            frame = frames.pop()
+            urls.append(frame["frame"]["url"])
+            frames.extend(frame.get("childFrames", []))
+
+        return {b.get_origin(url) for url in urls}
+
+    def reset(self, origins=()):
+        """
+        Resets the browser to a clean state: closes all extra windows, and clears cookies and storage
+        :param origins: the origins the script reported visiting (ie. in windows it has already closed)
+        :return: if the reset was successful. A session which can not be fully cleared must be replaced
+        """
+        driver = self.driver
+        origins = set(origins)
+        try:
+            # the origins of each window are collected before the window is closed
+            handles = driver.window_handles
+            for handle in reversed(handles):
+                driver.switch_to.window(handle)
+                origins.update(self.get_window_origins())
+                if handle != handles[0]:
+                    driver.close()
+            driver.switch_to.window(handles[0])
+            driver.switch_to.default_content()
+            origins.discard(None)
+
+            if hasattr(driver, "execute_cdp_cmd"):
+                # chromium based browsers can clear the cookies of every domain, and the storage of any origin
+                driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                for origin in origins:
+                    driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+
+            else:
+                # other browsers can only clear the cookies and storage of the page which is loaded
+                if len(origins) > 1 or (origins and b.get_origin(driver.current_url) not in origins):
+                    logging.info("{} session {} can not clear every origin it visited ({})".format(
+                        self.browser, driver.session_id, ", ".join(sorted(origins))
+                    ))
+                    return False
+
+                try:
+                    driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+                except selenium_exceptions.WebDriverException:
+                    pass
+                driver.delete_all_cookies()
+
+            driver.get("about:blank")
+            return True
+
+        except selenium_exceptions.WebDriverException:
+            logging.exception("Could not reset {} session {}".format(self.browser, driver.session_id))
+            return False
+
+    def close(self):
+        try:
+            self.driver.quit()
+        except selenium_exceptions.WebDriverException:
+            pass
+
+    def to_dict(self):
+        """
+        Returns the information a client needs to connect to this session
+        """
+        return {
+            "lease_id": self.lease_id,
+            "executor_url": self.driver.command_executor._url,
+            "session_id": self.driver.session_id,
+            "capabilities": json.dumps(self.driver.capabilities),
+            "w3c": self.driver.w3c
+        }
+
+
+class SessionPool:
+    def __init__(self, sessions=2, max_uses=50, lease_timeout=900):
+        """
+        A pool of browser sessions for each browser type
+        :param sessions: the maximum number of sessions per browser type
+        :param max_uses: the number of times a session is borrowed before it is replaced with a new one
+        :param lease_timeout: the time (in seconds) after which a session which was never returned is closed
+        """
+        self.sessions = sessions
+        self.max_uses = max_uses
+        self.lease_timeout = lease_timeout
+
+        # sessions are kept separately for each (browser, headless, load profile), as they are started differently
+        self.idle = {}          # the bindings between session keys and the list of idle sessions
+        self.leased = {}        # the bindings between lease ids and borrowed sessions
+        self.counts = {}        # the bindings between session keys and the number of open (or opening) sessions
+        self.condition = threading.Condition()
+
+    def start_session(self, key):
+        """
+        Starts a new session. The caller must have already reserved it in 'counts'
+        :param key: the (browser, headless, load profile) of the session
+        :return: the new Session, or None if the browser could not be started
+        """
+        browser, headless, load_profile = key
+        try:
+            driver = b.create_driver(browser, headless, load_profile)
+
+            # attached clients can not use the DevTools Protocol, so the URLs of the profile are blocked here
+            blocked_urls = load_profiles.get_blocked_urls(browser, load_profile)
+            if blocked_urls and not load_profiles.block_urls(driver, blocked_urls):
+                logging.warning("Blocking URLs is not supported by {}. All URLs will be loaded".format(browser))
+
+            session = Session(browser, headless, load_profile, driver)
+            logging.info("Started {} session {}".format(browser, session.driver.session_id))
+            return session
+
+        except Exception:
+            logging.exception("Could not start {} session".format(browser))
+            with self.condition:
+                self.counts[key] -= 1
+                self.condition.notify_all()
+            return None
+
+    def warm(self, browser, headless=False, load_profile=load_profiles.LOAD_PROFILES["full"]):
+        """
+        Starts sessions of a browser until the pool for that browser is full
+        :param browser: the name of the browser
+        :param headless: if the sessions should be started in headless mode
+        :param load_profile: the LoadProfile to start the sessions with
+        """
+        key = (browser, headless, load_profile)
+        while True:
+            with self.condition:
+                if self.counts.get(key, 0) >= self.sessions:
+                    return
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+            session = self.start_session(key)
+            if session is None:
+                return
+
+            with self.condition:
+                self.idle.setdefault(key, []).append(session)
+                self.condition.notify_all()
+
+    def reclaim_expired_leases(self):
+        """
+        Replaces sessions which have been borrowed for longer than the lease timeout. Must hold the condition lock
+        """
+        now = time.time()
+        for lease_id, session in list(self.leased.items()):
+            if now - session.leased_at > self.lease_timeout:
+                logging.warning("Lease {} expired. Replacing {} session".format(lease_id, session.browser))
+                del self.leased[lease_id]
+                self.counts[session.key] -= 1
+                threading.Thread(target=session.close, daemon=True).start()
+
+                # like a recycled session, the replacement is started in the background
+                threading.Thread(target=self.warm, args=session.key, daemon=True).start()
+
+    def acquire(self, browser, headless=False, load_profile=None):
+        """
+        Borrows a session. Blocks until one is available
+        :param browser: the name of the browser
+        :param headless: if the session should be in headless mode
+        :param load_profile: the fields of the LoadProfile the session should be started with
+        (Default=None for the 'full' profile)
+        :return: the information a client needs to connect to the session (see 'Session.to_dict')
+        """
+        if load_profile is None:
+            load_profile = load_profiles.LOAD_PROFILES["full"]
+        else:
+            # XML-RPC sends tuples as lists
+            load_profile = load_profiles.LoadProfile(
+                **dict(load_profile, blocked_urls=tuple(load_profile["blocked_urls"]))
+            )
+        key = (browser.lower(), bool(headless), load_profile)
+
+        while True:
+            session = None
+            start_new = False
+
+            with self.condition:
+                self.reclaim_expired_leases()
+
+                if self.idle.get(key):
+                    session = self.idle[key].pop()
+                elif self.counts.get(key, 0) < self.sessions:
+                    # a script which asks for another headless mode than the daemon was started with never gets
+                    # a warm session, which is easy to miss (ie. runner.py always runs scripts headless)
+                    if self.counts.get(key, 0) == 0 and self.counts.get((key[0], not key[1], key[2]), 0) > 0:
+                        logging.warning(
+                            "No {} session is {}headless. Starting a new one (start the daemon {} -e to keep warm "
+                            "sessions for these scripts)".format(
+                                browser, "" if key[1] else "non-", "with" if key[1] else "without"
+                            )
+                        )
+
+                    self.counts[key] = self.counts.get(key, 0) + 1
+                    start_new = True
+                else:
+                    self.condition.wait(1)
+                    continue
+
+            if start_new:
+                session = self.start_session(key)
+                if session is None:
+                    raise RuntimeError("Could not start {} session".format(browser))
+
+            elif not session.is_healthy():
+                logging.warning("Replacing unresponsive {} session".format(browser))
+                self.discard(session)
+                continue
+
+            with self.condition:
+                session.uses += 1
+                session.lease_id = uuid.uuid4().hex
+                session.leased_at = time.time()
+                self.leased[session.lease_id] = session
+
+            return session.to_dict()
+
+    def release(self, lease_id, healthy=True, origins=()):
+        """
+        Returns a borrowed session to the pool. The session is reset first, and replaced if it is unhealthy,
+        has reached its maximum number of uses, or can not be reset
+        :param lease_id: the id the session was borrowed with
+        :param healthy: if the client believes the session is still usable
+        :param origins: the origins the client navigated to (see 'Session.reset')
+        :return: True
+        """
+        with self.condition:
+            session = self.leased.pop(lease_id, None)
+
+        # the lease may have already expired
+        if session is None:
+            return True
+
+        if not healthy or session.uses >= self.max_uses or not session.reset(origins):
+            logging.info("Recycling {} session after {} uses".format(session.browser, session.uses))
+            self.discard(session)
+
+            # replace the session in the background, so the next script does not pay for the startup
+            threading.Thread(target=self.warm, args=session.key, daemon=True).start()
+            return True
+
+        with self.condition:
+            session.lease_id = None
+            self.idle.setdefault(session.key, []).append(session)
+            self.condition.notify_all()
+
+        return True
+
+    def discard(self, session):
+        """
+        Closes a session, and removes it from the pool
+        :param session: the Session to close
+        """
+        session.close()
+        with self.condition:
+            self.counts[session.key] -= 1
+            self.condition.notify_all()
+
+    def status(self):
+        """
+        Returns the number of idle and borrowed sessions of each browser
+        """
+        with self.condition:
+            return {
+                "{}{} ({} load profile)".format(browser, " (headless)" if headless else "", load_profile.name): {
+                    "open": count,
+                    "idle": len(self.idle.get((browser, headless, load_profile), [])),
+                    "leased": len([s for s in self.leased.values() if s.key == (browser, headless, load_profile)])
+                }
+                for (browser, headless, load_profile), count in self.counts.items()
+            }
+
+    def close(self):
+        """
+        Closes every session
+        """
+        with self.condition:
+            sessions = [s for idle in self.idle.values() for s in idle] + list(self.leased.values())
+            self.idle.clear()
+            self.leased.clear()
+            self.counts.clear()
+
+        for session in sessions:
+            session.close()
+
+
+class ThreadedXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+"""
+The client side of the daemon (used by awt.py)
+"""
+
+
+class AttachedDriver(webdriver.Remote):
+    def __init__(self, executor_url, session_id, capabilities, w3c=True):
+        """
+        A web driver which connects to an existing session rather than starting a new one
+        :param executor_url: the URL of the driver server which owns the session
+        :param session_id: the id of the session
+        :param capabilities: the capabilities of the session
+        :param w3c: if the driver server speaks the W3C protocol
+        """
+        self.attached_session_id = session_id
+        self.attached_w3c = w3c
+        super().__init__(command_executor=executor_url, desired_capabilities=capabilities)
+
+    def start_session(self, capabilities, browser_profile=None):
+        # attach to the existing session instead of requesting a new one
+        self.session_id = self.attached_session_id
+        self.capabilities = capabilities
+        self.w3c = self.attached_w3c
+
+
+class Lease:
+    def __init__(self, address, lease_id, origins):
+        """
+        A session which has been borrowed from a daemon
+        :param address: the address of the daemon (host:port)
+        :param lease_id: the id the session was borrowed with
+        :param origins: the set of origins the script navigates to (filled in as the script executes, see
+        'commands.goto'), which the daemon clears when the session is returned
+        """
+        self.address = address
+        self.lease_id = lease_id
+        self.origins = origins
+
+    def release(self, healthy=True):
+        """
+        Returns the session to the daemon
+        :param healthy: if the session is still usable
+        """
+        try:
+            origins = sorted(o for o in self.origins if o is not None)
+            connect(self.address).release(self.lease_id, healthy, origins)
+        except (OSError, xmlrpc.client.Error):
+            logging.exception("Could not return the browser to the daemon at '{}'".format(self.address))
+
+
+def connect(address):
+    """
+    Connects to a daemon
+    :param address: the address of the daemon (host:port)
+    :return: the XML-RPC proxy of the daemon
+    """
+    return xmlrpc.client.ServerProxy("http://{}/".format(address), allow_none=True)
+
+
+def borrow_browser(context, address, browser, headless=False):
+    """
+    Borrows a session from a daemon, and makes it the browser of an execution context.
+    The session is returned to the daemon by 'browser.kill'
+    :param context: the ExecutionContext the browser belongs to
+    :param address: the address of the daemon (host:port)
+    :param browser: the name of the browser to borrow
+    :param headless: if the browser should be in headless mode
+    """
+    context.browser_name = browser
+    context.headless = headless
+    context.daemon_address = address
+
+    info = connect(address).acquire(browser.lower(), headless, dict(context.load_profile._asdict()))
+    driver = AttachedDriver(
+        info["executor_url"], info["session_id"], json.loads(info["capabilities"]), info["w3c"]
+    )
+    b.attach_driver(context, driver, Lease(address, info["lease_id"], context.visited_origins))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Keeps a pool of browser sessions which AWT scripts can borrow')
+
+    parser.add_argument(
+        "-b", "--browser", help="The web browsers to keep sessions of", choices=b.BROWSERS.keys(), nargs="+",
+        required=True
+    )
+    parser.add_argument(
+        "-e", "--headless", help="Starts the sessions in headless mode", action="store_true"
+    )
+    parser.add_argument(
+        "-n", "--sessions", help="The number of sessions to keep per browser (Default=2)", type=int, default=2
+    )
+    parser.add_argument(
+        "-u", "--max-uses", help="The number of scripts a session executes before it is replaced (Default=50)",
+        type=int, default=50
+    )
+    parser.add_argument(
+        "-t", "--lease-timeout",
+        help="The time (in seconds) after which a borrowed session which was never returned is closed (Default=900)",
+        type=float, default=900
+    )
+    parser.add_argument(
+        "--host", help="The address to listen on (Default=127.0.0.1)", default="127.0.0.1"
+    )
+    parser.add_argument(
+        "-p", "--port", help="The port to listen on (Default={})".format(DEFAULT_PORT), type=int, default=DEFAULT_PORT
+    )
+    parser.add_argument(
+        "--load-profile",
+        help="The load profile of the sessions which are started ahead of time (Default=full). Scripts with another "
+             "load profile borrow sessions which are started with their profile",
+        default="full"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        load_profile = load_profiles.get_load_profile(args.load_profile)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(
+        format='(%(asctime)s) [%(levelname)-8.8s] %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    pool = SessionPool(args.sessions, args.max_uses, args.lease_timeout)
+
+    for browser in args.browser:
+        threading.Thread(target=pool.warm, args=(browser, args.headless, load_profile), daemon=True).start()
+
+    server = ThreadedXMLRPCServer((args.host, args.port), allow_none=True, logRequests=False)
+    server.register_function(pool.acquire, "acquire")
+    server.register_function(pool.release, "release")
+    server.register_function(pool.status, "status")
+
+    logging.info("Listening on {}:{}".format(args.host, args.port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down. Closing all sessions...")
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import re
+
+"""
+The diff used by the COMPARE command.
+It is Myers' linear space diff (the same algorithm as GNU diff): the common prefix and suffix are trimmed first,
+and the rest is split on its middle snake until only insertions and deletions remain.
+Very different inputs are split early (on the furthest reaching path) once a search costs more than MAX_COST,
+so the result may be slightly longer than the shortest diff, but the time stays close to linear
+"""
+
+# the maximum number of edits the search for a single middle snake may cost before an approximate split is used
+MAX_COST = 32
+
+# the bindings between granularities and the functions which split a string into tokens
+GRANULARITIES = {
+    "char": lambda s: s,
+    "word": lambda s: re.findall(r"\S+", s),
+    "line": lambda s: s.splitlines()
+}
+
+
+def common_prefix_length(a, a_low, a_high, b, b_low, b_high):
+    """
+    :return: the length of the common prefix of a[a_low:a_high] and b[b_low:b_high].
+    Slices of doubling length are compared (in C) rather than one item at a time, so the cost only depends on the
+    length of the prefix
+    """
+    limit = min(a_high - a_low, b_high - b_low)
+    length = 0
+    step = 1
+    while length < limit:
+        step = min(step, limit - length)
+        if a[a_low + length:a_low + length + step] == b[b_low + length:b_low + length + step]:
+            length += step
+            step *= 2
+        elif step == 1:
+            break
+        else:
+            step //= 2
+    return length
+
+
+def common_suffix_length(a, a_low, a_high, b, b_low, b_high):
+    """
+    :return: the length of the common suffix of a[a_low:a_high] and b[b_low:b_high] (see 'common_prefix_length')
+    """
+    limit = min(a_high - a_low, b_high - b_low)
+    length = 0
+    step = 1
+    while length < limit:
+        step = min(step, limit - length)
+        if a[a_high - length - step:a_high - length] == b[b_high - length - step:b_high - length]:
+            length += step
+            step *= 2
+        elif step == 1:
+            break
+        else:
+            step //= 2
+    return length
+
+
+def middle_snake(a, a_low, a_high, b, b_low, b_high, max_cost):
+    """
+    Finds the middle snake of the shortest edit path between a[a_low:a_high] and b[b_low:b_high]
+    Both ranges must be non-empty, and must not share a prefix or suffix
+    :return: the (x, y) start and (u, v) end of the snake (which may be empty)
+    """
+    n = a_high - a_low
+    m = b_high - b_low
+    delta = n - m
+    odd = delta % 2 == 1
+
+    # the arrays only need to hold the diagonals which are searched before the search becomes too expensive
+    max_d = min((n + m + 1) // 2, max_cost + 1)
+    offset = max_d + 1
+
+    # the furthest x reached on each diagonal k (= x - y), searching forwards from the start
+    # and backwards from the end (in the coordinates of the reversed sequences)
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        if d > max_cost:
+            # too expensive: split on the forward path which has reached the furthest
+            best = None
+            for k in range(-d + 1, d, 2):
+                x = min(forward[offset + k], n)
+                y = x - k
+                if 0 <= y <= m and (best is None or x + y > best[0] + best[1]):
+                    best = (x, y)
+            if best is not None and 0 < best[0] + best[1] < n + m:
+                return a_low + best[0], b_low + best[1], a_low + best[0], b_low + best[1]
+            return None
+
+        # ----------{ Forward Search }----------
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_low + x] == b[b_low + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+
+            # the path overlaps with a backward path on the same diagonal
+            reverse_k = delta - k
+            if odd and -(d - 1) <= reverse_k <= d - 1 and x + backward[offset + reverse_k] >= n:
+                return a_low + start_x, b_low + start_y, a_low + x, b_low + y
+
+        # ----------{ Backward Search }----------
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_high - 1 - x] == b[b_high - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+
+            forward_k = delta - k
+            if not odd and -d <= forward_k <= d and x + forward[offset + forward_k] >= n:
+                return a_high - x, b_high - y, a_high - start_x, b_high - start_y
+
+    return None
+
+
+def matching_blocks(a, b, max_cost=MAX_COST):
+    """
+    Finds the items two sequences have in common
+    :param a: the first sequence
+    :param b: the second sequence
+    :param max_cost: see MAX_COST
+    :return: the sorted list of (i, j, length) of each block where a[i:i + length] == b[j:j + length]
+    """
+    blocks = []
+    ranges = [(0, len(a), 0, len(b))]
+
+    while ranges:
+        a_low, a_high, b_low, b_high = ranges.pop()
+
+        prefix = common_prefix_length(a, a_low, a_high, b, b_low, b_high)
+        if prefix > 0:
+            blocks.append((a_low, b_low, prefix))
+            a_low += prefix
+            b_low += prefix
+
+        suffix = common_suffix_length(a, a_low, a_high, b, b_low, b_high)
+        if suffix > 0:
+            a_high -= suffix
+            b_high -= suffix
+            blocks.append((a_high, b_high, suffix))
+
+        # whatever is left in only one of the sequences is all insertions (or deletions)
+        if a_low == a_high or b_low == b_high:
+            continue
+
+        snake = middle_snake(a, a_low, a_high, b, b_low, b_high, max_cost)
+        if snake is None:
+            # no split could be made, so the rest is replaced as a whole
+            continue
+
+        x, y, u, v = snake
+        if u > x:
+            blocks.append((x, y, u - x))
+        ranges.append((a_low, x, b_low, y))
+        ranges.append((u, a_high, v, b_high))
+
+    return sorted(blocks)
+
+
+def get_opcodes(a, b, max_cost=MAX_COST):
+    """
+    Describes how to turn one sequence into another (in the same format as 'difflib.SequenceMatcher.get_opcodes')
+    :return: the list of (tag, i1, i2, j1, j2), where tag is 'equal', 'replace', 'delete' or 'insert'
+    """
+    opcodes = []
+    i = j = 0
+
+    for block_i, block_j, length in matching_blocks(a, b, max_cost) + [(len(a), len(b), 0)]:
+        if i < block_i and j < block_j:
+            opcodes.append(("replace", i, block_i, j, block_j))
+        elif i < block_i:
+            opcodes.append(("delete", i, block_i, j, block_j))
+        elif j < block_j:
+            opcodes.append(("insert", i, block_i, j, block_j))
+
+        if length > 0:
+            opcodes.append(("equal", block_i, block_i + length, block_j, block_j + length))
+        i, j = block_i + length, block_j + length
+
+    return opcodes
+
+
+def tokenize(s1, s2, granularity):
+    """
+    Splits two strings into tokens. Words and lines are replaced by integers, so comparing them is cheap
+    :param granularity: 'char', 'word' or 'line'
+    :return: the tokens of both strings (to diff), and the texts of the tokens of both strings (to print)
+    """
+    texts1 = GRANULARITIES[granularity](s1)
+    texts2 = GRANULARITIES[granularity](s2)
+    if granularity == "char":
+        return s1, s2, s1, s2
+
+    ids = {}
+    return [ids.setdefault(t, len(ids)) for t in texts1], [ids.setdefault(t, len(ids)) for t in texts2], texts1, texts2
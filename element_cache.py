@@ -0,0 +1,62 @@
+import logging
+
+"""
+A cache of resolved element handles, so consecutive commands on the same selector (ie. TEST, GETATTR, then CLICK)
+only look the element up once.
+It is cleared whenever the page, window or iframe changes (see the navigation commands in commands.py),
+after every interaction which may navigate (clicks, and typing Enter), and whenever a command fails with a
+StaleElementReferenceException (see 'CodeBlock.execute')
+"""
+
+
+class ElementCache:
+    def __init__(self, enabled=False):
+        """
+        The bindings between (selector, index, iframe path, window handle) and resolved Selenium elements
+        :param enabled: if elements should be cached
+        """
+        self.enabled = enabled
+        self.elements = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Returns a cached element
+        :param key: the (selector, index, iframe path, window handle) of the element
+        :return: the Selenium element, or None if the element has not been cached
+        """
+        element = self.elements.get(key)
+        if element is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return element
+
+    def put(self, key, element):
+        """
+        Caches a resolved element
+        :param key: the (selector, index, iframe path, window handle) of the element
+        :param element: the Selenium element
+        """
+        self.elements[key] = element
+
+    def clear(self):
+        """
+        Removes all cached elements (ie. when the page, window or iframe changes)
+        """
+        if self.elements:
+            self.invalidations += 1
+        self.elements.clear()
+
+    def report(self):
+        """
+        Logs the hit and miss counts (if the cache was used)
+        """
+        if self.hits + self.misses == 0:
+            return
+
+        logging.info("--------[ Element cache: {} hits, {} misses ({}% hit rate), {} invalidations ]--------".format(
+            self.hits, self.misses, round(self.hits / (self.hits + self.misses) * 100, 2), self.invalidations
+        ))
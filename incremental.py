@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import shlex
+
+from instructions import BLOCK_END_PATTERN, BLOCK_START_PATTERN, VARIABLE_PREFIX, ignore_line
+
+"""
+Incremental runs (the --state option of runner.py).
+Each script's inputs are found by following its IMPORT statements (and the files its READ and FOREACHROW commands
+read), the same way the interpreter resolves them: every path is relative to the directory of the script being
+executed, including the paths in imported files. The digest of a script covers the contents of all of its
+(transitive) inputs, and the options it is run with. A script is only executed again if that digest has changed
+since it last passed.
+Files read by language blocks can not be found, and a path which references a variable can not be resolved, so the
+scripts which use one are always executed
+"""
+
+# the commands whose first argument is the path of a file the script depends on
+INPUT_COMMANDS = ("IMPORT", "READ", "FOREACHROW")
+
+# the version of the saved state format. Increase this whenever the saved state changes
+STATE_VERSION = 1
+
+
+class DependencyGraph:
+    def __init__(self):
+        """
+        The files each script depends on. Files which are shared by many scripts are only read and hashed once
+        """
+        # the bindings between (file, directory paths are resolved against) and the direct inputs of the file
+        # (None if an input can not be resolved)
+        self.edges = {}
+        # the bindings between file paths and the SHA-1 digests of their contents (None for a missing file)
+        self.hashes = {}
+
+    def get_hash(self, path):
+        if path not in self.hashes:
+            try:
+                with open(path, "rb") as f:
+                    self.hashes[path] = hashlib.sha1(f.read()).hexdigest()
+            except OSError:
+                self.hashes[path] = None
+        return self.hashes[path]
+
+    def get_direct_inputs(self, path, cwd):
+        """
+        Finds the files a single file reads or imports
+        :param path: the absolute path to the file
+        :param cwd: the directory paths are resolved against (the directory of the script being executed)
+        :return: the list of (command, absolute path) of each input, or None if any of the paths can not be resolved
+        """
+        key = (path, cwd)
+        if key in self.edges:
+            return self.edges[key]
+
+        inputs = []
+        language = False
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except (OSError, UnicodeError):
+            lines = []
+
+        for line in lines:
+            line = line.rstrip("\n")
+            if ignore_line(line):
+                continue
+
+            # the code of language blocks is not AWT
+            if BLOCK_START_PATTERN.match(line):
+                language = True
+                continue
+            if BLOCK_END_PATTERN.match(line):
+                language = False
+                continue
+            if language:
+                continue
+
+            try:
+                tokens = shlex.split(line)
+            except ValueError:
+                continue
+
+            # the commands may also be the actions of a SWITCH
+            for i, token in enumerate(tokens[:-1]):
+                if token not in INPUT_COMMANDS:
+                    continue
+
+                if VARIABLE_PREFIX in tokens[i + 1]:
+                    inputs = None
+                    break
+                inputs.append((token, os.path.normpath(os.path.join(cwd, tokens[i + 1]))))
+
+            if inputs is None:
+                break
+
+        self.edges[key] = inputs
+        return inputs
+
+    def get_inputs(self, script):
+        """
+        Finds every file a script depends on (including itself)
+        :param script: the absolute path to the script
+        :return: the sorted list of absolute paths, or None if any input can not be resolved
+        """
+        cwd = os.path.dirname(script)
+        found = {script}
+        remaining = [script]
+
+        while remaining:
+            inputs = self.get_direct_inputs(remaining.pop(), cwd)
+            if inputs is None:
+                return None
+
+            # only imported files are followed (READ and FOREACHROW files are data)
+            for command, path in inputs:
+                if path not in found:
+                    found.add(path)
+                    if command == "IMPORT":
+                        remaining.append(path)
+
+        return sorted(found)
+
+    def get_digest(self, script, options):
+        """
+        :param script: the absolute path to the script
+        :param options: the list of options which change the outcome of the script (ie. the browser)
+        :return: the digest of the contents of every input of a script and its options,
+        or None if its inputs can not be found
+        """
+        inputs = self.get_inputs(script)
+        if inputs is None:
+            return None
+
+        digest = hashlib.sha1(json.dumps(options).encode("utf8"))
+        for path in inputs:
+            digest.update("{}\0{}\0".format(path, self.get_hash(path)).encode("utf8"))
+        return digest.hexdigest()
+
+
+def load_state(filename):
+    """
+    Reads the saved results of the last runs
+    :param filename: the state file
+    :return: the bindings between script paths and their last results (empty if there is no readable state)
+    """
+    if not os.path.isfile(filename):
+        return {}
+
+    try:
+        with open(filename) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        logging.warning("Ignoring unreadable state file '{}'".format(filename))
+        return {}
+
+    if type(state) is not dict or state.get("version") != STATE_VERSION:
+        return {}
+    return state["scripts"]
+
+
+def save_state(filename, scripts):
+    """
+    Saves the results of the last runs
+    :param filename: the state file
+    :param scripts: the bindings between script paths and their last results
+    """
+    try:
+        # write to a temporary file first, so a concurrent run never reads a partially written state
+        temp_path = "{}.{}.tmp".format(filename, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump({"version": STATE_VERSION, "scripts": scripts}, f, indent=4, sort_keys=True)
+        os.replace(temp_path, filename)
+
+    except OSError:
+        logging.warning("Could not write state file '{}'".format(filename))
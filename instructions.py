@@ -0,0 +1,314 @@
+import shlex
+import re
+from collections import namedtuple
+
+"""
+The compile stage of the AWT interpreter
+Each file (or code block) is turned into a list of instructions once, so executing it only has to walk that list
+"""
+
+# RegEx patterns to indicate the start and end of language blocks.
+# For example, the Python language block looks like this:
+#
+# LANGBLOCK python
+# some python code
+# ENDLANGBLOCK python
+
+BLOCK_START_PATTERN = re.compile(r"LANGBLOCK .*")
+BLOCK_END_PATTERN = re.compile(r"ENDLANGBLOCK.*")
+
+# RegEx patterns to indicate the start and end of code blocks.
+# For example, a code block to click a button might look like this
+#
+# BLOCK ClickButton
+# CLICK button
+# ENDBLOCK
+
+BLOCK_SECTION_START_PATTERN = re.compile(r"BLOCK .*")
+BLOCK_SECTION_END_PATTERN = re.compile(r"ENDBLOCK.*")
+
+# RegEx patterns to indicate the start, branches and end of parallel sections.
+# Each branch is executed at the same time, in its own browser tab. For example:
+#
+# PARALLEL
+# GOTO https://example.com/a
+# BRANCH
+# GOTO https://example.com/b
+# ENDPARALLEL
+
+PARALLEL_START_PATTERN = re.compile(r"PARALLEL\s*$")
+PARALLEL_BRANCH_PATTERN = re.compile(r"BRANCH\s*$")
+PARALLEL_END_PATTERN = re.compile(r"ENDPARALLEL\s*$")
+
+# the prefix of a variable placeholder (variables are in the format ${varname})
+VARIABLE_PREFIX = "${"
+VARIABLE_PATTERN = re.compile(r"\$\{([^}]*)\}")
+
+
+class UndefinedVariableError(KeyError):
+    """
+    Raised when a template references a variable which is not in the memory heap
+    """
+    def __init__(self, name):
+        super().__init__(name)
+        self.name = name
+
+
+class Template(namedtuple("Template", ["source", "parts"])):
+    """
+    A string containing variables, parsed once into its literal text and the names of the variables it references
+    :param source: the original text
+    :param parts: the literal text and variable names. Even indices are literal text, odd indices are variable names
+    """
+    __slots__ = ()
+
+    def render(self, variables, strict=True):
+        """
+        Inputs the values of the referenced variables into the template
+        Only the variables which the template references are looked up, so the cost does not depend on heap size
+        :param variables: the bindings between variable names and values
+        :param strict: if referencing an undefined variable is an error. Otherwise the placeholder is left as it is
+        (ie. JavaScript template literals in language blocks)
+        :return: the string with the variable values inputted
+        """
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            try:
+                parts[i] = str(variables[parts[i]])
+            except KeyError:
+                if strict:
+                    raise UndefinedVariableError(parts[i])
+                parts[i] = VARIABLE_PREFIX + parts[i] + "}"
+        return "".join(parts)
+
+
+def compile_template(s):
+    """
+    Parses the variables out of a string
+    :param s: the string to parse
+    :return: a Template if the string references any variables, otherwise the string itself
+    """
+    if VARIABLE_PREFIX not in s:
+        return s
+
+    parts = tuple(VARIABLE_PATTERN.split(s))
+    if len(parts) == 1:
+        return s
+
+    return Template(s, parts)
+
+
+def render(s, variables):
+    """
+    Renders a token which may or may not be a Template
+    :param s: the string or Template to render
+    :param variables: the bindings between variable names and values
+    :return: the rendered string
+    """
+    if type(s) is Template:
+        return s.render(variables)
+    return s
+
+
+class Command(namedtuple("Command", ["line", "source", "name", "args", "dynamic"])):
+    """
+    A single AWT command which has already been split into its name and argument tokens
+    :param line: the line number of the command (relative to the start of the code)
+    :param source: the original text of the command
+    :param name: the name of the command (the first token)
+    :param args: the tuple of argument tokens. Tokens which reference variables are stored as Templates
+    :param dynamic: if any of the tokens contain variables which must be substituted before execution
+    """
+    __slots__ = ()
+
+    def render(self, variables):
+        """
+        Inputs the values of variables into the command's tokens
+        :param variables: the bindings between variable names and values
+        :return: the rendered command name, and the list of rendered arguments
+        """
+        return render(self.name, variables), [render(a, variables) for a in self.args]
+
+
+class LanguageBlock(namedtuple("LanguageBlock", ["line", "language", "code", "dynamic"])):
+    """
+    The collapsed body of a language block (LANGBLOCK ... ENDLANGBLOCK)
+    :param line: the line number of the LANGBLOCK statement (relative to the start of the code).
+    The code itself starts on the next line
+    :param language: the language to execute the code as
+    :param code: the code inside of the block (a Template if it references variables). Placeholders which are not
+    AWT variables are left in the code
+    :param dynamic: if the code contains variables which must be substituted before execution
+    """
+    __slots__ = ()
+
+
+class Branch(namedtuple("Branch", ["line", "code", "instructions", "points"])):
+    """
+    A single branch of a parallel section
+    :param line: the number of lines before the branch's code (relative to the start of the code it was compiled from)
+    :param code: the list of lines of the branch
+    :param instructions: the compiled instructions of the branch
+    :param points: the bindings between point names and instruction indices (points are local to their branch)
+    """
+    __slots__ = ()
+
+
+class ParallelBlock(namedtuple("ParallelBlock", ["line", "source", "branches"])):
+    """
+    The collapsed body of a parallel section (PARALLEL ... BRANCH ... ENDPARALLEL)
+    :param line: the line number of the PARALLEL statement (relative to the start of the code)
+    :param source: the text of the PARALLEL statement
+    :param branches: the tuple of compiled Branches
+    """
+    __slots__ = ()
+
+
+class InvalidCommand(namedtuple("InvalidCommand", ["line", "source", "message"])):
+    """
+    A line which could not be compiled. The error is raised when (and only if) the line is executed
+    :param line: the line number of the command (relative to the start of the code)
+    :param source: the original text of the command
+    :param message: the reason the line could not be compiled
+    """
+    __slots__ = ()
+
+
+def ignore_line(s) -> bool:
+    """
+    Determines if a line should be ignored by the interpreter
+    :param s: the line to check
+    :return: if the line should be ignored (True) or interpreted (False)
+    """
+
+    # ignore the line if it starts with the # character (a comment)
+    if s.startswith("#"):
+        return True
+
+    # also ignore blank lines too
+    if s in ["\n", "", " "]:
+        return True
+    return False
+
+
+def compile_code(code):
+    """
+    Compiles a list of lines into a list of instructions.
+    Comments are dropped, BLOCK sections are skipped, language blocks and parallel sections are collapsed into a
+    single instruction, and POINTs are resolved to the index of the instruction which follows them
+    :param code: the list of lines to compile
+    :return: the tuple of instructions, and the bindings between point names and instruction indices
+    """
+    instructions = []
+    points = {}
+
+    block_section = False
+    language = None
+    block_code = ""
+    block_line = 0
+
+    # the depth of the parallel section being collected (nested sections are compiled with their branch),
+    # and the index of the first line of each of its branches
+    parallel_depth = 0
+    parallel_line = 0
+    branches = []
+
+    for i, s in enumerate(code):
+        line = i + 1
+
+        # if the line should be ignored, skip it
+        # (blank lines are kept in language blocks so the line numbers of the code still match the file)
+        if ignore_line(s):
+            if language is not None:
+                block_code += "\n"
+            continue
+
+        # remove all training EOL characters
+        s = s.rstrip("\n")
+
+        # ----------{ Block Sections }----------
+
+        # ignore all code in a block section
+        if re.match(BLOCK_SECTION_START_PATTERN, s):
+            block_section = True
+            continue
+
+        if re.match(BLOCK_SECTION_END_PATTERN, s):
+            block_section = False
+            continue
+
+        if block_section:
+            continue
+
+        # ----------{ Parallel Sections }----------
+
+        # collect the lines of each branch, and compile them once the section ends
+        if language is None and re.match(PARALLEL_START_PATTERN, s):
+            parallel_depth += 1
+            if parallel_depth == 1:
+                parallel_line = line
+                branches = [i + 1]
+                continue
+
+        elif parallel_depth == 1 and language is None and re.match(PARALLEL_BRANCH_PATTERN, s):
+            branches.append(i + 1)
+            continue
+
+        elif parallel_depth > 0 and language is None and re.match(PARALLEL_END_PATTERN, s):
+            parallel_depth -= 1
+            if parallel_depth == 0:
+                compiled = []
+                ends = [start - 1 for start in branches[1:]] + [i]
+                for start, end in zip(branches, ends):
+                    branch_code = [c.rstrip("\n") for c in code[start:end]]
+                    compiled.append(Branch(start, branch_code, *compile_code(branch_code)))
+
+                instructions.append(ParallelBlock(parallel_line, "PARALLEL", tuple(compiled)))
+                continue
+
+        if parallel_depth > 0:
+            continue
+
+        # ----------{ Language Blocks }----------
+
+        # compile the code in a language block into a single instruction
+        if re.match(BLOCK_START_PATTERN, s):
+            language = s[10:]
+            block_line = line
+            continue
+
+        if re.match(BLOCK_END_PATTERN, s) and language is not None:
+            block_code = compile_template(block_code)
+            instructions.append(LanguageBlock(block_line, language, block_code, type(block_code) is Template))
+            language = None
+            block_code = ""
+            continue
+
+        if language is not None:
+            block_code += s + "\n"
+            continue
+
+        # ----------{ Commands }----------
+
+        try:
+            tokens = shlex.split(s)
+        except ValueError as e:
+            instructions.append(InvalidCommand(line, s, str(e)))
+            continue
+
+        if not tokens:
+            continue
+
+        # points are not executed, they only mark the instruction which SKIPTO jumps to
+        if tokens[0] == "POINT":
+            points[tokens[1]] = len(instructions)
+            continue
+
+        tokens = [compile_template(t) for t in tokens]
+        dynamic = any(type(t) is Template for t in tokens)
+        instructions.append(Command(line, s, tokens[0], tuple(tokens[1:]), dynamic))
+
+    if parallel_depth > 0:
+        instructions.append(InvalidCommand(parallel_line, "PARALLEL", "PARALLEL without ENDPARALLEL"))
+
+    return tuple(instructions), points
@@ -1,12 +1,23 @@
 import shlex
+import functools
 import commands
 import browser
-import globals
+import logging
+import rows
 
+# the maximum number of compiled SWITCH conditions to keep
+CONDITION_CACHE_SIZE = 256
 
-def interpret_command(cmd):
+# the priorities of the names in the dispatch index (a name is bound to the highest priority thing it refers to)
+INTERNAL_PRIORITY = 0       # internal commands
+ALIASED_PRIORITY = 1        # imported blocks without their module alias
+FULL_PRIORITY = 2           # the full names of blocks
+
+
+def interpret_command(context, cmd):
     """
     Executes a single command
+    :param context: the ExecutionContext to execute the command in
     :param cmd: the command to execute
     """
 
@@ -16,49 +27,133 @@ def interpret_command(cmd):
     if not broken_cmd:
         return
 
-    # if the command is declaring a point, skip execution
-    if broken_cmd[0] == "POINT":
-        return
+    # commands run from language blocks are profiled as part of the language block's line
+    if context.profiler is None:
+        execute_command(context, broken_cmd[0], broken_cmd[1:], cmd)
+    else:
+        with context.profiler.sample(context, broken_cmd[0], cmd):
+            execute_command(context, broken_cmd[0], broken_cmd[1:], cmd)
 
-    # update global attributes (full command, command, and args)
-    globals.full_command = cmd
-    globals.command_name = broken_cmd[0]
-    globals.command_args = broken_cmd[1:]
 
-    # if the command is a code block, execute the block
-    if broken_cmd[0] in globals.code_blocks:
-        globals.code_blocks[broken_cmd[0]].execute(*broken_cmd[1:])
+def execute_command(context, name, args, full_command=None):
+    """
+    Executes a single command which has already been broken up into its name and arguments
+    :param context: the ExecutionContext to execute the command in
+    :param name: the name of the command (or code block) to execute
+    :param args: the arguments to execute the command with
+    :param full_command: the full text of the command (used for error reporting)
+    """
+
+    # if the command is declaring a point, skip execution
+    if name == "POINT":
         return
 
-    for name, block in globals.code_blocks.items():
-        if block.alias is not None:
-            if name.replace(block.alias + ".", "") == broken_cmd[0]:
-                block.execute(*broken_cmd[1:])
-                return
+    # update context attributes (full command, command, and args)
+    context.full_command = full_command
+    context.command_name = name
+    context.command_args = list(args)
 
-    # if the command is an internal command, execute the command
-    if broken_cmd[0] in INTERPRETER:
-        INTERPRETER[broken_cmd[0]](*broken_cmd[1:])
-        return
+    # the dispatch index binds every callable name (internal commands, blocks, and blocks without their module alias)
+    # to the function which executes it. See 'index_code_blocks'
+    handler = context.dispatch.get(name)
 
     # if the command is neither a block or a command, raise the unknown command error
-    browser.raise_error(
-        "UnknownCommandException",
-        "Unknown Command '{}'. Please Refer To The Manual For A List Of Commands!".format(cmd)
-    )
+    if handler is None:
+        browser.raise_error(
+            context, "UnknownCommandException",
+            "Unknown Command '{}'. Please Refer To The Manual For A List Of Commands!".format(
+                name if full_command is None else full_command
+            )
+        )
+
+    handler(context, *args)
 
 
-def conditional(condition, *actions):
+def index_code_blocks(context, code_blocks):
+    """
+    Binds the names of newly registered code blocks to the functions which execute them.
+    Must be called whenever code blocks are registered (see 'commands.import_module'), with only the new blocks,
+    so the cost of an import does not depend on the number of blocks which were imported before it.
+    The names of the new blocks must not already be registered (see 'rebuild_dispatch_index').
+    A block's full name takes priority over a block's name without its module alias (the first block registered
+    keeps that name), which takes priority over internal commands. Any name which could refer to more than one thing
+    is reported as a warning
+    :param context: the ExecutionContext whose dispatch index to update
+    :param code_blocks: the bindings between the full names of the new blocks and their CodeBlocks
+    """
+    index = context.dispatch
+    owners = context.dispatch_owners
+    collisions = []
+
+    def bind(name, block, priority):
+        index[name] = block.execute
+        owners[name] = (priority, "block '{}'".format(block.block_name))
+
+    # bind the names of imported blocks without their module alias
+    for block in code_blocks.values():
+        if block.alias is None:
+            continue
+
+        name = block.raw_block_name
+        owner = owners.get(name)
+        if owner is None:
+            bind(name, block, ALIASED_PRIORITY)
+            continue
+
+        collisions.append((name, owner[1], block.block_name))
+        if owner[0] == INTERNAL_PRIORITY:
+            bind(name, block, ALIASED_PRIORITY)
+
+    # bind the full names of all blocks
+    for name, block in code_blocks.items():
+        owner = owners.get(name)
+        if owner is not None:
+            collisions.append((name, owner[1], block.block_name))
+
+        bind(name, block, FULL_PRIORITY)
+
+    for collision in collisions:
+        if collision in context.reported_collisions:
+            continue
+        context.reported_collisions.add(collision)
+
+        name, first, second = collision
+        logging.warning(
+            "Name collision on '{}' between {} and block '{}'. '{}' will execute {}".format(
+                name, first, second, name, owners[name][1]
+            )
+        )
+
+
+def rebuild_dispatch_index(context):
+    """
+    Rebuilds the dispatch index from every registered code block. Only needed when a block replaces another block of
+    the same name, as the names of the replaced block may then refer to other blocks (or internal commands)
+    :param context: the ExecutionContext whose dispatch index to rebuild
+    """
+    context.dispatch = dict(INTERPRETER)
+    context.dispatch_owners = dict(INTERNAL_OWNERS)
+    index_code_blocks(context, context.code_blocks)
+
+
+@functools.lru_cache(maxsize=CONDITION_CACHE_SIZE)
+def compile_condition(condition):
+    """
+    Compiles a SWITCH condition into a code object. The most recently used conditions are cached by their source text
+    :param condition: the condition to compile
+    :return: the compiled condition
+    """
+    return compile(condition, "<SWITCH>", "eval")
+
+
+def conditional(context, condition, *actions):
     """
     The function which is bound to the SWITCH command
+    :param context: the ExecutionContext to execute the command in
     :param condition: the condition to evaluate
     :param actions: the command and arguments to execute if the statement evaluates to True.
     Optionally add a colon (:) followed by a command to execute if the condition evaluates to False
     """
-    def format_command(full_cmd: tuple):
-        cmd = full_cmd[0]
-        args = full_cmd[1:]
-        return cmd + " " + " ".join(['"{}"'.format(i) for i in args])
 
     # break the actions down into the True and False action (delimited by a colon)
     if ":" in actions:
@@ -68,14 +163,16 @@ def conditional(condition, *actions):
         true = actions
         false = None
 
-    # execute the appropriate action. Use the global memory heap when evaluating to allow access to variables
-    if eval(condition, globals.memory_heap):
-        interpret_command(format_command(true))
+    # execute the appropriate action. Use the memory heap when evaluating to allow access to variables
+    # the actions are already split into arguments, so they are executed directly
+    full_command = context.full_command
+    if eval(compile_condition(condition), context.memory_heap):
+        execute_command(context, true[0], true[1:], full_command)
     elif false is not None:
-        interpret_command(format_command(false))
+        execute_command(context, false[0], false[1:], full_command)
 
 
-def do_nothing():
+def do_nothing(context):
     """
     This is used for commands which are to have no action
     """
@@ -121,10 +218,15 @@ INTERPRETER = {
     "SENDKEYS": commands.send_keys,
     "SETDATE": commands.date_input,
     "EXTRACT": commands.extract_html,
+    "BLOCKURLS": commands.block_urls,
     "SWITCHNEWWINDOW": commands.switch_to_newly_opened_window,
     "SWITCHFIRSTWINDOW": commands.switch_to_original_window,
     "TOIFRAME": commands.switch_to_iframe,
     "FROMIFRAME": commands.switch_from_iframe,
     "READ": commands.read_file,
-    "COMPARE": commands.compare
+    "COMPARE": commands.compare,
+    "FOREACHROW": rows.foreach_row
 }
+
+# the owners of the names of the internal commands (see 'index_code_blocks')
+INTERNAL_OWNERS = {name: (INTERNAL_PRIORITY, "internal command '{}'".format(name)) for name in INTERPRETER}
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+from collections import namedtuple
+
+"""
+Page load profiles (the --load-profile option).
+A profile decides how long GOTO waits for a page (the WebDriver page load strategy), and which resources the browser
+does not download at all (images, fonts, and URL patterns). Functional scripts which only check the DOM do not need
+to wait for (or download) the assets of a page.
+Images and fonts are blocked through browser preferences (Firefox and Chrome), and URL patterns through the
+Chrome DevTools Protocol (Chrome only, as Selenium has no other way to block requests)
+"""
+
+# the URL patterns which block web fonts (Chrome has no preference to disable them)
+FONT_URL_PATTERNS = ("*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot")
+
+# the valid WebDriver page load strategies
+PAGE_LOAD_STRATEGIES = ("normal", "eager", "none")
+
+
+class LoadProfile(namedtuple("LoadProfile", ["name", "strategy", "images", "fonts", "blocked_urls", "timeout"])):
+    """
+    The settings which decide how pages are loaded
+    :param name: the name of the profile
+    :param strategy: the WebDriver page load strategy ('normal' waits for every resource of the page,
+    'eager' only for the DOM to be parsed)
+    :param images: if images are loaded
+    :param fonts: if web fonts are loaded
+    :param blocked_urls: the tuple of URL patterns which are never requested (* matches anything)
+    :param timeout: the longest time (in seconds) to wait for a page to load
+    """
+    __slots__ = ()
+
+
+# the built in profiles
+LOAD_PROFILES = {
+    "full": LoadProfile("full", "normal", True, True, (), 10),
+    "eager": LoadProfile("eager", "eager", True, True, (), 10),
+    "dom-only": LoadProfile("dom-only", "eager", False, False, (), 10)
+}
+
+
+def get_load_profile(name):
+    """
+    Returns a built in profile, or reads a profile from a JSON file.
+    The file may set any of 'strategy', 'images', 'fonts', 'blocked_urls' and 'timeout', and the rest are taken from
+    the built in profile named by 'base' (Default='full'). For example:
+    {"base": "dom-only", "blocked_urls": ["*doubleclick.net*", "*google-analytics.com*"]}
+    :param name: the name of a built in profile, or the path to a JSON file
+    :return: the LoadProfile
+    """
+    if name in LOAD_PROFILES:
+        return LOAD_PROFILES[name]
+
+    if not os.path.isfile(name):
+        raise ValueError("'{}' is neither a load profile ({}) nor a file".format(name, ", ".join(LOAD_PROFILES)))
+
+    try:
+        with open(name) as f:
+            settings = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError("Can not read load profile '{}' ({})".format(name, e))
+
+    if type(settings) is not dict:
+        raise ValueError("Load profile '{}' must be a JSON object".format(name))
+
+    base = LOAD_PROFILES.get(settings.pop("base", "full"))
+    unknown = set(settings) - set(LoadProfile._fields[1:])
+    if base is None or unknown or settings.get("strategy", base.strategy) not in PAGE_LOAD_STRATEGIES:
+        raise ValueError("Invalid load profile '{}'".format(name))
+
+    settings["blocked_urls"] = tuple(settings.get("blocked_urls", base.blocked_urls))
+    return base._replace(name=os.path.basename(name), **settings)
+
+
+def configure_options(browser, options, profile):
+    """
+    Applies the parts of a profile which must be set before the browser starts
+    :param browser: the name of the browser (see 'browser.BROWSERS')
+    :param options: the Selenium options of the browser, or None if the browser has no options
+    :param profile: the LoadProfile
+    """
+    if options is None:
+        if profile != LOAD_PROFILES["full"]:
+            logging.warning("The '{}' load profile is not supported by {}".format(profile.name, browser))
+        return
+
+    options.set_capability("pageLoadStrategy", profile.strategy)
+
+    if browser.lower() == "firefox":
+        if not profile.images:
+            options.set_preference("permissions.default.image", 2)
+        if not profile.fonts:
+            options.set_preference("gfx.downloadable_fonts.enabled", False)
+            options.set_preference("browser.display.use_document_fonts", 0)
+
+    elif browser.lower() == "chrome" and not profile.images:
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+
+
+def get_blocked_urls(browser, profile):
+    """
+    :return: the URL patterns a profile blocks in a browser (including fonts, if the browser can not disable them)
+    """
+    patterns = list(profile.blocked_urls)
+    if not profile.fonts and browser is not None and browser.lower() == "chrome":
+        patterns += FONT_URL_PATTERNS
+    return patterns
+
+
+def block_urls(driver, patterns):
+    """
+    Stops the browser from requesting URLs which match any of the patterns (replacing the patterns set before)
+    :param driver: the Selenium web driver
+    :param patterns: the list of URL patterns (* matches anything)
+    :return: if the browser supports blocking URLs
+    """
+    if not hasattr(driver, "execute_cdp_cmd"):
+        return False
+
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(patterns)})
+    return True
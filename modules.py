@@ -0,0 +1,231 @@
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+import pickle
+import threading
+from collections import namedtuple
+
+from blocks import CACHE_DIRECTORY
+from code_block import CodeBlock
+from instructions import compile_code
+
+"""
+The registry of imported files (the main script, and every file it IMPORTs).
+Each file is read and compiled once per process, no matter how many times (or by how many scripts) it is imported.
+With the bytecode cache enabled, the compiled file is also saved to the '__awtcache__' directory next to it,
+so later runs do not need to read or compile it again
+"""
+
+# the version of the saved module format. Increase this whenever the compiled instructions change
+MODULE_CACHE_VERSION = 2
+
+# the bindings between absolute paths and compiled Modules
+_modules = {}
+
+# the registry is shared by every execution context in the process
+_modules_lock = threading.Lock()
+
+
+class BlockDefinition(namedtuple("BlockDefinition", ["name", "args", "code", "start_line", "instructions", "points"])):
+    """
+    A compiled code block, before it is bound to a module alias
+    :param name: the name of the block (without a module alias)
+    :param args: the argument structure of the block
+    :param code: the code which is contained within the block
+    :param start_line: the line where the block starts
+    :param instructions: the compiled instructions of the code (see 'instructions.compile_code')
+    :param points: the bindings between point names and instruction indices
+    """
+    __slots__ = ()
+
+
+class Module:
+    def __init__(self, path, stamp, digest, main, blocks):
+        """
+        A compiled file
+        :param path: the absolute path to the file
+        :param stamp: the (modification time, size) of the file when it was compiled
+        :param digest: the SHA-1 digest of the file's contents
+        :param main: the BlockDefinition of the whole file (executed when the file is the main script)
+        :param blocks: the list of BlockDefinitions of the BLOCK sections in the file
+        """
+        self.path = path
+        self.stamp = stamp
+        self.digest = digest
+        self.main = main
+        self.blocks = blocks
+
+        # the CodeBlocks are shared by every import of the module. Their execution state is kept in Frames,
+        # so the same CodeBlock can be executed by several contexts at the same time
+        self.main_block = None
+        self.aliased_blocks = {}
+        self.lock = threading.Lock()
+
+    def get_main_block(self):
+        """
+        :return: the CodeBlock which executes the whole file
+        """
+        with self.lock:
+            if self.main_block is None:
+                self.main_block = create_code_block(self.path, "[MAIN]", self.main)
+            return self.main_block
+
+    def get_code_blocks(self, alias):
+        """
+        Returns the code blocks of the module, named as they are called after an IMPORT
+        :param alias: the alias the module is imported as (None for no alias)
+        :return: the bindings between block names (ie. alias.BlockName) and CodeBlocks
+        """
+        with self.lock:
+            if alias not in self.aliased_blocks:
+                prefix = "" if alias is None else alias + "."
+                self.aliased_blocks[alias] = {
+                    prefix + b.name: create_code_block(self.path, prefix + b.name, b) for b in self.blocks
+                }
+            return self.aliased_blocks[alias]
+
+    def to_dict(self):
+        return {"stamp": self.stamp, "digest": self.digest, "main": self.main, "blocks": self.blocks}
+
+
+def create_code_block(path, name, definition):
+    """
+    Creates a CodeBlock without compiling its code again
+    :param path: the file the block was read from
+    :param name: the full name of the block (including the module alias)
+    :param definition: the BlockDefinition of the block
+    """
+    return CodeBlock(
+        path, name, definition.args, definition.code, definition.start_line,
+        compiled=(definition.instructions, definition.points)
+    )
+
+
+def compile_module(path, lines, stamp, digest):
+    """
+    Compiles a file into a Module
+    :param path: the absolute path to the file
+    :param lines: the lines of the file
+    :param stamp: the (modification time, size) of the file
+    :param digest: the SHA-1 digest of the file's contents
+    """
+    blocks = []
+    code = []
+    block_start = -1
+
+    for i, line in enumerate(lines):
+        if line.startswith("BLOCK"):
+            block_start = i
+            code = []
+        code.append(line.rstrip("\n"))
+        if line.startswith("ENDBLOCK"):
+            args = code[0].split(" ")[1:]
+            args[-1] = args[-1].rstrip("\n")
+            blocks.append(BlockDefinition(args[0], args[1:], code[1:], block_start + 1, *compile_code(code[1:])))
+
+    main = BlockDefinition("[MAIN]", [], lines, 0, *compile_code(lines))
+    return Module(path, stamp, digest, main, blocks)
+
+
+def get_stamp(path):
+    """
+    :return: the (modification time, size) of a file
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_module(path, cache=False):
+    """
+    Returns the compiled Module of a file, reading and compiling it only if it has changed since it was last compiled
+    :param path: the path to the file
+    :param cache: if the compiled file should be loaded from (and saved to) its module cache
+    """
+    path = os.path.abspath(path)
+    stamp = get_stamp(path)
+
+    with _modules_lock:
+        module = _modules.get(path)
+        if module is not None and module.stamp == stamp:
+            return module
+
+        saved = load_module_cache(path) if cache else None
+        if saved is not None and saved.stamp == stamp:
+            _modules[path] = saved
+            return saved
+
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+
+        if saved is not None and saved.digest == digest:
+            # the file was touched, but not changed
+            module = saved
+            module.stamp = stamp
+        else:
+            # decoded the same way as opening the file in text mode
+            module = compile_module(path, io.TextIOWrapper(io.BytesIO(data)).readlines(), stamp, digest)
+
+        if cache:
+            save_module_cache(module)
+
+        _modules[path] = module
+        return module
+
+
+def get_cache_path(path):
+    """
+    Returns the path of the saved module cache for a file
+    :param path: the path to the file
+    """
+    return os.path.join(os.path.dirname(path), CACHE_DIRECTORY, os.path.basename(path) + ".module")
+
+
+def load_module_cache(path):
+    """
+    Loads the saved module cache of a file (if one exists, and was written by this Python and AWT version)
+    :param path: the absolute path to the file
+    :return: the saved Module, or None
+    """
+    cache_path = get_cache_path(path)
+
+    if not os.path.isfile(cache_path):
+        return None
+
+    try:
+        with open(cache_path, "rb") as f:
+            if f.read(len(importlib.util.MAGIC_NUMBER)) != importlib.util.MAGIC_NUMBER:
+                return None
+            saved = pickle.load(f)
+
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError, TypeError):
+        logging.warning("Ignoring unreadable module cache '{}'".format(cache_path))
+        return None
+
+    if type(saved) is not dict or saved.get("version") != MODULE_CACHE_VERSION:
+        return None
+
+    return Module(path, saved["stamp"], saved["digest"], saved["main"], saved["blocks"])
+
+
+def save_module_cache(module):
+    """
+    Saves a compiled Module to its module cache
+    :param module: the Module to save
+    """
+    cache_path = get_cache_path(module.path)
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        # write to a temporary file first, so a concurrent run never reads a partially written cache
+        temp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(importlib.util.MAGIC_NUMBER)
+            pickle.dump({"version": MODULE_CACHE_VERSION, **module.to_dict()}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+
+    except OSError:
+        logging.warning("Could not write module cache '{}'".format(cache_path))
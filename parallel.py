@@ -0,0 +1,289 @@
+import contextlib
+import logging
+import threading
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver import ActionChains
+from selenium.webdriver.remote.command import Command as DriverCommand
+
+import browser
+import profiler
+
+"""
+Parallel sections (PARALLEL ... BRANCH ... ENDPARALLEL).
+Each branch is executed on its own thread, in its own browser tab, with its own ExecutionContext.
+All tabs belong to the script's single web driver session, which can only execute one command at a time in one
+window. So the commands of the branches take turns (the tab of a branch is switched to before each of its commands),
+while everything between commands (waiting for elements, WAIT, and the interpreter itself) runs at the same time.
+A script which waits on several pages therefore waits for the slowest page, rather than for every page in turn.
+A WebDriver command which loads a page only returns once the page has loaded, and holds the session (and every other
+branch) until then. So GOTO only starts loading its page, and waits for it between commands (see 'get_in_tab').
+Other commands which load a page (BACK, FORWARD, REFRESH, and clicks on links) still hold every branch until the
+page has loaded.
+Branches should not switch into iframes, as every window switch returns the driver to the top level document
+"""
+
+# starts loading a page (arguments[0]) without waiting for it. Returns false if only the fragment of the URL changed,
+# which does not load a new document. Otherwise, the current document is marked, so READY_STATE_SCRIPT can tell it
+# apart from the new one
+NAVIGATE_SCRIPT = """
+var target = new URL(arguments[0], location.href);
+if (target.hash && target.href.split('#')[0] === location.href.split('#')[0]) {
+    location.href = target.href;
+    return false;
+}
+window.__awtNavigating = true;
+location.href = target.href;
+return true;
+"""
+
+# returns the ready state of the document in the current window, or null while the document which was navigated
+# away from (see NAVIGATE_SCRIPT) is still there
+READY_STATE_SCRIPT = "return window.__awtNavigating ? null : document.readyState;"
+
+# the ready states a page load waits for with each page load strategy
+READY_STATES = {
+    "normal": ["complete"],
+    "eager": ["interactive", "complete"],
+    "none": ["loading", "interactive", "complete"]
+}
+
+# the time (in seconds) between two checks of a loading page
+LOAD_POLL_INTERVAL = 0.05
+
+
+class TabSession:
+    def __init__(self, driver, load_profile):
+        """
+        Shares a web driver between the branches of a parallel section.
+        While the section runs, every command of the driver switches to the tab of the calling branch first
+        :param driver: the Selenium web driver of the script
+        :param load_profile: the LoadProfile the pages are loaded with (see load_profiles.py)
+        """
+        self.driver = driver
+        self.execute = driver.execute
+        self.get = driver.get
+        self.load_profile = load_profile
+        self.lock = threading.RLock()  # the driver's own commands (ie. 'window_handles') take it again
+
+        self.current = None     # the window the driver is currently in (None if unknown)
+        self.tabs = {}          # the bindings between branch thread ids and the windows they are executing in
+
+    def __enter__(self):
+        self.driver.execute = self.execute_in_tab
+        self.driver.get = self.get_in_tab
+        return self
+
+    def __exit__(self, *exc_info):
+        # the original 'execute' may itself be a wrapper (ie. the profiler's)
+        self.driver.execute = self.execute
+        self.driver.get = self.get
+
+    def switch(self, handle):
+        """
+        Switches the driver to a window (must hold the lock)
+        """
+        if handle != self.current:
+            self.execute(
+                DriverCommand.SWITCH_TO_WINDOW, {"handle": handle} if self.driver.w3c else {"name": handle}
+            )
+            self.current = handle
+
+    def execute_in_tab(self, command, params=None):
+        with self.lock:
+            handle = self.tabs.get(threading.get_ident())
+            if handle is not None:
+                self.switch(handle)
+
+            result = self.execute(command, params)
+
+            # the branch switched windows itself (ie. SWITCHNEWWINDOW), so it continues in that window
+            if command == DriverCommand.SWITCH_TO_WINDOW:
+                self.current = params.get("handle", params.get("name"))
+                if handle is not None:
+                    self.tabs[threading.get_ident()] = self.current
+
+            return result
+
+    def get_in_tab(self, url):
+        """
+        Loads a page in the tab of the calling branch. Unlike 'WebDriver.get', only starting the page load holds the
+        driver, so the other branches keep executing while the page loads
+        :param url: the URL of the page
+        """
+        if threading.get_ident() not in self.tabs:
+            self.get(url)
+            return
+
+        if not self.driver.execute_script(NAVIGATE_SCRIPT, url):
+            return
+
+        ready_states = READY_STATES[self.load_profile.strategy]
+        deadline = time.time() + self.load_profile.timeout
+        while self.driver.execute_script(READY_STATE_SCRIPT) not in ready_states:
+            if time.time() > deadline:
+                raise TimeoutException("Timed out after {}s loading '{}'".format(self.load_profile.timeout, url))
+            time.sleep(LOAD_POLL_INTERVAL)
+
+    def open_tab(self):
+        """
+        Opens a new (blank) tab
+        :return: the handle of the tab
+        """
+        with self.lock:
+            before = set(self.driver.window_handles)
+            self.driver.execute_script("window.open('about:blank', '_blank');")
+            opened = [h for h in self.driver.window_handles if h not in before]
+
+        if not opened:
+            raise RuntimeError("The browser did not open a new tab (is a popup blocker enabled?)")
+        return opened[0]
+
+    def close_tab(self, handle):
+        """
+        Closes a tab which was opened with 'open_tab'
+        :param handle: the handle of the tab
+        """
+        with self.lock:
+            self.switch(handle)
+            self.execute(DriverCommand.CLOSE)
+            self.current = None
+
+
+class TabLease:
+    def __init__(self, session, handle):
+        """
+        The tab of a branch. Like a browser borrowed from the daemon (see daemon.py), it is released rather than
+        closed when the branch is terminated (see 'browser.close_driver'), so the rest of the browser stays open
+        :param session: the TabSession the tab belongs to
+        :param handle: the handle of the tab
+        """
+        self.session = session
+        self.handle = handle
+        self.released = False
+
+    def release(self, healthy=True):
+        if self.released:
+            return
+        self.released = True
+
+        try:
+            self.session.close_tab(self.handle)
+        except Exception:
+            logging.warning("Could not close tab '{}'".format(self.handle))
+
+
+def create_branch_context(context, session, handle):
+    """
+    Creates the ExecutionContext of a branch, which executes in a tab of the script's browser
+    :param context: the ExecutionContext of the script
+    :param session: the TabSession of the parallel section
+    :param handle: the handle of the branch's tab
+    """
+    child = context.create_child()
+    child.driver = session.driver
+    child.driver_lease = TabLease(session, handle)
+    child.action_chain = ActionChains(session.driver)
+    child.original_window = handle
+    child.current_window = handle
+
+    # the tabs belong to the script's browser, so the daemon must also clear what the branches visited
+    child.visited_origins = context.visited_origins
+
+    # each branch records its lines in its own profiler, which is merged into the script's once the section ends
+    if context.profiler is not None:
+        child.profiler = context.profiler.branch()
+
+    # an in-page wait holds the driver for its whole duration, which would stop every other branch
+    child.observe_mutations = False
+    return child
+
+
+def run_branch(session, block, child, outcome):
+    """
+    Executes a single branch (on its own thread)
+    :param session: the TabSession of the parallel section
+    :param block: the CodeBlock of the branch
+    :param child: the ExecutionContext of the branch
+    :param outcome: the list to write the exit code of the branch to
+    """
+    session.tabs[threading.get_ident()] = child.current_window
+    exit_code = 0
+
+    with contextlib.nullcontext() if child.profiler is None else child.profiler.attach():
+        try:
+            block.execute(child)
+        except SystemExit as e:
+            # the branch was terminated (see 'browser.kill'), which already closed its tab
+            exit_code = 0 if e.code is None else e.code
+        except Exception:
+            logging.exception("Unhandled exception in {}".format(block.block_name))
+            exit_code = 1
+        finally:
+            child.artifacts.flush()
+            browser.close_driver(child)
+            session.tabs.pop(threading.get_ident(), None)
+
+    outcome.append(exit_code)
+
+
+def execute_parallel(context, parent_block, instruction):
+    """
+    Executes the branches of a parallel section at the same time, and waits for all of them to finish.
+    The variables each branch sets are copied back into the script (in branch order) once they have all finished
+    :param context: the ExecutionContext of the script
+    :param parent_block: the CodeBlock the section belongs to
+    :param instruction: the compiled ParallelBlock
+    """
+    # imported here to avoid a circular import (code blocks execute parallel sections)
+    from code_block import CodeBlock
+
+    start = time.time()
+    with TabSession(context.driver, context.load_profile) as session:
+        branches = []
+        for i, branch in enumerate(instruction.branches):
+            block = CodeBlock(
+                parent_block.filename, "{}[BRANCH {}]".format(parent_block.block_name, i + 1), [], branch.code,
+                parent_block.start_line + branch.line, compiled=(branch.instructions, branch.points)
+            )
+            child = create_branch_context(context, session, session.open_tab())
+            branches.append((block, child, dict(child.memory_heap), []))
+
+        threads = [
+            threading.Thread(
+                target=run_branch, args=(session, block, child, outcome), name="AWT-{}".format(block.block_name)
+            ) for block, child, _, outcome in branches
+        ]
+        for t in threads:
+            t.start()
+
+        # the script itself only waits for its branches
+        with profiler.waiting(context):
+            for t in threads:
+                t.join()
+
+    if context.profiler is not None:
+        for _, child, _, _ in branches:
+            context.profiler.merge(child.profiler)
+
+    # continue in the window the script was in before the section
+    context.driver.switch_to.window(context.current_window)
+    context.iframe_path = ()
+    context.element_cache.clear()
+
+    failed = []
+    for block, child, initial, outcome in branches:
+        for name, value in child.memory_heap.items():
+            if name != "__builtins__" and initial.get(name, initial) is not value:
+                context.memory_heap[name] = value
+
+        if not outcome or outcome[0] != 0:
+            failed.append(block.block_name)
+
+    logging.info("--------[ {} branches finished in {}s ]--------".format(
+        len(branches), round(time.time() - start, 2)
+    ))
+
+    if failed:
+        browser.raise_error(context, "BranchFailureException", "Failed branches: {}".format(", ".join(failed)))
@@ -0,0 +1,204 @@
+import functools
+import inspect
+import logging
+import pkgutil
+
+import selenium.common.exceptions as selenium_exceptions
+
+from instructions import Command, Template, UndefinedVariableError
+
+"""
+Command pipelining.
+Runs of consecutive read-only commands (SET, GETATTR, COUNT and TEST) are executed with a single script call, rather
+than (at least) one find and one get attribute round trip per command.
+If a command in the run can not be completed in the page (ie. its element has not appeared yet), the commands before it
+keep their results, and the rest of the run is executed one command at a time. That command then waits for its element,
+and reports its errors against its own line as usual
+"""
+
+# the names of the commands which only read from the page
+PIPELINE_COMMANDS = {"SET", "GETATTR", "COUNT", "TEST"}
+
+# executes the list of operations in arguments[0], stopping at the first one which can not be completed
+# each operation is [kind, CSS selector, index, attribute], where kind is one of "attribute", "count" or "test"
+# returns the list of results of the completed operations
+# (the attribute value, the number of matching elements, or null respectively)
+RUN_SCRIPT = """
+var getAttribute = ({});
+var operations = arguments[0];
+var results = [];
+for (var i = 0; i < operations.length; i++) {{
+    var elements;
+    try {{
+        elements = document.querySelectorAll(operations[i][1]);
+    }} catch (e) {{
+        break;
+    }}
+    if (operations[i][0] === "count") {{
+        results.push(elements.length);
+        continue;
+    }}
+    var element = elements[operations[i][2]];
+    if (element === undefined) {{
+        break;
+    }}
+    results.push(operations[i][0] === "attribute" ? getAttribute(element, operations[i][3]) : null);
+}}
+return results;
+"""
+
+
+def find_runs(instructions):
+    """
+    Finds the runs of consecutive read-only commands in a list of instructions
+    :param instructions: the compiled instructions (see instructions.py)
+    :return: the bindings between the index of the first instruction of each run and the index after its last one
+    """
+    runs = {}
+    start = None
+
+    for i, instruction in enumerate(instructions + (None,)):
+        if type(instruction) is Command and instruction.name in PIPELINE_COMMANDS:
+            if start is None:
+                start = i
+            continue
+
+        # only runs of at least two commands save any round trips
+        if start is not None and i - start > 1:
+            runs[start] = i
+        start = None
+
+    return runs
+
+
+@functools.lru_cache(maxsize=None)
+def get_run_script():
+    """
+    Builds the script which executes a run. Attributes are read with the same script Selenium uses for get_attribute,
+    so a pipelined SET reads exactly the same value as an unpipelined one
+    :return: the script, or None if Selenium's get attribute script could not be loaded (pipelining is disabled)
+    """
+    try:
+        atom = pkgutil.get_data("selenium.webdriver.remote", "getAttribute.js")
+    except OSError:
+        atom = None
+
+    if atom is None:
+        logging.warning("Could not load Selenium's get attribute script. Commands will not be pipelined")
+        return None
+
+    return RUN_SCRIPT.format(atom.decode("utf8"))
+
+
+@functools.lru_cache(maxsize=None)
+def get_signature(handler):
+    return inspect.signature(handler)
+
+
+def get_operations(context, run):
+    """
+    Prepares the operations of a run, stopping at the first command which must be executed on its own
+    (ie. an inner text search, invalid arguments, or a variable which is set earlier in the same run)
+    :param context: the ExecutionContext the run is executed in
+    :param run: the instructions of the run
+    :return: the list of (instruction, name, args, handler, bound arguments, operation) for each command
+    """
+
+    # imported here to avoid a circular import
+    import commands
+
+    kinds = {
+        commands.set_var: "attribute",
+        commands.get_attr: "attribute",
+        commands.count: "count",
+        commands.test: "test"
+    }
+
+    operations = []
+    assigned = set()
+
+    for instruction in run:
+        name, args = instruction.name, instruction.args
+        if instruction.dynamic:
+            # variables which are set by an earlier command in the run are not known yet
+            tokens = [t for t in (name,) + tuple(args) if type(t) is Template]
+            if any(n in assigned for t in tokens for n in t.parts[1::2]):
+                break
+
+            try:
+                name, args = instruction.render(context.memory_heap)
+            except UndefinedVariableError:
+                break
+
+        # the command may have been overridden by a code block with the same name
+        handler = context.dispatch.get(name)
+        if handler not in kinds:
+            break
+
+        try:
+            bound = get_signature(handler).bind(context, *args)
+        except TypeError:
+            break
+        bound.apply_defaults()
+        arguments = bound.arguments
+
+        if "%" in arguments["selector"]:
+            break
+
+        index = 0
+        if "index" in arguments:
+            try:
+                index = int(arguments["index"])
+            except ValueError:
+                break
+            if index < 0:
+                break
+
+        operations.append((
+            instruction, name, args, handler, arguments,
+            [kinds[handler], arguments["selector"], index, arguments.get("attribute")]
+        ))
+
+        if arguments.get("variable") is not None:
+            assigned.add(arguments["variable"])
+
+    return operations
+
+
+def execute_run(context, frame, run):
+    """
+    Executes a run of read-only commands with a single script call
+    :param context: the ExecutionContext to execute the run in
+    :param frame: the Frame of the code block the run belongs to
+    :param run: the instructions of the run (see 'find_runs')
+    :return: the number of instructions which were executed. The rest must be executed one at a time
+    """
+    script = get_run_script()
+    if script is None:
+        return 0
+
+    operations = get_operations(context, run)
+
+    # a single command gains nothing from being pipelined
+    if len(operations) < 2:
+        return 0
+
+    try:
+        results = context.driver.execute_script(script, [o[-1] for o in operations])
+    except selenium_exceptions.WebDriverException:
+        # the commands are executed one at a time instead, which raises any error against the correct line
+        logging.debug("Could not pipeline the commands on lines {} to {}".format(
+            frame.block.start_line + run[0].line, frame.block.start_line + run[-1].line
+        ))
+        return 0
+
+    for (instruction, name, args, handler, arguments, operation), result in zip(operations, results):
+        frame.line_number = instruction.line
+        context.full_command = instruction.source
+        context.command_name = name
+        context.command_args = list(args)
+
+        if arguments.get("variable") is not None:
+            context.memory_heap[arguments["variable"]] = result
+
+    return len(results)
@@ -0,0 +1,365 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+
+from instructions import Command, LanguageBlock, ParallelBlock, Template
+
+"""
+The profiler (enabled with --profile).
+It records the wall time of every executed line, command and code block call. That time is split into time spent
+waiting (element lookups waiting for the page, and WAIT commands), time spent in web driver calls, and the rest
+(the interpreter itself, variable substitution and Python language blocks).
+When execution ends, a sorted text report is written along with a collapsed stack file, which flame graph tools
+(ie. flamegraph.pl or speedscope) can read.
+The branches of a parallel section (see parallel.py) are recorded by profilers of their own, which are merged into
+the script's when the section ends. Their lines appear under the PARALLEL line, and the times of branches which ran
+at the same time add up (like the CPU time of threads). The totals at the top of the report only count the script's
+own thread, which waits for the branches
+"""
+
+# the categories of time which are recorded separately (the rest of the time of a line is spent in the interpreter)
+WAIT = "wait"
+DRIVER = "driver"
+
+
+class Sample:
+    __slots__ = ("profiler", "key", "source", "stack", "start", "wait", "driver", "inner")
+
+    def __init__(self, profiler, key, source, stack):
+        """
+        The recording of a single execution of a line (or of a command run from a language block with 'interpret')
+        :param profiler: the Profiler the sample belongs to
+        :param key: the (filename, line, command name) of the line
+        :param source: the text of the line
+        :param stack: the collapsed stack of the line (the line of each calling block, separated by semicolons)
+        """
+        self.profiler = profiler
+        self.key = key
+        self.source = source
+        self.stack = stack
+        self.start = 0
+        self.wait = 0.0         # time spent waiting by the line itself (not by the blocks it calls)
+        self.driver = 0.0       # time spent in driver calls by the line itself
+        self.inner = [0.0, 0.0, 0.0]    # total, wait and driver time of the lines of the blocks it calls
+
+    def __enter__(self):
+        self.profiler.samples.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.finish(self, time.perf_counter())
+
+
+class Profiler:
+    def __init__(self, filename):
+        """
+        The time spent executing a script
+        :param filename: the name of the report to write. The collapsed stacks are written to the same name,
+        with the extension '.folded'
+        """
+        self.filename = filename
+        self.start = time.perf_counter()
+        self.saved = False
+
+        self.samples = []       # the lines which are currently executing. The last sample is the innermost line
+        self.waiting = False    # if driver calls are currently part of a wait (ie. a MutationObserver wait)
+
+        # the bindings between (filename, line, command name) and [source, calls, total, self, wait, driver]
+        self.lines = {}
+        # the bindings between command names and [calls, total, wait, driver]
+        self.commands = {}
+        # the bindings between block names and [calls, total]
+        self.blocks = {}
+        # the bindings between collapsed stacks and seconds
+        self.stacks = {}
+        # the time spent outside of any line (ie. starting and closing the browser)
+        self.unattributed = {WAIT: 0.0, DRIVER: 0.0}
+        # the wait and driver time of parallel branches, which overlaps the time of the script's own thread
+        self.concurrent = {WAIT: 0.0, DRIVER: 0.0}
+
+        self.base_stack = None  # the collapsed stack the lines of a parallel branch are called from (see 'branch')
+        self.threads = {}       # the bindings between the ids of branch threads and their profilers (see 'attach')
+
+    def branch(self):
+        """
+        Creates the profiler of a parallel branch, whose lines are recorded as called by the line which is currently
+        executing (the PARALLEL line). It is added to this profiler by 'merge' once the branch has finished
+        :return: the new Profiler
+        """
+        child = Profiler(None)
+        child.base_stack = self.samples[-1].stack if self.samples else None
+
+        # the driver is only instrumented once (see 'instrument'), so every profiler shares the thread bindings
+        child.threads = self.threads
+        return child
+
+    @contextlib.contextmanager
+    def attach(self):
+        """
+        The context manager which records the driver calls of the current thread (a parallel branch) in this profiler
+        """
+        self.threads[threading.get_ident()] = self
+        try:
+            yield
+        finally:
+            self.threads.pop(threading.get_ident(), None)
+
+    def merge(self, child):
+        """
+        Adds the records of the profiler of a finished parallel branch (see 'branch') to this profiler
+        :param child: the Profiler of the branch
+        """
+        # the lines which were still executing (ie. when the branch was killed) are finished first
+        child.save()
+
+        for key, (source, *values) in child.lines.items():
+            line = self.lines.setdefault(key, [source, 0, 0.0, 0.0, 0.0, 0.0])
+            for i, value in enumerate(values, 1):
+                line[i] += value
+
+        for records, child_records in [(self.commands, child.commands), (self.blocks, child.blocks)]:
+            for name, values in child_records.items():
+                record = records.setdefault(name, [0] + [0.0] * (len(values) - 1))
+                for i, value in enumerate(values):
+                    record[i] += value
+
+        for stack, seconds in child.stacks.items():
+            self.stacks[stack] = self.stacks.get(stack, 0) + seconds
+
+        for category, suffix in [(WAIT, ";[wait]"), (DRIVER, ";[driver]")]:
+            self.unattributed[category] += child.unattributed[category]
+            self.concurrent[category] += child.unattributed[category] + sum(
+                seconds for stack, seconds in child.stacks.items() if stack.endswith(suffix)
+            )
+
+    def sample(self, context, name, source):
+        """
+        Returns the context manager which records a single execution of a line
+        :param context: the ExecutionContext the line is executed in
+        :param name: the name of the command on the line
+        :param source: the text of the line
+        """
+        block = context.current_code_block
+        filename = "<unknown>" if block is None else os.path.basename(block.filename)
+        frame = "{}:{} {}".format("<unknown>" if block is None else block.block_name, context.current_line, name)
+
+        # flame graph tools separate frames with semicolons
+        frame = frame.replace(";", ",")
+        parent = self.samples[-1].stack if self.samples else self.base_stack
+        stack = frame if parent is None else parent + ";" + frame
+
+        return Sample(self, (filename, context.current_line, name), source, stack)
+
+    def finish(self, sample, end):
+        """
+        Records a finished sample (see 'Sample.__exit__')
+        """
+        if self.saved or not self.samples or self.samples[-1] is not sample:
+            return
+        self.samples.pop()
+
+        total = end - sample.start
+        inner_total, inner_wait, inner_driver = sample.inner
+        wait = sample.wait + inner_wait
+        driver = sample.driver + inner_driver
+
+        # the time of the line includes the time of the blocks it calls
+        if self.samples:
+            parent = self.samples[-1].inner
+            parent[0] += total
+            parent[1] += wait
+            parent[2] += driver
+
+        line = self.lines.setdefault(sample.key, [sample.source, 0, 0.0, 0.0, 0.0, 0.0])
+        line[1] += 1
+        line[2] += total
+        line[3] += total - inner_total
+        line[4] += wait
+        line[5] += driver
+
+        command = self.commands.setdefault(sample.key[2], [0, 0.0, 0.0, 0.0])
+        command[0] += 1
+        command[1] += total
+        command[2] += wait
+        command[3] += driver
+
+        # only the time of the line itself is added to its stack, the blocks it calls add their own
+        other = max(total - inner_total - sample.wait - sample.driver, 0)
+        for suffix, seconds in [("", other), (";[wait]", sample.wait), (";[driver]", sample.driver)]:
+            if seconds > 0:
+                self.stacks[sample.stack + suffix] = self.stacks.get(sample.stack + suffix, 0) + seconds
+
+    def add(self, category, seconds):
+        """
+        Adds time spent waiting or in driver calls to the line which is currently executing
+        :param category: WAIT or DRIVER
+        :param seconds: the time spent
+        """
+        if not self.samples:
+            self.unattributed[category] += seconds
+        elif category == WAIT:
+            self.samples[-1].wait += seconds
+        else:
+            self.samples[-1].driver += seconds
+
+    def block_call(self, block, seconds):
+        """
+        Records a single call to a code block
+        :param block: the CodeBlock which was called
+        :param seconds: the time the call took
+        """
+        if self.saved:
+            return
+        b = self.blocks.setdefault(block.block_name, [0, 0.0])
+        b[0] += 1
+        b[1] += seconds
+
+    def instrument(self, driver):
+        """
+        Times every call a web driver makes to the browser.
+        Every WebDriver command (including the commands of elements) goes through 'execute', so only it is wrapped
+        :param driver: the Selenium web driver
+        """
+        execute = driver.execute
+
+        def timed_execute(*args, **kwargs):
+            # the calls of parallel branches are recorded by the branch's own profiler
+            profiler = self.threads.get(threading.get_ident(), self)
+
+            # driver calls made while waiting are counted as waiting
+            if profiler.waiting:
+                return execute(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return execute(*args, **kwargs)
+            finally:
+                profiler.add(DRIVER, time.perf_counter() - start)
+
+        driver.execute = timed_execute
+
+    @contextlib.contextmanager
+    def wait(self):
+        """
+        The context manager which counts the time spent inside of it as waiting
+        """
+        self.waiting = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.waiting = False
+            self.add(WAIT, time.perf_counter() - start)
+
+    def save(self):
+        """
+        Writes the report and collapsed stacks. The lines which are still executing (ie. when execution is killed
+        during a block call) are finished first
+        """
+        if self.saved:
+            return
+
+        end = time.perf_counter()
+        while self.samples:
+            self.finish(self.samples[-1], end)
+        self.saved = True
+
+        # the profiler of a parallel branch is merged into the script's rather than written
+        if self.filename is None:
+            return
+
+        try:
+            with open(self.filename, "w") as f:
+                f.write(self.build_report(end - self.start))
+
+            with open(os.path.splitext(self.filename)[0] + ".folded", "w") as f:
+                for stack, seconds in sorted(self.stacks.items()):
+                    # flame graph tools expect integer counts, so the time is written in microseconds
+                    f.write("{} {}\n".format(stack, int(seconds * 1000000)))
+
+        except OSError:
+            logging.warning("Could not write profile '{}'".format(self.filename))
+            return
+
+        logging.info("--------[ Profile written to '{}' ]--------".format(self.filename))
+
+    def build_report(self, duration):
+        """
+        Builds the text report
+        :param duration: the total time of the execution (in seconds)
+        """
+        wait = sum(s for k, s in self.stacks.items() if k.endswith(";[wait]")) + self.unattributed[WAIT]
+        driver = sum(s for k, s in self.stacks.items() if k.endswith(";[driver]")) + self.unattributed[DRIVER]
+        wait -= self.concurrent[WAIT]
+        driver -= self.concurrent[DRIVER]
+
+        def percent(seconds):
+            return "{:.1f}%".format(seconds / duration * 100 if duration > 0 else 0)
+
+        report = [
+            "Total: {:.3f}s".format(duration),
+            "  waiting:     {:>10.3f}s  {:>6}".format(wait, percent(wait)),
+            "  driver:      {:>10.3f}s  {:>6}".format(driver, percent(driver)),
+            "  interpreter: {:>10.3f}s  {:>6}".format(duration - wait - driver, percent(duration - wait - driver)),
+            "",
+            "Lines (sorted by total time, in seconds. Total includes the lines of called blocks, self does not)",
+            "{:>10} {:>10} {:>10} {:>10} {:>7}  {}".format("total", "self", "wait", "driver", "calls", "line")
+        ]
+        for (filename, line, name), (source, calls, total, own, w, d) in sorted(
+                self.lines.items(), key=lambda l: l[1][2], reverse=True
+        ):
+            report.append("{:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>7}  {}:{}  {}".format(
+                total, own, w, d, calls, filename, line, source
+            ))
+
+        report += [
+            "",
+            "Commands (sorted by total time, in seconds)",
+            "{:>10} {:>10} {:>10} {:>10} {:>7}  {}".format("total", "mean", "wait", "driver", "calls", "command")
+        ]
+        for name, (calls, total, w, d) in sorted(self.commands.items(), key=lambda c: c[1][1], reverse=True):
+            report.append("{:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>7}  {}".format(
+                total, total / calls, w, d, calls, name
+            ))
+
+        report += [
+            "",
+            "Block calls (sorted by total time, in seconds)",
+            "{:>10} {:>10} {:>7}  {}".format("total", "mean", "calls", "block")
+        ]
+        for name, (calls, total) in sorted(self.blocks.items(), key=lambda b: b[1][1], reverse=True):
+            report.append("{:>10.3f} {:>10.3f} {:>7}  {}".format(total, total / calls, calls, name))
+
+        return "\n".join(report) + "\n"
+
+
+def waiting(context):
+    """
+    Returns the context manager which counts the time spent inside of it as waiting (if the context is profiled)
+    :param context: the ExecutionContext which is waiting
+    """
+    if context.profiler is None:
+        return contextlib.nullcontext()
+    return context.profiler.wait()
+
+
+def describe(instruction):
+    """
+    Describes an instruction for the report
+    :param instruction: the compiled instruction (see instructions.py)
+    :return: the name of the command, and the text of the line
+    """
+    if type(instruction) is LanguageBlock:
+        return "LANGBLOCK " + instruction.language, "LANGBLOCK " + instruction.language
+
+    if type(instruction) is ParallelBlock:
+        return "PARALLEL", "PARALLEL ({} branches)".format(len(instruction.branches))
+
+    if type(instruction) is Command:
+        name = instruction.name
+        return name.source if type(name) is Template else name, instruction.source
+
+    return "[INVALID]", instruction.source
@@ -0,0 +1,284 @@
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import browser
+import daemon
+
+"""
+Data-driven execution (the FOREACHROW command).
+Rows are streamed from a CSV or JSON lines file, and the columns of each row are bound to the arguments of a code block
+by name. The block is compiled once, so a row costs a single block call rather than a loop of SETVAR, SWITCH and SKIPTO
+lines. Rows either run one after another in the script's own browser, or are fanned out across a pool of sessions
+(each with its own browser and ExecutionContext) with a pass or fail result for every row
+"""
+
+# the file extensions which are read as JSON lines (one object per line). Every other file is read as CSV
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+
+# the number of rows read ahead of the sessions, per session
+ROWS_PER_SESSION = 2
+
+
+class MissingColumnError(Exception):
+    def __init__(self, name):
+        super().__init__("Row has no column '{}'".format(name))
+        self.name = name
+
+
+class RowResult:
+    def __init__(self, row_number, passed, exit_code, duration, row):
+        """
+        The outcome of executing a code block for a single row
+        :param row_number: the number of the row in the file (starting at 1)
+        :param passed: if the block finished without an error
+        :param exit_code: the exit code the row finished with (see 'Exit Codes' in the README)
+        :param duration: the time it took to execute the row (in seconds)
+        :param row: the bindings between the column names and values of the row
+        """
+        self.row_number = row_number
+        self.passed = passed
+        self.exit_code = exit_code
+        self.duration = duration
+        self.row = row
+
+    def to_dict(self):
+        return {
+            "row": self.row_number,
+            "passed": self.passed,
+            "exit_code": self.exit_code,
+            "duration": round(self.duration, 3),
+            "data": self.row
+        }
+
+
+def read_rows(path, encoding="utf8"):
+    """
+    Streams the rows of a CSV (with a header line) or JSON lines file. Only one row is held in memory at a time
+    :param path: the path to the file
+    :param encoding: the encoding of the file
+    :return: the generator of (row number, bindings between column names and values) of each row
+    """
+    with open(path, encoding=encoding, newline="") as f:
+        if not path.lower().endswith(JSON_LINES_EXTENSIONS):
+            yield from enumerate(csv.DictReader(f), 1)
+            return
+
+        row_number = 0
+        for line in f:
+            if not line.strip():
+                continue
+
+            row_number += 1
+            row = json.loads(line)
+            if type(row) is not dict:
+                raise ValueError("Line {} of '{}' is not a JSON object".format(row_number, path))
+            yield row_number, row
+
+
+def bind_arguments(block, row):
+    """
+    Builds the arguments of a code block from the columns of a row (by name).
+    Arguments without a column use their default value
+    :param block: the CodeBlock to execute
+    :param row: the bindings between the column names and values of the row
+    :return: the list of argument values
+    """
+    args = []
+    for name in block.block_args:
+        if row.get(name) is not None:
+            args.append(row[name])
+        elif name in block.block_default_arg_values:
+            args.append(block.block_default_arg_values[name])
+        else:
+            raise MissingColumnError(name)
+    return args
+
+
+def start_session(context):
+    """
+    Starts the browser of a session the same way the browser of the script was started
+    :param context: the ExecutionContext of the session (see 'ExecutionContext.create_child')
+    """
+    if context.daemon_address is not None:
+        daemon.borrow_browser(context, context.daemon_address, context.browser_name, context.headless)
+    else:
+        browser.initialize_browser(context, context.browser_name, context.headless)
+
+
+class SessionPool:
+    def __init__(self, context, block, sessions, record):
+        """
+        Executes rows across a pool of sessions, each with its own browser and ExecutionContext.
+        A failed row only closes the browser of its own session, which starts a new one for its next row
+        :param context: the ExecutionContext of the script (which the sessions are created from)
+        :param block: the CodeBlock to execute for each row
+        :param sessions: the number of sessions
+        :param record: the function which records the RowResult of each row
+        """
+        self.context = context
+        self.block = block
+        self.record = record
+        self.rows = queue.Queue(sessions * ROWS_PER_SESSION)
+        self.threads = [
+            threading.Thread(target=self.run, name="AWT-Row-{}".format(i), daemon=True) for i in range(sessions)
+        ]
+
+    def __enter__(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        # one stop signal per session, after the rows which are still queued
+        for _ in self.threads:
+            self.rows.put(None)
+        for t in self.threads:
+            t.join()
+
+    def submit(self, row_number, row):
+        """
+        Queues a row (waiting for space if the sessions have fallen behind the file)
+        """
+        self.rows.put((row_number, row))
+
+    def run(self):
+        session = None
+
+        while True:
+            item = self.rows.get()
+            if item is None:
+                break
+
+            row_number, row = item
+            start = time.time()
+            exit_code = 0
+
+            try:
+                args = bind_arguments(self.block, row)
+
+                if session is None:
+                    session = self.context.create_child()
+                    start_session(session)
+
+                self.block.execute(session, *args)
+
+            except MissingColumnError as e:
+                logging.error("Row {}: {}".format(row_number, e))
+                exit_code = 2
+
+            except SystemExit as e:
+                # the row was terminated (see 'browser.kill'), which closed the browser of the session
+                exit_code = 0 if e.code is None else e.code
+                session = None
+
+            except Exception:
+                logging.exception("Row {}: Unhandled exception".format(row_number))
+                exit_code = 1
+                if session is not None and session.driver is not None:
+                    browser.close_driver(session, healthy=False)
+                session = None
+
+            self.record(RowResult(row_number, exit_code == 0, exit_code, time.time() - start, row))
+
+        if session is not None:
+            session.artifacts.flush()
+            browser.close_driver(session)
+
+
+def foreach_row(context, path, block_name, sessions=0, results=None, encoding="utf8"):
+    """
+    The function which is bound to the FOREACHROW command.
+    Executes a code block once for each row of a CSV or JSON lines file, with the columns bound to its arguments
+    :param context: the ExecutionContext to execute the command in
+    :param path: the path to the file of rows
+    :param block_name: the name of the code block to execute
+    :param sessions: the number of browser sessions to spread the rows across. 0 (the default) executes the rows
+    one after another in the script's own browser, where (as anywhere else) the first error ends the script
+    :param results: the name of a JSON lines file to write the result of each row to (Default=None)
+    :param encoding: the encoding of the file of rows
+    :return: the list of RowResults
+    """
+    handler = context.dispatch.get(block_name)
+    block = getattr(handler, "__self__", None)
+    if not hasattr(block, "block_args"):
+        browser.raise_error(context, "UnknownBlockException", "'{}' is not a code block".format(block_name))
+
+    path = os.path.join(context.cwd, path)
+    sessions = int(sessions)
+    if not os.path.isfile(path):
+        browser.raise_error(context, "FileNotFoundException", "Can not find rows file '{}'".format(path))
+
+    if sessions > 0 and context.browser_name is None:
+        browser.raise_error(
+            context, "SessionException", "Can not start sessions, as the browser of the script was not started by AWT"
+        )
+
+    # the results are written as they finish, so they are not lost if the script is terminated
+    results_file = None if results is None else open(os.path.join(context.cwd, results), "w")
+    row_results = []
+    lock = threading.Lock()
+
+    def record(result):
+        with lock:
+            row_results.append(result)
+            if results_file is not None:
+                results_file.write(json.dumps(result.to_dict()) + "\n")
+                results_file.flush()
+
+        logging.log(
+            logging.INFO if result.passed else logging.ERROR,
+            "Row {} {} in {}s".format(
+                result.row_number, "PASSED" if result.passed else "FAILED", round(result.duration, 2)
+            )
+        )
+
+    start = time.time()
+    try:
+        rows = read_rows(path, encoding)
+
+        if sessions == 0:
+            # a checkpoint inside a row could not resume the rows after it
+            context.current_frame.calling = False
+
+            for row_number, row in rows:
+                try:
+                    args = bind_arguments(block, row)
+                except MissingColumnError as e:
+                    browser.raise_error(context, "MissingColumnException", "Row {}: {}".format(row_number, e))
+
+                row_start = time.time()
+                block.execute(context, *args)
+                record(RowResult(row_number, True, 0, time.time() - row_start, row))
+        else:
+            with SessionPool(context, block, sessions, record) as pool:
+                for row_number, row in rows:
+                    pool.submit(row_number, row)
+
+    except (csv.Error, ValueError) as e:
+        browser.raise_error(context, "InvalidRowsException", "Can not read rows from '{}' ({})".format(path, e))
+
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+    row_results.sort(key=lambda r: r.row_number)
+    failed = [r for r in row_results if not r.passed]
+
+    (logging.error if failed else logging.info)("--------[ {} rows passed, {} failed in {}s ]--------".format(
+        len(row_results) - len(failed), len(failed), round(time.time() - start, 2)
+    ))
+
+    if failed:
+        browser.raise_error(
+            context, "RowFailureException", "{} of {} rows failed (rows {}{})".format(
+                len(failed), len(row_results), ", ".join(str(r.row_number) for r in failed[:20]),
+                ", ..." if len(failed) > 20 else ""
+            )
+        )
+
+    return row_results
@@ -0,0 +1,402 @@
+"""
+Runs many AWT files in parallel, each in its own interpreter process with its own headless browser
+
+usage: runner.py [-h] -b {firefox,chrome,edge,ie,opera} [-w WORKERS] [-o LOG_DIR] [-t TIMEOUT] [-c] [-d DAEMON]
+                 [-a ARGS] [-j SUMMARY] [--load-profile LOAD_PROFILE] [-s [STATE]] [-f]
+                 scripts [scripts ...]
+
+positional arguments:
+  scripts               The files to execute. Directories are searched (recursively) for .awt files, and glob
+                        patterns (ie. tests/**/*.awt) are expanded
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -b, --browser         The web browser to execute the tests in
+  -w, --workers         The number of scripts to execute at the same time (Default=number of CPUs)
+  -o, --log-dir         The directory to write the log of each script to (Default=awt_logs)
+  -t, --timeout         The maximum time (in seconds) a single script may run for before it is killed
+  -c, --bytecode-cache  Passed on to each script (see awt.py)
+  -d, --daemon          Passed on to each script (see awt.py)
+  -a, --args            Passed on to each script (see awt.py)
+  -j, --summary         The name of a JSON file to write the summary of the run to
+  --load-profile        Passed on to each script (see awt.py)
+  -s, --state           Only executes the scripts whose files (or the files they IMPORT, READ or FOREACHROW) have
+                        changed, or which failed, since the last run. The results are kept in the given file
+                        (Default=awt_state.json)
+  -f, --force           Executes every script, even if it has not changed since it last passed (the state file is
+                        still updated)
+"""
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.parse
+
+import browser
+import incremental
+
+# the path to the main script which executes a single AWT file
+AWT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "awt.py")
+
+# the exit code reported for scripts which exceeded the timeout
+TIMEOUT_EXIT_CODE = -1
+
+# the arguments which start a script in a process group of its own
+if os.name == "nt":
+    NEW_PROCESS_GROUP = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    NEW_PROCESS_GROUP = {"start_new_session": True}
+
+
+class ScriptResult:
+    def __init__(self, script, exit_code, duration, log_file, skipped=False):
+        """
+        The outcome of executing a single script
+        :param script: the path to the script
+        :param exit_code: the exit code of the interpreter process (see 'Exit Codes' in the README)
+        :param duration: the time it took to execute the script (in seconds)
+        :param log_file: the file the output of the script was written to
+        :param skipped: if the script was not executed, as it has not changed since it last passed
+        (the rest of the result is from that run)
+        """
+        self.script = script
+        self.exit_code = exit_code
+        self.duration = duration
+        self.log_file = log_file
+        self.skipped = skipped
+
+    @property
+    def passed(self):
+        return self.exit_code == 0
+
+    def to_dict(self):
+        return {
+            "script": self.script,
+            "exit_code": self.exit_code,
+            "duration": round(self.duration, 3),
+            "log_file": self.log_file,
+            "skipped": self.skipped
+        }
+
+
+def find_scripts(paths):
+    """
+    Expands a list of files, directories and glob patterns into the list of scripts to execute
+    :param paths: the files, directories and glob patterns
+    :return: the sorted list of scripts (without duplicates)
+    """
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, "**", "*.awt"), recursive=True)
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            matches = glob.glob(path, recursive=True)
+
+        if not matches:
+            logging.warning("No scripts match '{}'".format(path))
+
+        scripts.extend(os.path.abspath(m) for m in matches)
+
+    return sorted(set(scripts))
+
+
+def get_log_file(log_dir, script):
+    """
+    Returns the log file for a script. The path is used in the name, so scripts with the same name do not collide
+    :param log_dir: the directory to write logs to
+    :param script: the absolute path to the script
+    """
+    # the separators are escaped (rather than replaced), so 'a/b_c.awt' and 'a_b/c.awt' do not collide either
+    name = urllib.parse.quote(os.path.relpath(script, os.getcwd()), safe="")
+    return os.path.join(log_dir, name + ".log")
+
+
+def build_command(script, options):
+    """
+    Builds the command which executes a single script in a new interpreter process
+    :param script: the path to the script
+    :param options: the parsed command line arguments of the runner
+    """
+    command = [sys.executable, AWT_PATH, script, "-b", options.browser, "-e"]
+
+    if options.bytecode_cache:
+        command.append("-c")
+
+    if options.daemon is not None:
+        command.extend(["-d", options.daemon])
+
+    if options.args is not None:
+        command.extend(["-a", options.args])
+
+    if options.load_profile is not None:
+        command.extend(["--load-profile", options.load_profile])
+
+    return command
+
+
+def kill_process_group(process):
+    """
+    Kills a script, along with every process it started (ie. its web driver and browser), and waits for it to end
+    :param process: the Popen of the script (started with NEW_PROCESS_GROUP)
+    """
+    if os.name == "nt":
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    process.kill()
+    process.wait()
+
+
+def run_script(script, options):
+    """
+    Executes a single script in its own interpreter process, and writes its output to its log file
+    :param script: the path to the script
+    :param options: the parsed command line arguments of the runner
+    :return: the ScriptResult of the script
+    """
+    log_file = get_log_file(options.log_dir, script)
+    start = time.time()
+
+    with open(log_file, "wb") as f:
+        # each script runs in its own process group, so the web driver and browser it starts can be killed with it
+        process = subprocess.Popen(
+            build_command(script, options), stdout=f, stderr=subprocess.STDOUT, cwd=os.path.dirname(script),
+            **NEW_PROCESS_GROUP
+        )
+        try:
+            exit_code = process.wait(timeout=options.timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_group(process)
+            exit_code = TIMEOUT_EXIT_CODE
+        except BaseException:
+            # the scripts do not receive the runner's Ctrl+C (they are in their own process groups)
+            kill_process_group(process)
+            raise
+
+    return ScriptResult(script, exit_code, time.time() - start, log_file)
+
+
+def run_scripts(scripts, options):
+    """
+    Executes scripts across a pool of worker processes
+    :param scripts: the paths to the scripts
+    :param options: the parsed command line arguments of the runner
+    :return: the list of ScriptResults (in the same order as the scripts)
+    """
+    os.makedirs(options.log_dir, exist_ok=True)
+    results = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=options.workers) as pool:
+        futures = {pool.submit(run_script, s, options): s for s in scripts}
+
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[result.script] = result
+
+            logging.log(
+                logging.INFO if result.passed else logging.ERROR,
+                "{} {} in {}s (exit code {})".format(
+                    "PASSED" if result.passed else "FAILED",
+                    os.path.relpath(result.script), round(result.duration, 2), result.exit_code
+                )
+            )
+
+    return [results[s] for s in scripts]
+
+
+def get_outcome_options(options, graph):
+    """
+    :param options: the parsed command line arguments of the runner
+    :param graph: the DependencyGraph which hashes the files the options name (see incremental.py)
+    :return: the options which change the outcome of a script (a script runs again when they change)
+    """
+    outcome_options = [options.browser, options.args, options.load_profile]
+
+    # a load profile may be a JSON file, whose settings change the outcome as much as its name
+    if options.load_profile is not None and os.path.isfile(options.load_profile):
+        outcome_options.append(graph.get_hash(options.load_profile))
+
+    return outcome_options
+
+
+def select_scripts(scripts, options, state):
+    """
+    Decides which scripts need to be executed in an incremental run
+    :param scripts: the paths to the scripts
+    :param options: the parsed command line arguments of the runner
+    :param state: the bindings between script paths and their last results (see 'incremental.load_state')
+    :return: the bindings between script paths and their digests (None if their inputs can not be found),
+    and the list of ScriptResults of the scripts which do not need to be executed
+    """
+    graph = incremental.DependencyGraph()
+    outcome_options = get_outcome_options(options, graph)
+    digests = {}
+    skipped = []
+
+    for script in scripts:
+        digest = graph.get_digest(script, outcome_options)
+        last = state.get(script)
+
+        if not options.force and digest is not None and last is not None and last["digest"] == digest \
+                and last["exit_code"] == 0:
+            skipped.append(ScriptResult(script, 0, last["duration"], last["log_file"], skipped=True))
+        else:
+            digests[script] = digest
+
+    return digests, skipped
+
+
+def summarize(results, duration):
+    """
+    Logs the summary of a run, and returns the exit code of the runner
+    :param results: the list of ScriptResults
+    :param duration: the wall clock time of the whole run (in seconds)
+    :return: 0 if every script passed, otherwise the highest exit code of any script (or 1 for a timeout)
+    """
+    failed = [r for r in results if not r.passed]
+    executed = [r for r in results if not r.skipped]
+
+    logging.info("--------[ Summary ]--------")
+    for r in sorted(executed, key=lambda r: r.duration, reverse=True):
+        logging.info("{:>8}s  {:>4}  {}".format(round(r.duration, 2), r.exit_code, os.path.relpath(r.script)))
+
+    logging.log(
+        logging.ERROR if failed else logging.INFO,
+        "--------[ {} passed, {} failed, {} unchanged in {}s ({}s of script time) ]--------".format(
+            len(executed) - len(failed), len(failed), len(results) - len(executed), round(duration, 2),
+            round(sum(r.duration for r in executed), 2)
+        )
+    )
+
+    if not failed:
+        return 0
+    return max(max(r.exit_code for r in failed), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Executes many scripts to test websites in parallel')
+
+    parser.add_argument(
+        'scripts', nargs="+",
+        help="The files to execute. Directories are searched (recursively) for .awt files, "
+             "and glob patterns are expanded"
+    )
+    parser.add_argument(
+        "-b", "--browser", help="The web browser to execute the tests in", choices=browser.BROWSERS.keys(),
+        required=True
+    )
+    parser.add_argument(
+        "-w", "--workers", help="The number of scripts to execute at the same time (Default=number of CPUs)",
+        type=int, default=os.cpu_count()
+    )
+    parser.add_argument(
+        "-o", "--log-dir", help="The directory to write the log of each script to (Default=awt_logs)",
+        default="awt_logs"
+    )
+    parser.add_argument(
+        "-t", "--timeout", help="The maximum time (in seconds) a single script may run for before it is killed",
+        type=float
+    )
+    parser.add_argument(
+        "-c", "--bytecode-cache", help="Passed on to each script (see awt.py)", action="store_true"
+    )
+    parser.add_argument(
+        "-d", "--daemon", help="Passed on to each script (see awt.py)"
+    )
+    parser.add_argument(
+        "-a", "--args", help="Passed on to each script (see awt.py)"
+    )
+    parser.add_argument(
+        "-j", "--summary", help="The name of a JSON file to write the summary of the run to"
+    )
+    parser.add_argument(
+        "--load-profile", help="Passed on to each script (see awt.py)"
+    )
+    parser.add_argument(
+        "-s", "--state",
+        help="Only executes the scripts whose files (or the files they IMPORT, READ or FOREACHROW) have changed, "
+             "or which failed, since the last run. The results are kept in the given file (Default=awt_state.json)",
+        nargs="?", const="awt_state.json"
+    )
+    parser.add_argument(
+        "-f", "--force",
+        help="Executes every script, even if it has not changed since it last passed (the state file is still "
+             "updated)",
+        action="store_true"
+    )
+
+    options = parser.parse_args()
+    options.log_dir = os.path.abspath(options.log_dir)
+
+    # each script runs in the directory it is in, so a profile file must be found from here
+    if options.load_profile is not None and os.path.isfile(options.load_profile):
+        options.load_profile = os.path.abspath(options.load_profile)
+
+    logging.basicConfig(
+        format='(%(asctime)s) [%(levelname)-8.8s] %(message)s',
+        level=logging.INFO,
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    scripts = find_scripts(options.scripts)
+
+    # in an incremental run, only the scripts which changed (or failed) since the last run are executed
+    state = {}
+    digests = {s: None for s in scripts}
+    skipped = []
+    if options.state is not None:
+        state = incremental.load_state(options.state)
+        digests, skipped = select_scripts(scripts, options, state)
+        for r in skipped:
+            logging.info("SKIPPED {} (unchanged since it last passed)".format(os.path.relpath(r.script)))
+
+    logging.info("Executing {} scripts with {} workers...".format(len(digests), options.workers))
+
+    start = time.time()
+    results = run_scripts(list(digests), options)
+    duration = time.time() - start
+
+    if options.state is not None:
+        for r in results:
+            state[r.script] = {
+                "digest": digests[r.script],
+                "exit_code": r.exit_code,
+                "duration": round(r.duration, 3),
+                "log_file": r.log_file,
+                "finished": datetime.datetime.now().isoformat()
+            }
+        incremental.save_state(options.state, state)
+
+    # report every script in the order they were found
+    order = {s: i for i, s in enumerate(scripts)}
+    results = sorted(results + skipped, key=lambda r: order[r.script])
+
+    if options.summary is not None:
+        with open(options.summary, "w") as f:
+            json.dump({
+                "started": datetime.datetime.fromtimestamp(start).isoformat(),
+                "duration": round(duration, 3),
+                "browser": options.browser,
+                "results": [r.to_dict() for r in results]
+            }, f, indent=4)
+
+    sys.exit(summarize(results, duration))
+
+
+if __name__ == '__main__':
+    main()
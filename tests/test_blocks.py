@@ -0,0 +1,87 @@
+"""
+Tests that errors in Python language blocks report the line of the script they are on (see 'blocks.compile_python'),
+whether the compiled code is cached or not
+"""
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import browser
+from context import ExecutionContext
+from fake_driver import FakeDriver, build_page
+
+
+class LanguageBlockLineTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "main.awt")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def execute(self, lines):
+        """
+        Executes a script which is expected to fail
+        :param lines: the lines of the script
+        :return: the text logged by the script
+        """
+        with open(self.path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+        context = ExecutionContext(self.path)
+        browser.attach_driver(context, FakeDriver(build_page(1)))
+
+        with self.assertLogs(level=logging.ERROR) as logs:
+            with self.assertRaises(SystemExit) as exit_info:
+                context.execute()
+
+        self.assertEqual(exit_info.exception.code, 2)
+        return "\n".join(logs.output)
+
+    def assertReportsLine(self, output, line):
+        self.assertIn('File "{}", line {}'.format(self.path, line), output)
+
+    def test_syntax_error(self):
+        output = self.execute([
+            "SETVAR a 1",
+            "LANGBLOCK python",
+            "x = 1",
+            "y = (",
+            "ENDLANGBLOCK"
+        ])
+        self.assertIn("SyntaxError", output)
+        self.assertReportsLine(output, 4)
+
+    def test_runtime_error(self):
+        output = self.execute([
+            "SETVAR a 1",
+            "LANGBLOCK python",
+            "x = 1",
+            "",
+            "y = 1 / 0",
+            "ENDLANGBLOCK"
+        ])
+        self.assertIn("ZeroDivisionError", output)
+        self.assertReportsLine(output, 5)
+
+    def test_runtime_error_with_variables(self):
+        # code which inputs variables is compiled without the cache
+        output = self.execute([
+            "SETVAR a 0",
+            "LANGBLOCK python",
+            "y = 1 / ${a}",
+            "ENDLANGBLOCK"
+        ])
+        self.assertIn("ZeroDivisionError", output)
+        self.assertReportsLine(output, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,306 @@
+"""
+Tests the session pool of the warm-browser daemon (daemon.py) with fake web drivers, which are started in place of
+real browsers
+"""
+import logging
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import selenium.common.exceptions as selenium_exceptions
+
+import daemon
+import load_profiles
+from fake_driver import FakeDriver, build_page
+
+
+class PoolDriver(FakeDriver):
+    # the number of drivers which have been started
+    started = 0
+
+    def __init__(self):
+        """
+        A fake web driver with cookies and storage, which can be made unresponsive
+        """
+        super().__init__(build_page(1))
+        PoolDriver.started += 1
+        self.session_id = "session-{}".format(PoolDriver.started)
+        self.command_executor = mock.Mock(_url="http://127.0.0.1:4444")
+        self.capabilities = {"browserName": "firefox"}
+        self.cookies = {}       # the bindings between origins and their cookies
+        self.storage = {}       # the bindings between origins and their localStorage
+        self.responding = True
+        self.closed = False
+
+    @property
+    def current_window_handle(self):
+        if not self.responding:
+            raise selenium_exceptions.WebDriverException("The browser is not responding")
+        return self._current_window_handle
+
+    @current_window_handle.setter
+    def current_window_handle(self, handle):
+        self._current_window_handle = handle
+
+    def visit(self, url):
+        """
+        Navigates to a page, which sets a cookie and a localStorage item
+        """
+        self.get(url)
+        origin = daemon.b.get_origin(url)
+        self.cookies[origin] = {"session": "1"}
+        self.storage[origin] = {"item": "1"}
+
+    def execute_script(self, script, *args):
+        if "localStorage.clear()" in script:
+            self.storage.pop(daemon.b.get_origin(self.current_url), None)
+        return super().execute_script(script, *args)
+
+    def delete_all_cookies(self):
+        self.cookies.pop(daemon.b.get_origin(self.current_url), None)
+
+    def quit(self):
+        self.closed = True
+
+
+class ChromiumPoolDriver(PoolDriver):
+    def __init__(self):
+        """
+        A fake web driver which speaks the DevTools Protocol, so it can clear the storage of any origin
+        """
+        super().__init__()
+        self.capabilities = {"browserName": "chrome"}
+        self.history = {}       # the bindings between window handles and the URLs they visited
+
+    def visit(self, url):
+        super().visit(url)
+        self.history.setdefault(self.current_window_handle, []).append(url)
+
+    def execute_cdp_cmd(self, command, params):
+        if command == "Page.getNavigationHistory":
+            return {"entries": [{"url": u} for u in self.history.get(self.current_window_handle, [])]}
+        if command == "Page.getFrameTree":
+            return {"frameTree": {"frame": {"url": self.current_url}}}
+        if command == "Network.clearBrowserCookies":
+            self.cookies.clear()
+        if command == "Storage.clearDataForOrigin":
+            self.storage.pop(params["origin"], None)
+        return {}
+
+
+class SessionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.driver_class = PoolDriver
+        self.drivers = []
+
+        def create_driver(browser, headless=False, load_profile=None):
+            driver = self.driver_class()
+            self.drivers.append(driver)
+            return driver
+
+        patcher = mock.patch.object(daemon.b, "create_driver", side_effect=create_driver)
+        self.create_driver = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # sessions are replaced in background threads, which must not outlive the test (and its fake drivers)
+        threads = set(threading.enumerate())
+        self.addCleanup(lambda: [t.join(5) for t in threading.enumerate() if t not in threads])
+
+    def create_pool(self, **options):
+        pool = daemon.SessionPool(**options)
+        self.addCleanup(pool.close)
+        return pool
+
+    def wait_for_idle(self, pool, browser, count, headless=False):
+        """
+        Waits for sessions which are started in the background
+        :param count: the number of idle sessions to wait for
+        """
+        key = (browser, headless, load_profiles.LOAD_PROFILES["full"])
+        with pool.condition:
+            self.assertTrue(pool.condition.wait_for(lambda: len(pool.idle.get(key, [])) >= count, timeout=5))
+
+    def driver_of(self, lease):
+        return next(d for d in self.drivers if d.session_id == lease["session_id"])
+
+    def test_acquire_and_release(self):
+        pool = self.create_pool(sessions=2)
+        pool.warm("firefox")
+        self.assertEqual(len(self.drivers), 2)
+
+        first = pool.acquire("firefox")
+        second = pool.acquire("firefox")
+        self.assertNotEqual(first["session_id"], second["session_id"])
+        self.assertEqual(pool.status()["firefox (full load profile)"], {"open": 2, "idle": 0, "leased": 2})
+
+        # the warm sessions are borrowed, rather than new ones started
+        self.assertEqual(len(self.drivers), 2)
+
+        pool.release(first["lease_id"])
+        self.assertEqual(pool.status()["firefox (full load profile)"], {"open": 2, "idle": 1, "leased": 1})
+
+        # the returned session is borrowed again
+        third = pool.acquire("firefox")
+        self.assertEqual(third["session_id"], first["session_id"])
+        self.assertNotEqual(third["lease_id"], first["lease_id"])
+        self.assertEqual(len(self.drivers), 2)
+
+    def test_reset(self):
+        pool = self.create_pool(sessions=1)
+        lease = pool.acquire("firefox")
+        driver = self.driver_of(lease)
+
+        driver.visit("https://site.example/login")
+        driver.execute_script("window.open('about:blank')")
+        driver.switch_to.window(driver.window_handles[-1])
+
+        pool.release(lease["lease_id"], origins=["https://site.example"])
+
+        # the extra window is closed, the session's cookies and storage are cleared, and it is kept
+        self.assertEqual(driver.window_handles, ["fake-window"])
+        self.assertEqual(driver.current_window_handle, "fake-window")
+        self.assertEqual(driver.current_url, "about:blank")
+        self.assertEqual(driver.cookies, {})
+        self.assertEqual(driver.storage, {})
+        self.assertFalse(driver.closed)
+        self.assertEqual(pool.acquire("firefox")["session_id"], lease["session_id"])
+
+    def test_reset_clears_every_origin(self):
+        self.driver_class = ChromiumPoolDriver
+        pool = self.create_pool(sessions=1)
+        lease = pool.acquire("chrome")
+        driver = self.driver_of(lease)
+
+        driver.visit("https://site.example/")
+        driver.visit("https://other.example/")
+
+        # the origins of a window the script closed itself are only known to the script
+        driver.execute_script("window.open('about:blank')")
+        driver.switch_to.window(driver.window_handles[-1])
+        driver.visit("https://closed.example/")
+        driver.close()
+        driver.switch_to.window("fake-window")
+
+        pool.release(lease["lease_id"], origins=["https://closed.example"])
+
+        self.assertEqual(driver.cookies, {})
+        self.assertEqual(driver.storage, {})
+        self.assertFalse(driver.closed)
+
+    def test_session_with_unclearable_origins_is_replaced(self):
+        pool = self.create_pool(sessions=1)
+        lease = pool.acquire("firefox")
+        driver = self.driver_of(lease)
+
+        # without the DevTools Protocol, only the storage of the loaded page can be cleared
+        driver.visit("https://site.example/")
+        driver.visit("https://other.example/")
+
+        with self.assertLogs(level=logging.INFO):
+            pool.release(lease["lease_id"], origins=["https://site.example", "https://other.example"])
+
+        self.assertTrue(driver.closed)
+        self.wait_for_idle(pool, "firefox", 1)
+        self.assertNotEqual(pool.acquire("firefox")["session_id"], lease["session_id"])
+
+    def test_max_uses(self):
+        pool = self.create_pool(sessions=1, max_uses=2)
+
+        first = pool.acquire("firefox")
+        pool.release(first["lease_id"])
+        second = pool.acquire("firefox")
+        self.assertEqual(second["session_id"], first["session_id"])
+
+        # after its last use, the session is closed and replaced in the background
+        with self.assertLogs(level=logging.INFO):
+            pool.release(second["lease_id"])
+        self.assertTrue(self.driver_of(first).closed)
+
+        self.wait_for_idle(pool, "firefox", 1)
+        third = pool.acquire("firefox")
+        self.assertNotEqual(third["session_id"], first["session_id"])
+        self.assertEqual(len(self.drivers), 2)
+
+    def test_lease_expiry(self):
+        pool = self.create_pool(sessions=1, lease_timeout=60)
+        lease = pool.acquire("firefox")
+        driver = self.driver_of(lease)
+
+        # the script never returns the session
+        pool.leased[lease["lease_id"]].leased_at = time.time() - 61
+
+        with self.assertLogs(level=logging.WARNING):
+            replacement = pool.acquire("firefox")
+        self.assertNotEqual(replacement["session_id"], lease["session_id"])
+
+        deadline = time.time() + 5
+        while not driver.closed and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(driver.closed)
+
+        # returning an expired lease does nothing
+        pool.release(lease["lease_id"])
+        self.assertEqual(pool.status()["firefox (full load profile)"]["leased"], 1)
+
+    def test_expired_lease_is_replaced_in_the_background(self):
+        pool = self.create_pool(sessions=1, lease_timeout=60)
+        lease = pool.acquire("firefox")
+        pool.leased[lease["lease_id"]].leased_at = time.time() - 61
+
+        with self.assertLogs(level=logging.WARNING):
+            with pool.condition:
+                pool.reclaim_expired_leases()
+
+        # the pool is full again before the next script asks for a session
+        self.wait_for_idle(pool, "firefox", 1)
+        self.assertEqual(len(self.drivers), 2)
+
+    def test_unresponsive_session_is_replaced(self):
+        pool = self.create_pool(sessions=1)
+        pool.warm("firefox")
+        self.drivers[0].responding = False
+
+        with self.assertLogs(level=logging.WARNING):
+            lease = pool.acquire("firefox")
+
+        # a fresh browser is started in place of the one which stopped responding
+        self.assertTrue(self.drivers[0].closed)
+        self.assertEqual(lease["session_id"], self.drivers[1].session_id)
+
+    def test_fresh_session_for_other_settings(self):
+        pool = self.create_pool(sessions=1)
+        pool.warm("firefox", headless=True)
+
+        # sessions started with other settings are never borrowed
+        eager = load_profiles.LOAD_PROFILES["eager"]
+        lease = pool.acquire("firefox", True, dict(eager._asdict()))
+        self.assertEqual(lease["session_id"], self.drivers[1].session_id)
+        self.create_driver.assert_called_with("firefox", True, eager)
+
+        # another headless mode than the daemon's is a common mistake (ie. runner.py is always headless)
+        with self.assertLogs(level=logging.WARNING) as logs:
+            lease = pool.acquire("firefox", False)
+        self.assertIn("No firefox session is non-headless", logs.output[0])
+        self.assertEqual(lease["session_id"], self.drivers[2].session_id)
+
+    def test_failed_start(self):
+        pool = self.create_pool(sessions=1)
+        self.create_driver.side_effect = selenium_exceptions.WebDriverException("No browser")
+
+        with self.assertLogs(level=logging.ERROR):
+            with self.assertRaises(RuntimeError):
+                pool.acquire("firefox")
+
+        # the failed session does not count against the pool
+        self.assertEqual(pool.counts[("firefox", False, load_profiles.LOAD_PROFILES["full"])], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
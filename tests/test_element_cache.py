@@ -0,0 +1,109 @@
+"""
+Tests that the element cache (see element_cache.py) never returns an element of a page which has been navigated away
+from, including by interactions with the page itself (clicking a link, or pressing Enter in a form)
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from selenium.webdriver.common.keys import Keys
+
+import browser
+import commands
+from context import ExecutionContext
+from fake_driver import FakeDriver, build_page
+
+
+class NavigatingDriver(FakeDriver):
+    def __init__(self):
+        """
+        A fake web driver in which clicking the heading, or pressing Enter in an item, loads a new page
+        (with the same elements)
+        """
+        super().__init__(None)
+        self.pages = []
+        self.load_page()
+
+    def load_page(self):
+        self.document = build_page(2)
+        self.selections.clear()
+        self.pages.append(self.document)
+
+        heading = self.select("#title")[0]
+        heading.click = self.load_page
+
+        for item in self.select("span"):
+            item.send_keys = self.typing_into(item)
+
+    def execute_script(self, script, *args):
+        if script == "arguments[0].click();":
+            args[0].click()
+        return super().execute_script(script, *args)
+
+    def typing_into(self, element):
+        def send_keys(*keys):
+            type(element).send_keys(element, *keys)
+            if Keys.ENTER in "".join(keys):
+                self.load_page()
+        return send_keys
+
+
+class ElementCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.driver = NavigatingDriver()
+
+        self.context = ExecutionContext(os.path.join(self.directory, "main.awt"), element_cache=True)
+        browser.attach_driver(self.context, self.driver)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def value(self, page, selector):
+        return self.driver.pages[page].find_elements_by_css_selector(selector)[0].get_attribute("value")
+
+    def test_cached_element(self):
+        commands.text_input(self.context, "#item0", "a")
+        commands.text_input(self.context, "#item0", "b")
+
+        self.assertEqual(self.driver.find_calls, 1)
+        self.assertEqual(self.value(0, "#item0"), "ab")
+
+    def test_click(self):
+        commands.text_input(self.context, "#item0", "a")
+        commands.click(self.context, "#title")
+
+        # the element is looked up again in the new page
+        commands.text_input(self.context, "#item0", "b")
+        self.assertEqual(len(self.driver.pages), 2)
+        self.assertEqual(self.value(0, "#item0"), "a")
+        self.assertEqual(self.value(1, "#item0"), "b")
+
+    def test_force_click(self):
+        commands.text_input(self.context, "#item0", "a")
+        commands.force_click(self.context, "#title")
+
+        commands.text_input(self.context, "#item0", "b")
+        self.assertEqual(self.value(0, "#item0"), "a")
+        self.assertEqual(self.value(1, "#item0"), "b")
+
+    def test_enter(self):
+        commands.send_keys(self.context, "#item1", "a")
+        commands.send_keys(self.context, "#item1", "b" + Keys.ENTER)
+
+        commands.text_input(self.context, "#item1", "c")
+        self.assertEqual(self.value(0, "#item1"), "ab" + Keys.ENTER)
+        self.assertEqual(self.value(1, "#item1"), "c")
+
+        # other keys do not navigate
+        self.assertEqual(self.driver.find_calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Tests incremental runs (see incremental.py, and 'runner.select_scripts'): a script which passed is only skipped
+while none of its inputs have changed
+"""
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import incremental
+import runner
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state_file = os.path.join(self.directory, "awt_state.json")
+
+        self.script = self.path("tests/login.awt")
+        write_file(self.script, "IMPORT ../lib/common.awh\nREAD data/users.txt users\nLOG ${users}\n")
+        write_file(self.path("lib/common.awh"), "IMPORT helpers.awh\nLOG common\n")
+        write_file(self.path("tests/helpers.awh"), "LOG helpers\n")
+        write_file(self.path("tests/data/users.txt"), "alice\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, *name.split("/"))
+
+    def options(self, **options):
+        defaults = dict(browser="firefox", args=None, load_profile=None, force=False)
+        defaults.update(options)
+        return types.SimpleNamespace(**defaults)
+
+    def run_scripts(self, options=None, exit_code=0):
+        """
+        Selects the scripts which need to be executed, and saves them as executed with an exit code
+        :return: the list of executed scripts
+        """
+        options = self.options() if options is None else options
+        state = incremental.load_state(self.state_file)
+        digests, skipped = runner.select_scripts([self.script], options, state)
+
+        for script, digest in digests.items():
+            state[script] = {"digest": digest, "exit_code": exit_code, "duration": 1, "log_file": ""}
+        incremental.save_state(self.state_file, state)
+
+        self.assertEqual(len(digests) + len(skipped), 1)
+        return list(digests)
+
+    def test_inputs(self):
+        # paths are resolved against the directory of the script, including the paths in imported files
+        self.assertEqual(incremental.DependencyGraph().get_inputs(self.script), sorted([
+            self.script, self.path("lib/common.awh"), self.path("tests/helpers.awh"), self.path("tests/data/users.txt")
+        ]))
+
+    def test_unchanged_script_is_skipped(self):
+        self.assertEqual(self.run_scripts(), [self.script])
+        self.assertEqual(self.run_scripts(), [])
+
+        # unless it is forced
+        self.assertEqual(self.run_scripts(self.options(force=True)), [self.script])
+
+    def test_failed_script_is_executed(self):
+        self.run_scripts(exit_code=2)
+        self.assertEqual(self.run_scripts(), [self.script])
+
+    def test_edited_script(self):
+        self.run_scripts()
+        write_file(self.script, "LOG edited\n")
+        self.assertEqual(self.run_scripts(), [self.script])
+
+    def test_edited_imported_file(self):
+        self.run_scripts()
+        write_file(self.path("lib/common.awh"), "IMPORT helpers.awh\nLOG edited\n")
+        self.assertEqual(self.run_scripts(), [self.script])
+
+        # files imported by imported files are inputs too
+        self.assertEqual(self.run_scripts(), [])
+        write_file(self.path("tests/helpers.awh"), "LOG edited\n")
+        self.assertEqual(self.run_scripts(), [self.script])
+
+    def test_edited_read_file(self):
+        self.run_scripts()
+        write_file(self.path("tests/data/users.txt"), "bob\n")
+        self.assertEqual(self.run_scripts(), [self.script])
+
+    def test_changed_options(self):
+        self.run_scripts()
+        self.assertEqual(self.run_scripts(self.options(browser="chrome")), [self.script])
+        self.assertEqual(self.run_scripts(self.options(browser="chrome", load_profile="eager")), [self.script])
+        self.assertEqual(self.run_scripts(self.options(browser="chrome", load_profile="eager")), [])
+
+    def test_edited_load_profile_file(self):
+        profile = self.path("profiles/fast.json")
+        write_file(profile, '{"base": "eager"}')
+        options = self.options(load_profile=profile)
+
+        self.run_scripts(options)
+        self.assertEqual(self.run_scripts(options), [])
+
+        write_file(profile, '{"base": "dom-only"}')
+        self.assertEqual(self.run_scripts(options), [self.script])
+
+    def test_unresolvable_input_is_always_executed(self):
+        write_file(self.script, "IMPORT ${folder}/common.awh\n")
+        self.run_scripts()
+        self.assertEqual(self.run_scripts(), [self.script])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Tests that the options of a load profile reach the web driver (see load_profiles.py and 'browser.create_driver'),
+using stand-in driver classes which record the options they are started with
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import browser
+import load_profiles
+
+
+class StubDriver:
+    def __init__(self, **arguments):
+        """
+        A web driver which does not start a browser, and keeps the arguments it was created with
+        """
+        self.arguments = arguments
+
+
+class CreateDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.classes = {name: data["class"] for name, data in browser.BROWSERS.items()}
+        for data in browser.BROWSERS.values():
+            data["class"] = StubDriver
+
+    def tearDown(self):
+        for name, driver_class in self.classes.items():
+            browser.BROWSERS[name]["class"] = driver_class
+
+    def test_firefox_dom_only(self):
+        driver = browser.create_driver("firefox", True, load_profiles.LOAD_PROFILES["dom-only"])
+        options = driver.arguments["options"]
+
+        self.assertTrue(options.headless)
+        self.assertEqual(options.to_capabilities()["pageLoadStrategy"], "eager")
+        self.assertEqual(options.preferences["permissions.default.image"], 2)
+        self.assertEqual(options.preferences["gfx.downloadable_fonts.enabled"], False)
+
+    def test_chrome_dom_only(self):
+        driver = browser.create_driver("Chrome", False, load_profiles.LOAD_PROFILES["dom-only"])
+        options = driver.arguments["options"]
+
+        self.assertFalse(options.headless)
+        self.assertEqual(options.to_capabilities()["pageLoadStrategy"], "eager")
+        self.assertEqual(
+            options.experimental_options["prefs"]["profile.managed_default_content_settings.images"], 2
+        )
+
+        # Chrome has no preference to disable fonts, so they are blocked by URL
+        blocked = load_profiles.get_blocked_urls("chrome", load_profiles.LOAD_PROFILES["dom-only"])
+        self.assertIn("*.woff2", blocked)
+
+    def test_full(self):
+        driver = browser.create_driver("firefox", load_profile=load_profiles.LOAD_PROFILES["full"])
+        options = driver.arguments["options"]
+
+        self.assertEqual(options.to_capabilities()["pageLoadStrategy"], "normal")
+        self.assertNotIn("permissions.default.image", options.preferences)
+
+    def test_browser_without_options(self):
+        driver = browser.create_driver("edge")
+        self.assertEqual(driver.arguments, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
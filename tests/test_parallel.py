@@ -0,0 +1,264 @@
+"""
+Tests parallel sections (PARALLEL ... BRANCH ... ENDPARALLEL, see parallel.py) against the fake web driver of the
+benchmarks, which keeps the URL of each of its windows, and over the wire against the stand-in WebDriver server in
+webdriver_server.py
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from selenium import webdriver
+
+import browser
+import parallel
+import webdriver_server
+from context import ExecutionContext
+from fake_driver import FakeDriver, build_page
+
+
+class RecordingDriver(FakeDriver):
+    def __init__(self, document):
+        """
+        A fake web driver which records the window each navigation happened in
+        """
+        super().__init__(document)
+        self.navigations = []   # the (window handle, URL) of each navigation, in order
+
+    def navigate(self, url):
+        self.navigations.append((self.current_window_handle, url))
+        super().navigate(url)
+
+
+class LoadingDriver(RecordingDriver):
+    def __init__(self, document, loads):
+        """
+        A fake web driver whose pages (in windows other than the first) keep loading until a number of pages have
+        started loading. So every one of those pages only loads if they all load at the same time
+        :param loads: the number of pages which must start loading
+        """
+        super().__init__(document)
+        self.loads = loads
+        self.checks = {}    # the bindings between window handles and the number of times their page was checked
+
+    def run_script(self, script, args):
+        if script == parallel.READY_STATE_SCRIPT:
+            handle = self.current_window_handle
+            self.checks[handle] = self.checks.get(handle, 0) + 1
+            if len([h for h, _ in self.navigations if h != "fake-window"]) < self.loads:
+                return "loading"
+        return super().run_script(script, args)
+
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.driver = RecordingDriver(build_page(5))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def execute(self, lines, **options):
+        """
+        Executes a script in the fake driver
+        :param lines: the lines of the script
+        :param options: the options of the ExecutionContext
+        :return: the ExecutionContext of the script, and its exit code (None if it was not terminated)
+        """
+        path = os.path.join(self.directory, "main.awt")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+        context = ExecutionContext(path, **options)
+        browser.attach_driver(context, self.driver)
+
+        try:
+            context.execute()
+        except SystemExit as e:
+            return context, e.code
+        return context, None
+
+    def test_branches(self):
+        context, exit_code = self.execute([
+            "SETVAR shared start",
+            "PARALLEL",
+            "GOTO https://one.example/",
+            "SETVAR one done",
+            "BRANCH",
+            "GOTO https://two.example/a",
+            "GOTO https://two.example/b",
+            "SETVAR two done",
+            "ENDPARALLEL",
+            "SETVAR after ${one}-${two}"
+        ])
+
+        self.assertIsNone(exit_code)
+
+        # each navigation happened in the tab of its own branch
+        tabs = {}
+        for handle, url in self.driver.navigations:
+            tabs.setdefault(url.split("/")[2], set()).add(handle)
+        self.assertEqual(len(tabs["one.example"]), 1)
+        self.assertEqual(len(tabs["two.example"]), 1)
+        self.assertNotEqual(tabs["one.example"], tabs["two.example"])
+        self.assertNotIn("fake-window", tabs["one.example"] | tabs["two.example"])
+
+        # the variables of both branches are copied back into the script
+        self.assertEqual(context.memory_heap["one"], "done")
+        self.assertEqual(context.memory_heap["two"], "done")
+        self.assertEqual(context.memory_heap["after"], "done-done")
+        self.assertEqual(context.memory_heap["shared"], "start")
+
+        # the tabs are closed, and the script continues in its own window
+        self.assertEqual(self.driver.window_handles, ["fake-window"])
+        self.assertEqual(self.driver.current_window_handle, "fake-window")
+
+    def test_page_loads_overlap(self):
+        # neither page loads until both have started loading, so the section only finishes if GOTO waits for its
+        # page without holding the driver
+        self.driver = LoadingDriver(build_page(5), 2)
+        context, exit_code = self.execute([
+            "PARALLEL",
+            "GOTO https://one.example/",
+            "BRANCH",
+            "GOTO https://two.example/",
+            "ENDPARALLEL"
+        ])
+
+        self.assertIsNone(exit_code)
+        self.assertEqual(
+            sorted(url for _, url in self.driver.navigations), ["https://one.example/", "https://two.example/"]
+        )
+
+        # both branches waited for their own page
+        tabs = [handle for handle, _ in self.driver.navigations]
+        self.assertEqual(set(self.driver.checks), set(tabs))
+
+    def test_profiled_branches(self):
+        report = os.path.join(self.directory, "main.profile.txt")
+        context, exit_code = self.execute([
+            "PARALLEL",
+            "GOTO https://one.example/",
+            "BRANCH",
+            "GOTO https://two.example/",
+            "LOG two",
+            "ENDPARALLEL",
+            "LOG after"
+        ], profile=report)
+        self.assertIsNone(exit_code)
+
+        # the lines of both branches are recorded, and called by the PARALLEL line
+        profiler = context.profiler
+        self.assertEqual(
+            sorted((line, name) for _, line, name in profiler.lines),
+            [(1, "PARALLEL"), (2, "GOTO"), (4, "GOTO"), (5, "LOG"), (7, "LOG")]
+        )
+        self.assertEqual(profiler.commands["GOTO"][0], 2)
+
+        branch_stacks = [s for s in profiler.stacks if "BRANCH" in s]
+        self.assertTrue(branch_stacks)
+        for stack in branch_stacks:
+            self.assertTrue(stack.startswith("[MAIN]:1 PARALLEL;"))
+
+        # the driver calls of a branch are its own
+        self.assertTrue(any(s.endswith("GOTO;[driver]") for s in branch_stacks))
+
+    def test_failed_branch(self):
+        with self.assertLogs(level=logging.ERROR) as logs:
+            context, exit_code = self.execute([
+                "PARALLEL",
+                "GOTO https://one.example/",
+                "NOTACOMMAND",
+                "BRANCH",
+                "WAIT 0.2",
+                "GOTO https://two.example/",
+                "SETVAR two done",
+                "ENDPARALLEL",
+                "SETVAR after reached"
+            ])
+
+        self.assertEqual(exit_code, 2)
+        self.assertTrue(any("BranchFailureException" in line for line in logs.output))
+
+        # the other branch still finished, and every tab was closed
+        self.assertEqual(context.memory_heap["two"], "done")
+        self.assertNotIn("after", context.memory_heap)
+        self.assertEqual(self.driver.window_handles, ["fake-window"])
+
+
+class ParallelWebDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.requests = os.path.join(self.directory, "requests.log")
+
+        self.server = webdriver_server.WebDriverServer(("127.0.0.1", 0), self.requests)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.driver = webdriver.Remote(
+            command_executor="http://127.0.0.1:{}".format(self.server.server_address[1]),
+            desired_capabilities={"browserName": "firefox"}
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_branches(self):
+        path = os.path.join(self.directory, "main.awt")
+        with open(path, "w") as f:
+            f.write("\n".join([
+                "PARALLEL",
+                "GOTO http://one.example/?loads=2",
+                "CLICK #title",
+                "BRANCH",
+                "GOTO http://two.example/?loads=2",
+                "CLICK #title",
+                "ENDPARALLEL",
+                "GOTO http://after.example/"
+            ]) + "\n")
+
+        context = ExecutionContext(path)
+        browser.attach_driver(context, self.driver)
+        context.execute()
+        self.driver.quit()
+
+        with open(self.requests) as f:
+            requests = [json.loads(line) for line in f]
+
+        # the driver speaks W3C, so windows are switched to by their handle
+        switches = [r["body"] for r in requests if r["method"] == "POST" and r["path"].endswith("/window")]
+        self.assertTrue(switches)
+        for body in switches:
+            self.assertEqual(list(body), ["handle"])
+
+        # replay the requests to find the window each command was executed in
+        window = "window-0"
+        windows = {}
+        for r in requests:
+            if r["method"] == "POST" and r["path"].endswith("/window"):
+                window = r["body"]["handle"]
+            elif r["path"].endswith("/url") or r["path"].endswith("/click"):
+                windows.setdefault(window, []).append(r["path"].rsplit("/", 1)[1])
+            elif r["path"].endswith("/execute/sync") and r["body"]["script"] == parallel.NAVIGATE_SCRIPT:
+                windows.setdefault(window, []).append(r["body"]["args"][0])
+
+        # the pages of the branches only load if they load at the same time, and each branch clicked in its own tab
+        self.assertEqual(windows, {
+            "window-1": ["http://one.example/?loads=2", "click"],
+            "window-2": ["http://two.example/?loads=2", "click"],
+            "window-0": ["url"]
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
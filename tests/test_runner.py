@@ -0,0 +1,282 @@
+"""
+Tests the parallel runner (runner.py) against a stand-in for awt.py.
+The stand-in reads the script it is given: 'exit N' exits with N, 'sleep S' sleeps for S seconds, and 'spawn FILE'
+starts a process which outlives it (like a web driver), writes its pid to FILE and sleeps.
+So the runner can be tested without a browser.
+The runner is also tested end to end: the real awt.py executes each script in Firefox, whose driver (geckodriver)
+is replaced by the stand-in WebDriver server in webdriver_server.py
+"""
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import runner
+import webdriver_server
+
+# the stand-in for awt.py
+FAKE_AWT = """
+import subprocess
+import sys
+import time
+
+with open(sys.argv[1]) as f:
+    command, value = f.read().split()
+
+print("running", sys.argv[1:])
+if command == "sleep":
+    time.sleep(float(value))
+if command == "spawn":
+    driver = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    with open(value, "w") as f:
+        f.write(str(driver.pid))
+    time.sleep(60)
+sys.exit(int(value) if command == "exit" else 0)
+"""
+
+# the stand-in for geckodriver, which Selenium starts with the port to listen on
+FAKE_GECKODRIVER = """#!/bin/sh
+exec "{}" "{}" "$@"
+""".format(sys.executable, os.path.abspath(webdriver_server.__file__))
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def is_running(pid):
+    """
+    :return: if a process is running (a process which was killed, but not yet reaped, is not running)
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def get_options(log_dir, **options):
+    """
+    :return: the options of the runner (as parsed from the command line), with the given values
+    """
+    defaults = dict(
+        browser="firefox", workers=4, log_dir=log_dir, timeout=None, bytecode_cache=False, daemon=None, args=None,
+        load_profile=None, state=None, force=False
+    )
+    defaults.update(options)
+    return types.SimpleNamespace(**defaults)
+
+
+class RunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_dir = os.path.join(self.directory, "logs")
+
+        self.awt_path = runner.AWT_PATH
+        runner.AWT_PATH = os.path.join(self.directory, "fake_awt.py")
+        write_file(runner.AWT_PATH, FAKE_AWT)
+
+    def tearDown(self):
+        runner.AWT_PATH = self.awt_path
+        shutil.rmtree(self.directory)
+
+    def script(self, name, content="exit 0"):
+        path = os.path.join(self.directory, name)
+        write_file(path, content)
+        return path
+
+    def test_find_scripts_in_directories(self):
+        a = self.script("tests/a.awt")
+        b = self.script("tests/nested/b.awt")
+        self.script("tests/helper.awh")
+
+        self.assertEqual(runner.find_scripts([os.path.join(self.directory, "tests")]), sorted([a, b]))
+
+    def test_find_scripts_with_globs(self):
+        a = self.script("smoke/a.awt")
+        b = self.script("smoke/deep/er/b.awt")
+        self.script("other/c.awt")
+
+        self.assertEqual(runner.find_scripts([os.path.join(self.directory, "smoke", "**", "*.awt")]), sorted([a, b]))
+
+    def test_find_scripts_without_duplicates(self):
+        a = self.script("tests/a.awt")
+        b = self.script("tests/b.awt")
+
+        scripts = runner.find_scripts([
+            os.path.join(self.directory, "tests"), a, os.path.join(self.directory, "tests", "*.awt")
+        ])
+        self.assertEqual(scripts, sorted([a, b]))
+
+    def test_find_scripts_without_matches(self):
+        with self.assertLogs(level=logging.WARNING):
+            self.assertEqual(runner.find_scripts([os.path.join(self.directory, "missing", "*.awt")]), [])
+
+    def test_log_files_do_not_collide(self):
+        scripts = [
+            self.script("a/login.awt"),
+            self.script("b/login.awt"),
+            self.script("a/b_c.awt"),
+            self.script("a_b/c.awt"),
+            self.script("a_b_c.awt")
+        ]
+
+        log_files = [runner.get_log_file(self.log_dir, s) for s in scripts]
+        self.assertEqual(len(set(log_files)), len(scripts))
+        for log_file in log_files:
+            self.assertEqual(os.path.dirname(log_file), self.log_dir)
+
+    def test_run_scripts(self):
+        passed = self.script("passed.awt", "exit 0")
+        failed = self.script("failed.awt", "exit 3")
+
+        results = runner.run_scripts([passed, failed], get_options(self.log_dir))
+
+        self.assertEqual([r.script for r in results], [passed, failed])
+        self.assertEqual([r.exit_code for r in results], [0, 3])
+        for r in results:
+            with open(r.log_file) as f:
+                self.assertIn("running", f.read())
+
+    def test_timeout(self):
+        slow = self.script("slow.awt", "sleep 30")
+
+        result = runner.run_scripts([slow], get_options(self.log_dir, timeout=0.5))[0]
+
+        self.assertEqual(result.exit_code, runner.TIMEOUT_EXIT_CODE)
+        self.assertFalse(result.passed)
+        self.assertLess(result.duration, 30)
+
+    @unittest.skipIf(os.name == "nt", "process groups are killed with taskkill on Windows")
+    def test_timeout_kills_started_processes(self):
+        pid_file = os.path.join(self.directory, "driver.pid")
+        script = self.script("spawn.awt", "spawn " + pid_file)
+
+        result = runner.run_scripts([script], get_options(self.log_dir, timeout=1))[0]
+        self.assertEqual(result.exit_code, runner.TIMEOUT_EXIT_CODE)
+
+        with open(pid_file) as f:
+            pid = int(f.read())
+
+        # the process is killed with the script, but may take a moment to disappear
+        deadline = time.time() + 5
+        while is_running(pid) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(is_running(pid))
+
+    def test_summarize_exit_codes(self):
+        def results(*exit_codes):
+            return [runner.ScriptResult("/{}.awt".format(i), c, 1, "") for i, c in enumerate(exit_codes)]
+
+        with self.assertLogs(level=logging.INFO):
+            self.assertEqual(runner.summarize(results(0, 0), 1), 0)
+            self.assertEqual(runner.summarize(results(0, 2, 1), 1), 2)
+            # a timeout alone still fails the run
+            self.assertEqual(runner.summarize(results(0, runner.TIMEOUT_EXIT_CODE), 1), 1)
+            self.assertEqual(runner.summarize(results(runner.TIMEOUT_EXIT_CODE, 3), 1), 3)
+            # skipped scripts passed last time
+            skipped = runner.ScriptResult("/skipped.awt", 0, 1, "", skipped=True)
+            self.assertEqual(runner.summarize([skipped], 1), 0)
+
+
+@unittest.skipIf(os.name == "nt", "the stand-in for geckodriver is a shell script")
+class RunnerWebDriverTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.scripts = os.path.join(self.directory, "scripts")
+        self.requests = os.path.join(self.directory, "requests.log")
+
+        # the browser's driver is found on the PATH
+        write_file(os.path.join(self.directory, "bin", "geckodriver"), FAKE_GECKODRIVER)
+        os.chmod(os.path.join(self.directory, "bin", "geckodriver"), 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def script(self, name, lines):
+        path = os.path.join(self.scripts, name)
+        write_file(path, "\n".join(lines) + "\n")
+        return path
+
+    def run_runner(self, *args):
+        """
+        Executes runner.py (and, through it, awt.py) in a new process
+        :return: the exit code of the runner
+        """
+        environment = dict(os.environ)
+        environment["PATH"] = os.path.join(self.directory, "bin") + os.pathsep + environment["PATH"]
+        environment[webdriver_server.LOG_ENVIRONMENT_VARIABLE] = self.requests
+
+        process = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "runner.py")] + list(args), env=environment, cwd=self.directory,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=120
+        )
+        return process.returncode
+
+    def test_run_scripts_in_browsers(self):
+        passed = self.script("passed.awt", ["GOTO http://site.example/", "CLICK #title", "LOG clicked"])
+        failed = self.script("failed.awt", ["GOTO http://site.example/", "ERROR SomeException failed"])
+        killed = self.script("killed.awt", ["KILL 3", "LOG unreachable"])
+
+        summary_file = os.path.join(self.directory, "summary.json")
+        exit_code = self.run_runner(
+            self.scripts, "-b", "firefox", "-w", "3", "-t", "60", "-o", "logs", "-j", summary_file
+        )
+
+        # the run fails with the highest exit code of its scripts
+        self.assertEqual(exit_code, 3)
+
+        with open(summary_file) as f:
+            summary = json.load(f)
+        self.assertEqual(summary["browser"], "firefox")
+
+        results = {r["script"]: r for r in summary["results"]}
+        self.assertEqual(set(results), {passed, failed, killed})
+        self.assertEqual(results[passed]["exit_code"], 0)
+        self.assertEqual(results[failed]["exit_code"], 2)
+        self.assertEqual(results[killed]["exit_code"], 3)
+
+        # each script writes to its own log
+        logs = {}
+        for script, result in results.items():
+            self.assertEqual(os.path.dirname(result["log_file"]), os.path.join(self.directory, "logs"))
+            with open(result["log_file"]) as f:
+                logs[script] = f.read()
+
+        self.assertIn("clicked", logs[passed])
+        self.assertIn("with exit code 0", logs[passed])
+        self.assertIn("SomeException - failed", logs[failed])
+        self.assertIn("with exit code 2", logs[failed])
+        self.assertNotIn("unreachable", logs[killed])
+        self.assertIn("with exit code 3", logs[killed])
+
+        # the click reached the browser, and every browser was closed, even those of the failed scripts
+        with open(self.requests) as f:
+            requests = [json.loads(line) for line in f]
+        self.assertTrue(any(r["path"].endswith("/click") for r in requests))
+
+        sessions = [r for r in requests if r["method"] == "POST" and r["path"] == "/session"]
+        closed = [r for r in requests if r["method"] == "DELETE" and r["path"].count("/") == 2]
+        self.assertEqual(len(sessions), 3)
+        self.assertEqual(len(closed), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,319 @@
+"""
+A stand-in for a W3C WebDriver server (ie. geckodriver), which serves the static DOM of the benchmarks' fake driver
+(see benchmarks/fake_driver.py) over HTTP instead of driving a browser.
+It answers the commands AWT sends (sessions, windows, navigation, finding and clicking elements, and the scripts in
+browser.py and pipeline.py), so whole scripts, and the runner, can be tested over the wire without a browser.
+Each request is appended (as a line of JSON) to the file named by the WEBDRIVER_SERVER_LOG environment variable, if set.
+Loading a page with a 'delay' query parameter (ie. ?delay=0.5) takes that many seconds, and a page with a 'loads'
+query parameter (ie. ?loads=2) keeps loading until that many of those pages have started loading
+
+usage: webdriver_server.py [--port PORT]
+"""
+import argparse
+import base64
+import http.server
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import browser
+import parallel
+import pipeline
+from fake_driver import build_page, select
+
+# the key W3C WebDriver wraps element references in
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+
+LOG_ENVIRONMENT_VARIABLE = "WEBDRIVER_SERVER_LOG"
+
+
+class WebDriverError(Exception):
+    def __init__(self, status, error, message):
+        """
+        An error answered to a command (see https://www.w3.org/TR/webdriver/#errors)
+        :param status: the HTTP status code
+        :param error: the W3C error code (ie. 'no such window')
+        :param message: the description of the error
+        """
+        super().__init__(message)
+        self.status = status
+        self.error = error
+
+
+class Session:
+    def __init__(self, session_id):
+        """
+        A single browser session, whose windows all serve the same static DOM
+        """
+        self.session_id = session_id
+        self.document = build_page(5)
+        self.urls = {"window-0": "about:blank"}    # the bindings between window handles and their URLs (in order)
+        self.current_window = "window-0"
+        self.opened_windows = 0
+        self.elements = {}      # the bindings between element ids and FakeElements
+        self.element_ids = {}   # the bindings between the ids of FakeElements (see 'id') and element ids
+        self.loading = {}       # the bindings between window handles and the (time, loads) their page loads until
+        self.started_loads = 0  # the number of pages with a 'loads' query parameter which have started loading
+        self.page_load_timeout = 300
+
+    def navigate(self, url):
+        """
+        Starts loading a page in the current window
+        :return: the (time, number of started loads) the page loads once both are reached
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        if "loads" in query:
+            self.started_loads += 1
+
+        self.urls[self.current_window] = url
+        return time.time() + float(query.get("delay", [0])[0]), int(query.get("loads", [0])[0])
+
+    def is_loaded(self, load):
+        loaded_at, loads = load
+        return time.time() >= loaded_at and self.started_loads >= loads
+
+    def check_window(self):
+        if self.current_window not in self.urls:
+            raise WebDriverError(404, "no such window", "The current window was closed")
+
+    def reference(self, element):
+        """
+        :return: the W3C reference to a FakeElement
+        """
+        if id(element) not in self.element_ids:
+            element_id = str(uuid.uuid4())
+            self.element_ids[id(element)] = element_id
+            self.elements[element_id] = element
+        return {ELEMENT_KEY: self.element_ids[id(element)]}
+
+    def element(self, element_id):
+        if element_id not in self.elements:
+            raise WebDriverError(404, "no such element", "Unknown element '{}'".format(element_id))
+        return self.elements[element_id]
+
+    def find(self, root, body):
+        if body["using"] != "css selector":
+            raise WebDriverError(400, "invalid argument", "Unsupported strategy '{}'".format(body["using"]))
+        return [self.reference(e) for e in select(root, body["value"])]
+
+    def execute_script(self, script, args):
+        """
+        Executes one of the scripts AWT sends
+        :return: the result of the script (elements are returned as references)
+        """
+        if script == browser.INNER_TEXT_SEARCH_SCRIPT:
+            selector, text, index = args
+            matches = [e for e in select(self.document, selector) if e.text.replace(" ", " ").strip() == text]
+            if index is not None:
+                matches = matches[index:index + 1]
+            return [self.reference(e) for e in matches]
+
+        if script == pipeline.get_run_script():
+            results = []
+            for kind, selector, index, attribute in args[0]:
+                elements = select(self.document, selector)
+                if kind == "count":
+                    results.append(len(elements))
+                    continue
+                if index >= len(elements):
+                    break
+                results.append(elements[index].get_attribute(attribute) if kind == "attribute" else None)
+            return results
+
+        if script.startswith("window.open("):
+            self.opened_windows += 1
+            self.urls["window-{}".format(self.opened_windows)] = "about:blank"
+            return None
+
+        # the page load of a parallel branch is only started by the navigation, and checked on later
+        if script == parallel.NAVIGATE_SCRIPT:
+            self.loading[self.current_window] = self.navigate(args[0])
+            return True
+
+        if script == parallel.READY_STATE_SCRIPT:
+            load = self.loading.get(self.current_window)
+            if load is not None and not self.is_loaded(load):
+                return "loading"
+            self.loading.pop(self.current_window, None)
+            return "complete"
+
+        # every other script (ie. highlighting) has no result
+        return None
+
+
+class WebDriverServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, log_file=None):
+        """
+        An HTTP server which answers WebDriver commands
+        :param address: the (host, port) to listen on
+        :param log_file: the path to the file each request is appended to (Default=None - no log)
+        """
+        super().__init__(address, RequestHandler)
+        self.log_file = log_file
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def log(self, method, path, body):
+        if self.log_file is None:
+            return
+        with self.lock:
+            with open(self.log_file, "a") as f:
+                f.write(json.dumps({"method": method, "path": path, "body": body}) + "\n")
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_command("GET")
+
+    def do_POST(self):
+        self.handle_command("POST")
+
+    def do_DELETE(self):
+        self.handle_command("DELETE")
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_command(self, method):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or "{}") if length else {}
+        self.server.log(method, self.path, body)
+
+        try:
+            status, value = 200, self.execute(method, self.path.rstrip("/"), body)
+        except WebDriverError as e:
+            status, value = e.status, {"error": e.error, "message": str(e), "stacktrace": ""}
+
+        data = json.dumps({"value": value}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+        if self.path == "/shutdown":
+            threading.Thread(target=self.server.shutdown).start()
+
+    def execute(self, method, path, body):
+        """
+        Executes a single command
+        :return: the value of the response
+        """
+        if path == "/shutdown":
+            return None
+
+        if method == "POST" and path == "/session":
+            session = Session(uuid.uuid4().hex)
+            self.server.sessions[session.session_id] = session
+            return {"sessionId": session.session_id, "capabilities": {"browserName": "firefox"}}
+
+        match = re.match(r"^/session/([^/]+)(/.*)?$", path)
+        if match is None or match.group(1) not in self.server.sessions:
+            raise WebDriverError(404, "invalid session id", "Unknown session for '{}'".format(path))
+        session = self.server.sessions[match.group(1)]
+        command = match.group(2) or ""
+
+        if method == "DELETE" and command == "":
+            del self.server.sessions[session.session_id]
+            return None
+
+        if command == "/timeouts":
+            session.page_load_timeout = body.get("pageLoad", session.page_load_timeout * 1000) / 1000
+            return None
+
+        if command == "/window/handles":
+            return list(session.urls)
+
+        if command == "/window":
+            if method == "GET":
+                session.check_window()
+                return session.current_window
+            if method == "POST":
+                if body.get("handle") not in session.urls:
+                    raise WebDriverError(404, "no such window", "Unknown window '{}'".format(body.get("handle")))
+                session.current_window = body["handle"]
+                return None
+            session.check_window()
+            del session.urls[session.current_window]
+            return list(session.urls)
+
+        if command == "/url":
+            session.check_window()
+            if method == "GET":
+                return session.urls[session.current_window]
+
+            # a navigation command only returns once the page has loaded
+            load = session.navigate(body["url"])
+            deadline = time.time() + session.page_load_timeout
+            while not session.is_loaded(load):
+                if time.time() > deadline:
+                    raise WebDriverError(500, "timeout", "Timed out loading '{}'".format(body["url"]))
+                time.sleep(0.01)
+            return None
+
+        if command in ["/back", "/forward", "/refresh", "/cookie"]:
+            return [] if method == "GET" else None
+
+        if command == "/elements":
+            return session.find(session.document, body)
+
+        if command == "/element":
+            elements = session.find(session.document, body)
+            if not elements:
+                raise WebDriverError(404, "no such element", "No element matches '{}'".format(body["value"]))
+            return elements[0]
+
+        match = re.match(r"^/element/([^/]+)/(\w+)$", command)
+        if match is not None:
+            element = session.element(match.group(1))
+            action = match.group(2)
+            if action == "elements":
+                return session.find(element, body)
+            if action == "text":
+                return element.text
+            if action == "name":
+                return element.tag_name
+            if action == "clear":
+                element.clear()
+            elif action == "value":
+                element.send_keys(body["text"])
+            return None
+
+        if command in ["/execute/sync", "/execute/async"]:
+            return session.execute_script(body["script"], body["args"])
+
+        if command == "/source":
+            return "<html></html>"
+
+        if command == "/screenshot":
+            return base64.b64encode(b"").decode()
+
+        raise WebDriverError(404, "unknown command", "Unknown command {} {}".format(method, path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='A stand-in for a W3C WebDriver server')
+    parser.add_argument("--port", type=int, default=4444)
+
+    # the rest of the arguments of a real driver (ie. --log) are ignored
+    options, _ = parser.parse_known_args()
+
+    server = WebDriverServer(("127.0.0.1", options.port), os.environ.get(LOG_ENVIRONMENT_VARIABLE))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import logging
+import time
+
+import selenium.common.exceptions as selenium_exceptions
+
+import profiler
+
+"""
+The wait engine used while looking up elements.
+Each lookup has its own backoff (starting at the context's poll interval, doubling up to its poll ceiling), and can
+optionally wait on an in-page MutationObserver so it wakes up as soon as the page changes
+"""
+
+# waits until an element matching the CSS selector arguments[0] is added to (or changed in) the page,
+# or until arguments[1] milliseconds have passed
+MUTATION_WAIT_SCRIPT = """
+var selector = arguments[0];
+var done = arguments[arguments.length - 1];
+var finished = false;
+var observer = null;
+var timer = null;
+
+function finish() {
+    if (finished) {
+        return;
+    }
+    finished = true;
+    if (observer !== null) {
+        observer.disconnect();
+    }
+    clearTimeout(timer);
+    done();
+}
+
+timer = setTimeout(finish, arguments[1]);
+observer = new MutationObserver(function () {
+    if (document.querySelector(selector) !== null) {
+        finish();
+    }
+});
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+"""
+
+
+class WaitMetrics:
+    def __init__(self):
+        """
+        The time spent waiting for elements, per command
+        """
+        self.commands = {}  # the bindings between command names and [lookups, lookups which waited, waits, seconds]
+
+    def record(self, command, waits, seconds):
+        """
+        Records a single element lookup
+        :param command: the name of the command which did the lookup
+        :param waits: the number of times the lookup waited for the element
+        :param seconds: the total time the lookup spent waiting
+        """
+        metrics = self.commands.setdefault(command, [0, 0, 0, 0.0])
+        metrics[0] += 1
+        if waits > 0:
+            metrics[1] += 1
+        metrics[2] += waits
+        metrics[3] += seconds
+
+    @property
+    def total(self):
+        return sum(m[3] for m in self.commands.values())
+
+    def report(self):
+        """
+        Logs the time spent waiting for each command (if any time was spent waiting)
+        """
+        if self.total == 0:
+            return
+
+        logging.info("--------[ {}s spent waiting for elements ]--------".format(round(self.total, 2)))
+        for command, (lookups, waited, waits, seconds) in sorted(
+                self.commands.items(), key=lambda c: c[1][3], reverse=True
+        ):
+            if seconds == 0:
+                continue
+            logging.info("{:>8}s  {:<16} {} of {} lookups waited ({} waits)".format(
+                round(seconds, 2), command, waited, lookups, waits
+            ))
+
+
+def wait_for_change(context, selector, timeout):
+    """
+    Waits before the next attempt of an element lookup
+    :param context: the ExecutionContext to wait in
+    :param selector: the selector which is being looked up (use <selector>%<text> for inner text searches)
+    :param timeout: the maximum time to wait (in seconds)
+    """
+    with profiler.waiting(context):
+        if not context.observe_mutations:
+            time.sleep(timeout)
+            return
+
+        # wake up as soon as a matching element is added to the page, rather than on the next poll tick
+        start = time.time()
+        try:
+            context.driver.execute_async_script(MUTATION_WAIT_SCRIPT, selector.split("%")[0], int(timeout * 1000))
+
+        except selenium_exceptions.NoSuchWindowException:
+            raise
+
+        except selenium_exceptions.WebDriverException:
+            # the observer could not be used (ie. the page navigated away, which unloads it),
+            # so fall back to sleeping for the rest of the timeout
+            time.sleep(max(timeout - (time.time() - start), 0))
@@ -0,0 +1,159 @@
+import atexit
+import codecs
+import gzip
+import logging
+import logging.handlers
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+Background writers, which keep file I/O off of the thread executing the script.
+Log records are handed to a QueueListener (see 'start_logging'), and artifacts (screenshots and extracted HTML)
+are handed to an ArtifactWriter. Both queues are bounded: when the disk falls behind, the execution thread waits
+for space instead of buffering without limit.
+Both are flushed by 'browser.kill', and when the process exits. Artifacts are also flushed before the script reads
+a file (READ, and language blocks), so it can read the files it has written
+"""
+
+# the maximum number of log records waiting to be written
+LOG_QUEUE_SIZE = 10000
+
+# the maximum number of artifacts waiting to be written (each artifact is held in memory until it is written)
+ARTIFACT_QUEUE_SIZE = 8
+
+# the number of characters of a string artifact which are encoded (and compressed) at a time
+# only one chunk is encoded at a time, so a second copy of the whole artifact is never held in memory
+CHUNK_SIZE = 1 << 20
+
+# the queue and listener of the background log writer (see 'start_logging')
+_log_queue = None
+_log_listener = None
+
+
+class BlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler which waits for space in a full queue, rather than dropping the record
+    """
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+def start_logging(handlers):
+    """
+    Starts writing log records on a background thread
+    :param handlers: the handlers to write the records to (with their formatters already set)
+    :return: the handler to add to the root logger
+    """
+    global _log_queue, _log_listener
+
+    _log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _log_listener = logging.handlers.QueueListener(_log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(stop_logging)
+
+    # the message is formatted on the execution thread (so the arguments can not change before they are written),
+    # the handlers add the time and level when they write it
+    handler = BlockingQueueHandler(_log_queue)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return handler
+
+
+def flush_logging():
+    """
+    Waits until every log record which has been queued is written
+    """
+    if _log_queue is not None:
+        _log_queue.join()
+
+
+def stop_logging():
+    """
+    Writes the remaining log records, and stops the background log writer
+    """
+    global _log_listener
+
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def open_zstd(path):
+    return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+
+
+# the bindings between file extensions and the functions which open a compressed file for writing
+# (None if the compression is not available, ie. the optional 'zstandard' package is not installed)
+COMPRESSIONS = {
+    ".gz": lambda path: gzip.open(path, "wb"),
+    ".zst": None if zstandard is None else open_zstd
+}
+
+
+def get_compression(path):
+    """
+    :return: the compression (file extension) of a path, or None if the file should not be compressed
+    """
+    for extension in COMPRESSIONS:
+        if path.lower().endswith(extension):
+            return extension
+    return None
+
+
+class ArtifactWriter:
+    def __init__(self):
+        """
+        Writes files (ie. screenshots) on a background thread. The thread is started by the first write
+        """
+        self.queue = queue.Queue(ARTIFACT_QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.failed = 0
+
+    def write(self, path, data, encoding=None, compression=None):
+        """
+        Queues a file to be written (waiting for space in the queue if the disk has fallen behind)
+        :param path: the path to write the file to
+        :param data: the bytes to write, or the string to encode and write
+        :param encoding: the encoding of a string
+        :param compression: the compression to write the file with (see COMPRESSIONS), or None
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="AWT-ArtifactWriter", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+        self.queue.put((path, data, encoding, compression))
+
+    def run(self):
+        while True:
+            path, data, encoding, compression = self.queue.get()
+            try:
+                with (open(path, "wb") if compression is None else COMPRESSIONS[compression](path)) as f:
+                    if encoding is None:
+                        f.write(data)
+                    else:
+                        encoder = codecs.getincrementalencoder(encoding)()
+                        for start in range(0, len(data), CHUNK_SIZE):
+                            f.write(encoder.encode(data[start:start + CHUNK_SIZE]))
+                        f.write(encoder.encode("", final=True))
+
+            except Exception:
+                # any error must be caught, otherwise the thread ends and 'flush' waits forever
+                self.failed += 1
+                logging.exception("Could not write '{}'".format(path))
+
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """
+        Waits until every queued file is written
+        """
+        if self.thread is not None:
+            self.queue.join()